@@ -10,29 +10,53 @@ Note: This is a minimal conversion. For production use add CORS, auth,
 rate-limiting and proper model resource constraints.
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Depends, Form
-import json
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Depends, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Optional
-from io import BytesIO
+from typing import List, Optional, Tuple
 import uuid
 import time
+import asyncio
+import functools
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
 import os
 import logging
 
-from src.model_loader import load_models, predict_species, predict_bite
-from src.treatment_utils import get_treatment
-from src.chat_utils import append_chat, format_chat
-
-# Chat history storage: conversation_id -> list of messages
-chat_histories: Dict[str, List[List[str]]] = {}
+from src.model_loader import (
+    data_source_paths,
+    load_bite_classifier,
+    load_llm_pool,
+    load_species_classifier,
+    load_species_data,
+    load_treatment_data,
+    predict_bite_batch,
+    predict_species_batch,
+    prediction_model_tag,
+    species_model_path,
+    warmup_image_model,
+    warmup_llm,
+)
+from src.batching import MicroBatcher
+from src.cpu_budget import CpuPlan
+from src.executor import InferenceExecutor, predict_species_batch_in_worker
+from src.image_utils import DecodedImage, UploadTooLarge, decode_image, expand_upload, read_limited
+from src.cache import PredictionCache, ResponseCache, image_dhash
+from src.readiness import ModelStatus
+from src.data_index import ReferenceData, SpeciesIndex, TreatmentIndex
+from src.fast_json import FastJSONResponse
+from src.llm_stream import StreamStats, TokenStream, sse_event
+from src.llm_prefix_cache import PrefixStateCache
+from src.prompt_budget import BuiltPrompt, PromptBuilder
+from src.llm_worker import LLMCancelled, LLMQueueFull, LLMQueueTimeout, LLMUnavailable, LLMWorker
+from src.intents import GENERAL_FIRST_AID, GENERAL_SYMPTOMS, SEEK_CARE, IntentRouter, answer_intent
+from src.generation_policy import GenerationPolicies, GenerationPolicy
+from src.session_store import SessionStore
 
-# Store user's last identified snake species: user_id -> species name
-user_species_context: Dict[str, str] = {}
+# Recent chat exchanges per conversation_id and the last identified species per user_id
+SESSIONS = SessionStore.from_env()
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -58,6 +82,34 @@ app.add_middleware(
 )
 
 
+# Upper bound on images accepted by the bulk prediction endpoints.
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "64"))
+
+# Upload size limits: per image, and for a whole bulk request.
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "10")) * 1024 * 1024)
+MAX_BATCH_UPLOAD_BYTES = int(float(os.getenv("MAX_BATCH_UPLOAD_MB", "100")) * 1024 * 1024)
+# Bound on the images of a bulk request once zip/tar archives are extracted.
+MAX_BATCH_EXPANDED_BYTES = int(float(os.getenv("MAX_BATCH_EXPANDED_MB", "256")) * 1024 * 1024)
+
+
+@app.middleware("http")
+async def limit_upload_size(request, call_next):
+    """Reject oversized uploads from Content-Length before the body is read."""
+    length = request.headers.get("content-length")
+    if request.method == "POST" and length and length.isdigit():
+        limit = MAX_BATCH_UPLOAD_BYTES if request.url.path.endswith("_batch") else MAX_UPLOAD_BYTES
+        if int(length) > limit + 64 * 1024:  # allow for multipart framing
+            return JSONResponse(status_code=413, content={"detail": f"Upload exceeds the {limit} byte limit"})
+    return await call_next(request)
+
+
+async def _read_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    try:
+        return await read_limited(file, max_bytes)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
 def verify_api_key(x_api_key: Optional[str] = Header(None)):
     """If API_KEY env var is set, require callers to pass it in X-API-KEY header.
 
@@ -86,35 +138,244 @@ class ChatResponse(BaseModel):
 # Initialize global variables
 SNAKE_MODEL = None
 BITE_MODEL = None
-SPECIES_DF = None
-TREATMENT_DF = None
+# Species/treatment indexes; replaced as a whole on (re)load, never mutated.
+DATA = ReferenceData()
 LLM = None
 
+# Cores split between image inference, llama.cpp and uvicorn workers; the main
+# thread is pinned before any pool threads exist so they inherit its affinity.
+# torch's thread counts are applied when the models load.
+CPU_PLAN = CpuPlan.from_env()
+CPU_PLAN.pin_main_thread()
+
+# Models and data load concurrently after startup; MODEL_STATUS backs /ready.
+ARTIFACTS = ("species_model", "bite_model", "species_data", "treatment_data", "llm")
+MODEL_STATUS = ModelStatus(ARTIFACTS, optional=("llm",))
+LOAD_POOL = ThreadPoolExecutor(max_workers=len(ARTIFACTS), thread_name_prefix="load")
+LOAD_TASK: Optional[asyncio.Task] = None
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
+
+# Poll the species/treatment files every N seconds and hot-reload them on change (0 = off).
+DATA_RELOAD_INTERVAL = float(os.getenv("DATA_RELOAD_INTERVAL", "0"))
+DATA_RELOAD_LOCK = asyncio.Lock()
+
+# Blocking torch/fastai/llama.cpp calls run here, never on the event loop.
+EXECUTOR = InferenceExecutor.from_env(CPU_PLAN)
+
+# Every generation goes through this queue; it owns the Llama instance once loaded.
+LLM_WORKER = LLMWorker.from_env(EXECUTOR.llm_pool)
+
+# Saved llama.cpp states for the system prompt and recent conversations (None = off).
+LLM_PREFIX_CACHE = PrefixStateCache.from_env()
+
+# Fits chat prompts into the loaded model's context window; replaced when the LLM loads.
+PROMPT_BUILDER = PromptBuilder.for_llm(None)
+
+# Common factual chat questions are answered from the treatment data before the LLM.
+CHAT_FAST_PATH = os.getenv("CHAT_FAST_PATH", "1") == "1"
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.8"))
+INTENT_ROUTER = IntentRouter()
+# max_tokens, stop strings, sampling and time cap per detected intent
+CHAT_POLICIES = GenerationPolicies.from_env()
+
+# Results for previously seen images, keyed by upload content.
+PREDICTION_CACHE = PredictionCache.from_env()
+
+# LLM replies for questions already answered in the same context.
+RESPONSE_CACHE = ResponseCache.from_env()
+
+# Concurrent uploads are grouped into a single forward pass per model.
+SPECIES_BATCHER = MicroBatcher.from_env(
+    lambda files: predict_species_batch(SNAKE_MODEL, files), name="species", executor=EXECUTOR.torch_pool
+)
+BITE_BATCHER = MicroBatcher.from_env(
+    lambda files: predict_bite_batch(BITE_MODEL, files), name="bite", executor=EXECUTOR.torch_pool
+)
+
+async def _load_artifact(name: str, loader, warmup=None, run_warmup=None) -> None:
+    """Load one model or data file in the background and publish it when ready.
+
+    The optional warm-up runs one inference on the serving executor before
+    the artifact is published, so the first real request is not slowed by
+    lazy initialization.
+    """
+    global SNAKE_MODEL, BITE_MODEL, DATA, LLM, SPECIES_BATCHER, PROMPT_BUILDER
+    loop = asyncio.get_running_loop()
+    MODEL_STATUS.loading(name)
+    try:
+        value = await loop.run_in_executor(LOAD_POOL, loader)
+    except Exception as e:
+        logger.error(f"Error loading {name}: {str(e)}", exc_info=True)
+        MODEL_STATUS.failed(name, str(e))
+        return
+    if value is None:
+        MODEL_STATUS.disabled(name, "not configured or unavailable")
+        return
+
+    warmup_ms = None
+    if warmup is not None and MODEL_WARMUP:
+        started = time.perf_counter()
+        try:
+            await run_warmup(warmup, value)
+            warmup_ms = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} failed: {e}")
+
+    if name == "species_model":
+        SNAKE_MODEL = value
+        PREDICTION_CACHE.set_model_tag("species", prediction_model_tag("species"))
+        if EXECUTOR.species_processes:
+            previous = SPECIES_BATCHER
+            SPECIES_BATCHER = MicroBatcher.from_env(
+                predict_species_batch_in_worker,
+                name="species",
+                executor=EXECUTOR.start_species_pool(species_model_path()),
+            )
+            # Requests already queued on the thread-pool batcher are still served by it.
+            await previous.stop(drain=True)
+    elif name == "bite_model":
+        BITE_MODEL = value
+        PREDICTION_CACHE.set_model_tag("bite", prediction_model_tag("bite"))
+    elif name == "species_data":
+        DATA = DATA.with_changes(species=value)
+        logger.info(f"Loaded species data with {len(value)} entries")
+    elif name == "treatment_data":
+        DATA = DATA.with_changes(treatment=value)
+        logger.info(f"Loaded treatment data with {len(value)} entries")
+    elif name == "llm":
+        # value is the list of pooled instances; LLM is the first, for tokenizing and status.
+        LLM = value[0]
+        LLM_WORKER.llm = value
+        PROMPT_BUILDER = PromptBuilder.for_llm(LLM)
+    MODEL_STATUS.ready(name, warmup_ms)
+    logger.info(f"{name} ready ({MODEL_STATUS.snapshot()[name]})")
+
+
+def _load_chat_llm():
+    """LLM instances (LLM_POOL_SIZE within LLM_POOL_MEMORY_MB) plus the primed prefix cache, or None."""
+    budget_mb = os.getenv("LLM_POOL_MEMORY_MB")
+    pool = load_llm_pool(
+        EXECUTOR.llm_instances,
+        memory_budget=int(float(budget_mb) * 1024 * 1024) if budget_mb else None,
+        llm_threads=CPU_PLAN.llm_threads,
+    )
+    if not pool:
+        return None
+    # Cached replies are only valid for the model that generated them.
+    model_path = getattr(pool[0], "model_path", "") or ""
+    size = os.path.getsize(model_path) if os.path.exists(model_path) else 0
+    RESPONSE_CACHE.model_tag = f"{os.path.basename(model_path)}:{size}"
+    if LLM_PREFIX_CACHE is not None:
+        LLM_PREFIX_CACHE.attach(pool, prefixes=[CHAT_PROMPT_PREFIX])
+    return pool
+
+
+def _warmup_llm_pool(pool: list) -> None:
+    for llm in pool:
+        warmup_llm(llm)
+
+
+async def _load_all() -> None:
+    """Load every artifact concurrently; each endpoint serves as soon as its own inputs are in."""
+    loop = asyncio.get_running_loop()
+    # torch's thread settings must be applied before any model touches torch.
+    torch_configured = loop.run_in_executor(LOAD_POOL, CPU_PLAN.configure_torch)
+
+    async def after_torch(name, loader, warmup):
+        await torch_configured
+        await _load_artifact(name, loader, warmup, EXECUTOR.run_torch)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        _load_artifact("species_data", lambda: SpeciesIndex(load_species_data())),
+        _load_artifact("treatment_data", lambda: TreatmentIndex(load_treatment_data())),
+        after_torch(
+            "species_model", load_species_classifier, functools.partial(warmup_image_model, predict_species_batch)
+        ),
+        after_torch("bite_model", load_bite_classifier, functools.partial(warmup_image_model, predict_bite_batch)),
+        _load_artifact("llm", _load_chat_llm, _warmup_llm_pool, EXECUTOR.run_llm),
+    )
+    LOAD_POOL.shutdown(wait=False)
+    logger.info(f"Model loading finished in {time.perf_counter() - started:.1f}s: {MODEL_STATUS.snapshot()}")
+    if DATA_RELOAD_INTERVAL > 0:
+        await _watch_data_sources()
+
+
+def _data_source_stamp() -> tuple:
+    """(path, size, mtime) of the species and treatment files, to detect edits."""
+    stamp = []
+    for path in data_source_paths():
+        try:
+            stat = path.stat() if path is not None else None
+        except OSError:
+            stat = None
+        stamp.append((str(path), stat.st_size, stat.st_mtime_ns) if stat else (str(path), None, None))
+    return tuple(stamp)
+
+
+async def reload_reference_data() -> ReferenceData:
+    """Rebuild the species/treatment indexes off the event loop and swap them in atomically.
+
+    Only the data files are reloaded, never the models. On failure the
+    current version keeps serving and the exception propagates.
+    """
+    global DATA
+    async with DATA_RELOAD_LOCK:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        species, treatment = await asyncio.gather(
+            loop.run_in_executor(None, lambda: SpeciesIndex(load_species_data())),
+            loop.run_in_executor(None, lambda: TreatmentIndex(load_treatment_data())),
+        )
+        DATA = DATA.with_changes(species=species, treatment=treatment)
+        for name in ("species_data", "treatment_data"):
+            if not MODEL_STATUS.is_ready(name):
+                MODEL_STATUS.loading(name)
+                MODEL_STATUS.ready(name)
+        logger.info(f"Reloaded reference data in {time.perf_counter() - started:.2f}s: {DATA.summary()}")
+        return DATA
+
+
+async def _watch_data_sources() -> None:
+    """Reload the reference data whenever the source files change (DATA_RELOAD_INTERVAL > 0)."""
+    last = _data_source_stamp()
+    while True:
+        await asyncio.sleep(DATA_RELOAD_INTERVAL)
+        current = _data_source_stamp()
+        if current == last:
+            continue
+        last = current
+        logger.info("Species/treatment data changed on disk; reloading")
+        try:
+            await reload_reference_data()
+        except Exception as e:
+            logger.error(f"Reference data reload failed; keeping version {DATA.version}: {e}", exc_info=True)
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Load models once when the FastAPI server starts."""
-    global SNAKE_MODEL, BITE_MODEL, SPECIES_DF, TREATMENT_DF, LLM
+    """Start loading models in the background; /ready reports progress per model."""
+    global LOAD_TASK
     skip = os.getenv("SKIP_MODEL_LOADING", "0") == "1"
+    CPU_PLAN.log()
     
     if skip:
         logger.info("SKIP_MODEL_LOADING=1 set; skipping heavy model loading on startup")
+        for name in ARTIFACTS:
+            MODEL_STATUS.disabled(name, "SKIP_MODEL_LOADING=1")
         return
-        
-    try:
-        logger.info("Loading models and data...")
-        SNAKE_MODEL, BITE_MODEL, SPECIES_DF, TREATMENT_DF, LLM = load_models()
-        logger.info("Successfully loaded all models and data")
-        
-        # Verify data loaded correctly
-        if SPECIES_DF is not None:
-            logger.info(f"Loaded species data with {len(SPECIES_DF)} entries")
-        if TREATMENT_DF is not None:
-            logger.info(f"Loaded treatment data with {len(TREATMENT_DF)} entries")
-            
-    except Exception as e:
-        logger.error(f"Error loading models: {str(e)}", exc_info=True)
-        # Don't raise the exception - let the app start even if models fail to load
-        pass
+
+    logger.info("Loading models and data in the background...")
+    LOAD_TASK = asyncio.create_task(_load_all())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if LOAD_TASK is not None:
+        LOAD_TASK.cancel()
+    await SPECIES_BATCHER.stop()
+    await BITE_BATCHER.stop()
+    EXECUTOR.shutdown()
 
 
 @app.get("/health")
@@ -122,25 +383,89 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    """Per-model load state; 200 once every required model and data file is ready, else 503."""
+    is_ready = MODEL_STATUS.all_ready()
+    return JSONResponse(
+        {"ready": is_ready, "models": MODEL_STATUS.snapshot(), "data": DATA.summary()},
+        status_code=200 if is_ready else 503,
+    )
+
+
+def _unavailable(name: str, label: str) -> HTTPException:
+    """503 for an artifact that is not usable, distinguishing "still loading" from "failed"."""
+    if MODEL_STATUS.is_loading(name):
+        return HTTPException(
+            status_code=503, detail=f"{label} is still loading; retry shortly", headers={"Retry-After": "5"}
+        )
+    return HTTPException(
+        status_code=503,
+        detail=f"{label} not loaded. Set SKIP_MODEL_LOADING=0 and ensure model paths are correct.",
+    )
+
+
+
+def _llm_busy(error: Exception) -> HTTPException:
+    """503 for a generation the LLM queue could not take or start in time."""
+    if isinstance(error, LLMUnavailable):
+        return _unavailable("llm", "LLM")
+    return HTTPException(
+        status_code=503,
+        detail=f"The assistant is busy ({error}); retry shortly",
+        headers={"Retry-After": "5"},
+    )
+
+@app.get("/cache_stats")
+def cache_stats():
+    """Hit/miss counters and size of the prediction and response caches, and the session store."""
+    return {
+        "prediction_cache": PREDICTION_CACHE.stats(),
+        "response_cache": RESPONSE_CACHE.stats(),
+        "sessions": SESSIONS.stats(),
+    }
+
+
+@app.post("/admin/reload_data")
+async def admin_reload_data(_=Depends(verify_api_key)):
+    """Reload the species CSV and treatment workbook without restarting or touching the models."""
+    try:
+        data = await reload_reference_data()
+    except Exception as e:
+        logger.error(f"Reference data reload failed: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Reload failed; still serving version {DATA.version}: {e}")
+    return data.summary()
+
+
+@app.get("/cpu_plan")
+def cpu_plan():
+    """How this worker's cores are split between image models and llama.cpp."""
+    return CPU_PLAN.summary()
+
+
 @app.get("/llm_status")
 def llm_status():
     """Debug endpoint to check LLM status"""
     return {
         "llm_loaded": LLM is not None,
+        "llm_state": MODEL_STATUS.state("llm"),
         "llm_type": str(type(LLM)) if LLM else None,
-        "test_prompt": "Testing..." if LLM is None else "LLM available"
+        "test_prompt": "Testing..." if LLM is None else "LLM available",
+        "queue": LLM_WORKER.snapshot(),
+        "prefix_cache": LLM_PREFIX_CACHE.stats() if LLM_PREFIX_CACHE is not None else None,
+        "policies": CHAT_POLICIES.stats(),
     }
 
 
 @app.get("/test_llm")
-def test_llm():
+async def test_llm(request: Request):
     """Simple test endpoint to verify LLM can generate text"""
     try:
         if LLM is None:
             return {"error": "LLM not loaded"}
         
         prompt = "What is a snake bite?"
-        result = LLM(prompt, max_tokens=50)
+        result = await LLM_WORKER.generate(prompt, disconnected=request.is_disconnected, max_tokens=50)
         return {
             "success": True,
             "prompt": prompt,
@@ -151,6 +476,56 @@ def test_llm():
         return {"error": str(e), "type": str(type(e))}
 
 
+def _summarize_species(prediction) -> dict:
+    pred_class, pred_idx, probs = prediction
+    return {
+        "pred_class": int(pred_class),
+        "confidence": float(probs[pred_idx]) if hasattr(probs, "__getitem__") else None,
+    }
+
+
+def _summarize_bite(prediction) -> dict:
+    label, confidence = prediction
+    return {"label": label, "confidence": float(confidence)}
+
+
+def _cache_key(upload: DecodedImage) -> tuple:
+    """Digest (and, if enabled, perceptual hash) identifying an upload in the cache."""
+    phash = image_dhash(upload.decode()) if PREDICTION_CACHE.phash_enabled else None
+    return upload.digest, phash
+
+
+async def _predict_cached(namespace: str, upload: DecodedImage, batcher: MicroBatcher, summarize) -> dict:
+    """Return the cached prediction for this upload, or run the model and cache it.
+
+    The upload is decoded at most once, off the event loop, and the decoded
+    image is what gets batched, so callers can share it between models.
+    """
+    digest = phash = None
+    if PREDICTION_CACHE.enabled:
+        digest, phash = await EXECUTOR.run_torch(_cache_key, upload)
+        cached = await PREDICTION_CACHE.lookup_async(namespace, digest, phash)
+        if cached is not None:
+            return dict(cached)
+    image = await EXECUTOR.run_torch(upload.decode)
+    prediction = summarize(await batcher.submit(image))
+    if digest is not None:
+        PREDICTION_CACHE.store(namespace, digest, prediction, phash)
+    return prediction
+
+
+def _species_metadata(data: ReferenceData, pred_class: int) -> Optional[dict]:
+    """Return the NaN-cleaned species record (with Flutter aliases) for a class id, or None."""
+    return data.species.by_class(pred_class)
+
+
+def _treatment_info(data: ReferenceData, binomial_name: Optional[str]) -> Optional[dict]:
+    """Return the NaN-cleaned treatment record for a species, or None."""
+    if data.treatment is None:
+        return None
+    return data.treatment.get(binomial_name)
+
+
 @app.post("/predict_species")
 async def api_predict_species(
     file: UploadFile = File(...),
@@ -161,72 +536,217 @@ async def api_predict_species(
     Returns binomial name, confidence and metadata.
     Stores species context for subsequent chat queries.
     """
-    contents = await file.read()
-    buf = BytesIO(contents)
+    contents = await _read_upload(file)
     if SNAKE_MODEL is None:
-        raise HTTPException(
-            status_code=503,
-            detail="Species model not loaded. Set SKIP_MODEL_LOADING=0 and ensure model paths are correct."
-        )
+        raise _unavailable("species_model", "Species model")
     try:
-        pred_class, pred_idx, probs = predict_species(SNAKE_MODEL, buf)
+        prediction = await _predict_cached("species", DecodedImage(contents), SPECIES_BATCHER, _summarize_species)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    pred_class = prediction["pred_class"]
 
-    if SPECIES_DF is None:
+    data = DATA
+    if data.species is None:
         logger.error("Species data not loaded")
-        raise HTTPException(status_code=503, detail="Species data not available")
+        raise _unavailable("species_data", "Species data")
         
-    species_row = SPECIES_DF[SPECIES_DF["class_id"] == int(pred_class)]
+    metadata = _species_metadata(data, pred_class)
+    # metadata/treatment_info are embedded as JSON rendered once at load time
     result = {
-        "pred_class": int(pred_class),
-        "confidence": float(probs[pred_idx]) if hasattr(probs, "__getitem__") else None,
-        "metadata": None,
+        "pred_class": pred_class,
+        "confidence": prediction["confidence"],
+        "metadata": data.species.fragment(metadata),
     }
     
-    if not species_row.empty:
-        row = species_row.iloc[0].to_dict()
-        binomial_name = row.get('binomial_name')
-        
-        # Convert poisonous to venomous for compatibility
-        metadata = {k: (v if not pd.isna(v) else None) for k, v in row.items()}
-        if 'poisonous' in metadata:
-            metadata['venomous'] = metadata['poisonous']  # Add venomous field for Flutter app
-        if 'snake_sub_family' in metadata:
-            metadata['subfamily'] = metadata['snake_sub_family']  # Add subfamily alias for Flutter app
-        
-        result["metadata"] = metadata
+    if metadata is not None:
+        binomial_name = metadata.get('binomial_name')
         
         # Store and log species context
         if user_id and binomial_name:
-            user_species_context[user_id] = binomial_name
+            await SESSIONS.set_species_async(user_id, binomial_name)
             logger.info(f"Stored species context for user {user_id}: {binomial_name}")
             
             # Add treatment info to response if available
-            if TREATMENT_DF is not None:
-                treatment = TREATMENT_DF[TREATMENT_DF["scientific_name"] == binomial_name]
-                if not treatment.empty:
-                    result["treatment_info"] = treatment.iloc[0].to_dict()
-                    logger.info(f"Found treatment data for species {binomial_name}")
-                else:
-                    logger.info(f"No treatment data found for species {binomial_name}")
+            treatment_info = _treatment_info(data, binomial_name)
+            if treatment_info is not None:
+                result["treatment_info"] = data.treatment.fragment(treatment_info)
+                logger.info(f"Found treatment data for species {binomial_name}")
+            else:
+                logger.info(f"No treatment data found for species {binomial_name}")
     else:
         logger.warning(f"No species data found for class_id {pred_class}")
         
-    return JSONResponse(result)
+    return FastJSONResponse(result)
 
 
 @app.post("/predict_bite")
 async def api_predict_bite(file: UploadFile = File(...), _=Depends(verify_api_key)):
-    contents = await file.read()
-    buf = BytesIO(contents)
+    contents = await _read_upload(file)
     if BITE_MODEL is None:
-        raise HTTPException(status_code=503, detail="Bite model not loaded. Set SKIP_MODEL_LOADING=0 and ensure model paths are correct.")
+        raise _unavailable("bite_model", "Bite model")
     try:
-        label, confidence = predict_bite(BITE_MODEL, buf)
+        return FastJSONResponse(await _predict_cached("bite", DecodedImage(contents), BITE_BATCHER, _summarize_bite))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    return {"label": label, "confidence": float(confidence)}
+
+
+@app.post("/analyze")
+async def api_analyze(
+    file: UploadFile = File(...),
+    user_id: Optional[str] = Header(None),
+    _=Depends(verify_api_key),
+):
+    """Run the species and bite models on one upload, concurrently.
+
+    The image is decoded once and shared by both models. The response joins
+    the species metadata and treatment row, so clients need a single round
+    trip. A model that is not loaded or fails yields an ``error`` entry in its
+    section instead of failing the whole request.
+    """
+    if SNAKE_MODEL is None and BITE_MODEL is None:
+        loading = "species_model" if MODEL_STATUS.is_loading("species_model") else "bite_model"
+        raise _unavailable(loading, "Image models")
+    upload = DecodedImage(await _read_upload(file))
+    try:
+        await EXECUTOR.run_torch(upload.decode)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+    data = DATA  # one version of the reference data for the whole response
+
+    async def species():
+        if SNAKE_MODEL is None or data.species is None:
+            return {"error": "Species model or data not loaded"}
+        prediction = await _predict_cached("species", upload, SPECIES_BATCHER, _summarize_species)
+        metadata = _species_metadata(data, prediction["pred_class"])
+        return {**prediction, "metadata": data.species.fragment(metadata)}
+
+    async def bite():
+        if BITE_MODEL is None:
+            return {"error": "Bite model not loaded"}
+        return await _predict_cached("bite", upload, BITE_BATCHER, _summarize_bite)
+
+    species_result, bite_result = await asyncio.gather(species(), bite(), return_exceptions=True)
+    if isinstance(species_result, Exception):
+        species_result = {"error": str(species_result)}
+    if isinstance(bite_result, Exception):
+        bite_result = {"error": str(bite_result)}
+
+    metadata = _species_metadata(data, species_result["pred_class"]) if "pred_class" in species_result else None
+    binomial_name = (metadata or {}).get("binomial_name")
+    if user_id and binomial_name:
+        await SESSIONS.set_species_async(user_id, binomial_name)
+        logger.info(f"Stored species context for user {user_id}: {binomial_name}")
+
+    treatment_info = _treatment_info(data, binomial_name)
+    return FastJSONResponse({
+        "species": species_result,
+        "bite": bite_result,
+        "treatment_info": data.treatment.fragment(treatment_info) if treatment_info is not None else None,
+    })
+
+
+async def _read_batch_upload(files: List[UploadFile]) -> List[Tuple[str, bytes]]:
+    """Read all uploaded files, expanding zip/tar archives, in input order."""
+    images = []
+    remaining = MAX_BATCH_UPLOAD_BYTES
+    expanded = MAX_BATCH_EXPANDED_BYTES
+    for f in files:
+        data = await _read_upload(f, remaining)
+        remaining -= len(data)
+        try:
+            found = await EXECUTOR.run_torch(
+                expand_upload,
+                f.filename or "",
+                data,
+                max_member_bytes=MAX_UPLOAD_BYTES,
+                max_images=MAX_BATCH_IMAGES - len(images),
+                max_total_bytes=expanded,
+            )
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        images.extend(found)
+        expanded -= sum(len(image) for _, image in found)
+    if not images:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+    return images
+
+
+def _decode_all(images: List[Tuple[str, bytes]]) -> list:
+    """Decode each image, returning a PIL image or the exception per entry."""
+    decoded = []
+    for _, data in images:
+        try:
+            decoded.append(decode_image(data))
+        except Exception as e:
+            decoded.append(e)
+    return decoded
+
+
+async def _predict_batch(images: List[Tuple[str, bytes]], predict) -> list:
+    """Run predict over the decodable images; failures become error entries."""
+    decoded = await EXECUTOR.run_torch(_decode_all, images)
+    ok = [i for i, img in enumerate(decoded) if not isinstance(img, Exception)]
+    predictions = await predict([decoded[i] for i in ok]) if ok else []
+    results = [
+        {"index": i, "filename": name, "error": str(decoded[i])}
+        for i, (name, _) in enumerate(images)
+    ]
+    for i, prediction in zip(ok, predictions):
+        results[i] = {"index": i, "filename": images[i][0], **prediction}
+    return results
+
+
+@app.post("/predict_species_batch")
+async def api_predict_species_batch(files: List[UploadFile] = File(...), _=Depends(verify_api_key)):
+    """Predict species for many images (or zip/tar archives of images) at once.
+
+    Results are returned in input order; images that cannot be decoded get
+    an ``error`` entry instead of failing the whole request.
+    """
+    if SNAKE_MODEL is None:
+        raise _unavailable("species_model", "Species model")
+    data = DATA
+    if data.species is None:
+        raise _unavailable("species_data", "Species data")
+    images = await _read_batch_upload(files)
+
+    async def predict(decoded):
+        if EXECUTOR.species_pool is not None:
+            preds = await EXECUTOR.run(EXECUTOR.species_pool, predict_species_batch_in_worker, decoded)
+        else:
+            preds = await EXECUTOR.run_torch(predict_species_batch, SNAKE_MODEL, decoded)
+        return [
+            {
+                "pred_class": int(pred_class),
+                "confidence": float(probs[pred_idx]),
+                "metadata": data.species.fragment(_species_metadata(data, pred_class)),
+            }
+            for pred_class, pred_idx, probs in preds
+        ]
+
+    try:
+        results = await _predict_batch(images, predict)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return FastJSONResponse({"count": len(results), "results": results})
+
+
+@app.post("/predict_bite_batch")
+async def api_predict_bite_batch(files: List[UploadFile] = File(...), _=Depends(verify_api_key)):
+    """Classify many bite images (or zip/tar archives of images) at once."""
+    if BITE_MODEL is None:
+        raise _unavailable("bite_model", "Bite model")
+    images = await _read_batch_upload(files)
+
+    async def predict(decoded):
+        preds = await EXECUTOR.run_torch(predict_bite_batch, BITE_MODEL, decoded)
+        return [{"label": label, "confidence": float(confidence)} for label, confidence in preds]
+
+    try:
+        results = await _predict_batch(images, predict)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return FastJSONResponse({"count": len(results), "results": results})
 
 
 def _generate_fallback_response(message: str, species_info: dict = None, treatment_info: dict = None) -> str:
@@ -237,13 +757,13 @@ def _generate_fallback_response(message: str, species_info: dict = None, treatme
     if species_info and treatment_info:
         if any(word in message_lower for word in ['treatment', 'what should', 'what do', 'help', 'first aid']):
             response = f"For {species_info['name']} bite:\n\n"
-            if not pd.isna(treatment_info['first_aid']):
+            if treatment_info['first_aid'] is not None:
                 response += f"**Immediate First Aid:**\n{treatment_info['first_aid']}\n\n"
-            if not pd.isna(treatment_info['medical_care']):
+            if treatment_info['medical_care'] is not None:
                 response += f"**Medical Care:**\n{treatment_info['medical_care']}\n\n"
-            if not pd.isna(treatment_info['antivenom']):
+            if treatment_info['antivenom'] is not None:
                 response += f"**Antivenom:**\n{treatment_info['antivenom']}\n\n"
-            response += "⚠️ **CRITICAL: Seek immediate medical attention. Call emergency services now!**"
+            response += SEEK_CARE
             return response
         
         elif any(word in message_lower for word in ['venomous', 'dangerous', 'poison']):
@@ -257,36 +777,11 @@ def _generate_fallback_response(message: str, species_info: dict = None, treatme
     
     # General snakebite advice
     if any(word in message_lower for word in ['bite', 'bitten', 'emergency', 'help']):
-        return (
-            "**SNAKEBITE EMERGENCY PROTOCOL:**\n\n"
-            "1. **Call Emergency Services Immediately** (911 or local emergency number)\n"
-            "2. **Keep the victim calm and still** - movement speeds venom spread\n"
-            "3. **Remove jewelry/tight clothing** near the bite before swelling\n"
-            "4. **Position the bite below heart level**\n"
-            "5. **Clean the wound gently** with soap and water\n"
-            "6. **Cover with clean, dry dressing**\n\n"
-            "**DO NOT:**\n"
-            "❌ Cut the wound\n"
-            "❌ Apply ice\n"
-            "❌ Apply tourniquet\n"
-            "❌ Try to suck out venom\n\n"
-            "⚠️ **Time is critical! Get to a hospital immediately!**"
-        )
+        return GENERAL_FIRST_AID
     
     # Symptoms query
     if any(word in message_lower for word in ['symptom', 'sign']):
-        return (
-            "**Common Venomous Snakebite Symptoms:**\n\n"
-            "• Pain and swelling at bite site\n"
-            "• Puncture marks (may be faint)\n"
-            "• Redness and bruising\n"
-            "• Difficulty breathing\n"
-            "• Nausea and vomiting\n"
-            "• Blurred vision\n"
-            "• Sweating and salivating\n"
-            "• Numbness or tingling\n\n"
-            "**If you experience any of these symptoms after a snakebite, seek immediate medical attention!**"
-        )
+        return GENERAL_SYMPTOMS
     
     # Default helpful response
     return (
@@ -300,8 +795,192 @@ def _generate_fallback_response(message: str, species_info: dict = None, treatme
     )
 
 
+CHAT_SYSTEM_PROMPT = (
+    "You are an expert snake and snakebite consultant specialized in identification and treatment. "
+    "Key responsibilities:\n"
+    "1. Provide accurate species and treatment information when available\n"
+    "2. Always emphasize seeking immediate medical attention for snakebites\n"
+    "3. If species is unknown but symptoms/region provided, suggest possible species and relevant treatments\n"
+    "4. Base advice on provided context (species data, treatment protocols, regional information)\n"
+    "5. Consider previous conversation history for context continuity\n"
+    "6. Always remind that definitive identification and treatment requires medical professionals\n"
+)
+# Every LLM chat prompt starts with this; its evaluated state is kept by LLM_PREFIX_CACHE.
+CHAT_PROMPT_PREFIX = f"{CHAT_SYSTEM_PROMPT}\n\nContext:\n"
+# Previous exchanges included in the prompt (the store keeps no more than SESSION_HISTORY_TURNS).
+CHAT_HISTORY_TURNS = 3
+# Token budget for treatment excerpts relevant to the question (0 = the whole protocol).
+CHAT_TREATMENT_TOKENS = int(os.getenv("CHAT_TREATMENT_TOKENS", "192"))
+
+
+@dataclass
+class ChatTurn:
+    """Species/treatment context gathered for one chat message."""
+
+    conv_id: str
+    species_name: Optional[str] = None
+    species: Optional[dict] = None
+    treatment: Optional[dict] = None
+    species_info: Optional[dict] = None
+    treatment_info: Optional[dict] = None
+    context: str = ""
+    history: Optional[list] = None  # recent exchanges, once loaded by _load_history
+
+
+def _treatment_context(data: ReferenceData, record: dict, message: str) -> List[Tuple[str, str]]:
+    """(label, text) lines of the treatment protocol that bear on message."""
+    if CHAT_TREATMENT_TOKENS <= 0:
+        fields = (
+            ("First Aid", "immediate_first_aid_core"),
+            ("Medical Care", "initial_hospital_actions"),
+            ("Antivenom", "antivenom_name_or_type"),
+        )
+        return [(label, record[name]) for label, name in fields if record.get(name) is not None]
+    return data.treatment.snippets.select(record, message, CHAT_TREATMENT_TOKENS, PROMPT_BUILDER.tokenizer.count)
+
+
+async def _prepare_chat(req: ChatRequest) -> ChatTurn:
+    """Resolve the conversation and species for req and build the LLM context block."""
+    # Initialize or get conversation history
+    conv_id = req.conversation_id or str(uuid.uuid4())
+
+    # Get species context from various sources
+    species_name = req.species_name
+    if not species_name:
+        species_name = await SESSIONS.species_async(req.user_id)
+        if species_name:
+            logger.debug(f"Retrieved species context for user {req.user_id}: {species_name}")
+        else:
+            logger.debug(f"No species context found for user {req.user_id}")
+
+    # Build comprehensive context
+    turn = ChatTurn(conv_id=conv_id, species_name=species_name)
+    context_parts = []
+    logger.debug("Building context with species_name: %s", species_name)
+    data = DATA
+
+    # Add species and treatment info if available
+    if species_name and data.species is not None:
+        row = data.species.get(species_name)
+        if row is not None:
+            turn.species = row
+            turn.species_info = {
+                'name': species_name,
+                'region': f"{row.get('country', 'Unknown')} ({row.get('continent', 'Unknown')})",
+                'venomous': 'Yes' if row.get('poisonous') == 1 else 'No'
+            }
+            context_parts.append(f"Snake Species Information:")
+            context_parts.append(f"- Species: {species_name}")
+            context_parts.append(f"- Region: {turn.species_info['region']}")
+            context_parts.append(f"- Venomous: {turn.species_info['venomous']}")
+
+            t_row = data.treatment.get(species_name) if data.treatment is not None else None
+            if t_row is not None:
+                turn.treatment = t_row
+                turn.treatment_info = {
+                    'first_aid': t_row.get('immediate_first_aid_core'),
+                    'medical_care': t_row.get('initial_hospital_actions'),
+                    'antivenom': t_row.get('antivenom_name_or_type')
+                }
+                context_parts.append("\nTreatment Protocol:")
+                for label, text in _treatment_context(data, t_row, req.message):
+                    context_parts.append(f"- {label}: {text}")
+
+    # Add symptom/region based context if no species identified
+    elif req.symptoms or req.region:
+        context_parts.append("Case Information (No specific species identified):")
+        if req.symptoms:
+            context_parts.append(f"- Reported Symptoms: {req.symptoms}")
+        if req.region:
+            context_parts.append(f"- Geographic Location: {req.region}")
+
+        # Try to suggest possible species based on region
+        if data.species is not None and req.region:
+            possible_species = data.species.in_region(req.region, limit=3)
+            if possible_species:
+                context_parts.append("\nPossible Species in Region:")
+                for sp in possible_species:
+                    context_parts.append(f"- {sp['binomial_name']} ({sp.get('common_name', 'Unknown common name')})")
+
+    turn.context = "\n".join(context_parts)
+    return turn
+
+
+def _answer_without_llm(turn: ChatTurn, message: str) -> Optional[str]:
+    """Reply from the data when the question does not need the LLM (or there is none)."""
+    # Closed factual questions are answered from the data without the LLM
+    if CHAT_FAST_PATH:
+        match = INTENT_ROUTER.route(message, has_species=turn.species is not None)
+        if match.intent is not None and match.confidence >= INTENT_MIN_CONFIDENCE:
+            response = answer_intent(match.intent, turn.species_name, turn.species, turn.treatment)
+            if response is not None:
+                logger.info("Chat fast path: intent=%s confidence=%.2f", match.intent, match.confidence)
+                return response
+        logger.debug("Chat fast path declined: intent=%s (%s)", match.intent, match.reason or "no answer")
+
+    # If LLM is not available, provide intelligent fallback response
+    if LLM is None:
+        logger.info("[CHAT DEBUG] LLM not available, using fallback response")
+        return _generate_fallback_response(message, turn.species_info, turn.treatment_info)
+    return None
+
+
+async def _load_history(turn: ChatTurn) -> None:
+    """Fetch the conversation's recent exchanges once, before the prompt or cache key needs them."""
+    if turn.history is None:
+        turn.history = (await SESSIONS.history_async(turn.conv_id))[-CHAT_HISTORY_TURNS:]
+
+
+def _recent_history(turn: ChatTurn) -> list:
+    return turn.history or []
+
+
+def _chat_policy(message: str, turn: ChatTurn) -> GenerationPolicy:
+    policy = CHAT_POLICIES.for_intent(INTENT_ROUTER.route(message, has_species=turn.species is not None))
+    logger.debug("Chat generation policy for %s: %s", turn.conv_id, policy.name)
+    return policy
+
+
+def _policy_deadline(policy: GenerationPolicy) -> Optional[float]:
+    """The policy's time cap, never beyond LLM_DEADLINE."""
+    return min(filter(None, (policy.deadline, LLM_WORKER.deadline)), default=None)
+
+
+def _record_generation(
+    policy: GenerationPolicy, generated: int, reply: str, finish_reason: Optional[str], generation_ms: float
+) -> None:
+    kept = PROMPT_BUILDER.tokenizer.count_uncached(reply)
+    CHAT_POLICIES.record(policy, generated, kept, finish_reason, generation_ms)
+    logger.info("Chat policy %s: %d tokens generated, %d kept (%s)", policy.name, generated, kept, finish_reason)
+
+
+def _response_cache_key(turn: ChatTurn, message: str, params: dict) -> Optional[str]:
+    """RESPONSE_CACHE key for everything that goes into this turn's prompt, or None if caching is off."""
+    if not RESPONSE_CACHE.enabled:
+        return None
+    return RESPONSE_CACHE.key("chat", message, turn.context, _recent_history(turn), params)
+
+
+def _cacheable(out: dict) -> bool:
+    """Only complete, non-empty generations are cached."""
+    choice = out["choices"][0]
+    return bool(choice["text"].strip()) and choice["finish_reason"] not in ("deadline", "cancelled")
+
+
+def _chat_prompt(turn: ChatTurn, message: str, params: dict) -> BuiltPrompt:
+    """Full LLM prompt (system prompt, context, recent history, new message) within the context window.
+
+    params["max_tokens"] may be lowered to what still fits; see src.prompt_budget.
+    """
+    built = PROMPT_BUILDER.build(
+        CHAT_PROMPT_PREFIX, turn.context, _recent_history(turn), message, params.get("max_tokens", 1024)
+    )
+    logger.info("Chat prompt tokens for %s: %s", turn.conv_id, built.accounting)
+    return built
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def api_chat(req: ChatRequest, _=Depends(verify_api_key)):
+async def api_chat(req: ChatRequest, request: Request, _=Depends(verify_api_key)):
     """Enhanced chat endpoint with species context, treatment data, and conversation history.
     Only the 'message' field is required. All other fields are optional with defaults.
     """
@@ -309,84 +988,12 @@ async def api_chat(req: ChatRequest, _=Depends(verify_api_key)):
     logger.info(f"[CHAT DEBUG] Starting chat request. LLM is None: {LLM is None}")
     
     try:
-        # Initialize or get conversation history
-        conv_id = req.conversation_id or str(uuid.uuid4())
-        if conv_id not in chat_histories:
-            chat_histories[conv_id] = []
-        
-        # Get species context from various sources
-        species_name = req.species_name
-        if not species_name and req.user_id in user_species_context:
-            species_name = user_species_context[req.user_id]
-            logger.debug(f"Retrieved species context for user {req.user_id}: {species_name}")
-        else:
-            logger.debug(f"No species context found for user {req.user_id}")
-            
-        # Build comprehensive context
-        context_parts = []
-        logger.debug("Building context with species_name: %s", species_name)
-        
-        # Add species and treatment info if available
-        treatment_info = None
-        species_info = None
-        
-        if species_name and SPECIES_DF is not None:
-            species_data = SPECIES_DF[SPECIES_DF["binomial_name"] == species_name]
-            if not species_data.empty:
-                row = species_data.iloc[0]
-                species_info = {
-                    'name': species_name,
-                    'region': f"{row.get('country', 'Unknown')} ({row.get('continent', 'Unknown')})",
-                    'venomous': 'Yes' if row.get('poisonous') == 1 else 'No'
-                }
-                context_parts.append(f"Snake Species Information:")
-                context_parts.append(f"- Species: {species_name}")
-                context_parts.append(f"- Region: {species_info['region']}")
-                context_parts.append(f"- Venomous: {species_info['venomous']}")
-                
-                if TREATMENT_DF is not None:
-                    treatment = TREATMENT_DF[TREATMENT_DF["scientific_name"] == species_name]
-                    if not treatment.empty:
-                        t_row = treatment.iloc[0]
-                        treatment_info = {
-                            'first_aid': t_row.get('immediate_first_aid_core'),
-                            'medical_care': t_row.get('initial_hospital_actions'),
-                            'antivenom': t_row.get('antivenom_name_or_type')
-                        }
-                        context_parts.append("\nTreatment Protocol:")
-                        if not pd.isna(treatment_info['first_aid']):
-                            context_parts.append(f"- First Aid: {treatment_info['first_aid']}")
-                        if not pd.isna(treatment_info['medical_care']):
-                            context_parts.append(f"- Medical Care: {treatment_info['medical_care']}")
-                        if not pd.isna(treatment_info['antivenom']):
-                            context_parts.append(f"- Antivenom: {treatment_info['antivenom']}")
-        
-        # Add symptom/region based context if no species identified
-        elif req.symptoms or req.region:
-            context_parts.append("Case Information (No specific species identified):")
-            if req.symptoms:
-                context_parts.append(f"- Reported Symptoms: {req.symptoms}")
-            if req.region:
-                context_parts.append(f"- Geographic Location: {req.region}")
-                
-            # Try to suggest possible species based on region
-            if SPECIES_DF is not None and req.region:
-                possible_species = SPECIES_DF[
-                    SPECIES_DF["country"].str.contains(req.region, case=False, na=False) |
-                    SPECIES_DF["continent"].str.contains(req.region, case=False, na=False)
-                ]
-                if not possible_species.empty:
-                    context_parts.append("\nPossible Species in Region:")
-                    for _, sp in possible_species.head(3).iterrows():
-                        context_parts.append(f"- {sp['binomial_name']} ({sp.get('common_name', 'Unknown common name')})")
-                        
-        context = "\n".join(context_parts)
-        
-        # If LLM is not available, provide intelligent fallback response
-        if LLM is None:
-            logger.info("[CHAT DEBUG] LLM not available, using fallback response")
-            response = _generate_fallback_response(req.message, species_info, treatment_info)
-            chat_histories[conv_id].append((req.message, response))
+        turn = await _prepare_chat(req)
+        conv_id, species_name = turn.conv_id, turn.species_name
+
+        response = _answer_without_llm(turn, req.message)
+        if response is not None:
+            await SESSIONS.append_async(conv_id, req.message, response)
             return {
                 "response": response,
                 "conversation_id": conv_id,
@@ -394,41 +1001,39 @@ async def api_chat(req: ChatRequest, _=Depends(verify_api_key)):
             }
             
         logger.info("[CHAT DEBUG] LLM is available, continuing...")
-                        
-        context = "\n".join(context_parts)
-        
-        # Create system prompt
-        system_prompt = (
-            "You are an expert snake and snakebite consultant specialized in identification and treatment. "
-            "Key responsibilities:\n"
-            "1. Provide accurate species and treatment information when available\n"
-            "2. Always emphasize seeking immediate medical attention for snakebites\n"
-            "3. If species is unknown but symptoms/region provided, suggest possible species and relevant treatments\n"
-            "4. Base advice on provided context (species data, treatment protocols, regional information)\n"
-            "5. Consider previous conversation history for context continuity\n"
-            "6. Always remind that definitive identification and treatment requires medical professionals\n"
-        )
-        
-        # Build full prompt with context and history
-        prompt = f"{system_prompt}\n\nContext:\n{context}\n\n"
-        
-        # Add recent conversation history
-        if chat_histories[conv_id]:
-            prompt += "Recent Conversation:\n"
-            for msg in chat_histories[conv_id][-3:]:  # Last 3 exchanges
-                prompt += f"User: {msg[0]}\nAssistant: {msg[1]}\n"
-        
-        prompt += f"\nUser: {req.message}\nAssistant:"
+        policy = _chat_policy(req.message, turn)
+        await _load_history(turn)
+        cache_key = _response_cache_key(turn, req.message, policy.params())
+        response = await RESPONSE_CACHE.get_async(cache_key) if cache_key else None
+        if response is not None:
+            logger.info("[CHAT DEBUG] Served LLM response from cache")
+            await SESSIONS.append_async(conv_id, req.message, response)
+            return {
+                "response": response,
+                "conversation_id": conv_id,
+                "species_context": species_name
+            }
+        built = _chat_prompt(turn, req.message, policy.params())
         
-        logger.info(f"[CHAT DEBUG] Calling LLM with prompt length: {len(prompt)}")
+        logger.info(f"[CHAT DEBUG] Calling LLM with prompt length: {len(built.prompt)}")
         # Get response from LLM
-        out = LLM(prompt, max_tokens=1024)
-        logger.info(f"[CHAT DEBUG] LLM returned: {type(out)}")
-        response = out["choices"][0]["text"].strip()
+        out = await LLM_WORKER.generate(
+            built.prompt,
+            disconnected=request.is_disconnected,
+            deadline=_policy_deadline(policy),
+            **policy.params(built.max_tokens),
+        )
+        logger.info(f"[CHAT DEBUG] LLM returned after {out['queue_ms']}ms in queue, {out['generation_ms']}ms generating")
+        response = policy.trim(out["choices"][0]["text"])
+        _record_generation(policy, out["tokens"], response, out["choices"][0]["finish_reason"], out["generation_ms"])
         logger.info(f"[CHAT DEBUG] Extracted response length: {len(response)}")
+        if cache_key and _cacheable(out):
+            RESPONSE_CACHE.set(cache_key, response)
+        if not response and out["choices"][0]["finish_reason"] == "deadline":
+            response = _generate_fallback_response(req.message, turn.species_info, turn.treatment_info)
         
         # Update conversation history
-        chat_histories[conv_id].append([req.message, response])
+        await SESSIONS.append_async(conv_id, req.message, response)
         
         # Return response with conversation tracking
         return {
@@ -437,6 +1042,12 @@ async def api_chat(req: ChatRequest, _=Depends(verify_api_key)):
             "species_context": species_name
         }
         
+    except (LLMQueueFull, LLMQueueTimeout) as e:
+        logger.warning(f"Chat request not served: {e}")
+        raise _llm_busy(e)
+    except LLMCancelled as e:
+        logger.info(f"Chat request abandoned: {e}")
+        raise HTTPException(status_code=499, detail="Client closed request")
     except Exception as e:
         logger.error(f"Error in chat handling: {str(e)}", exc_info=True)
         import traceback
@@ -448,105 +1059,90 @@ async def api_chat(req: ChatRequest, _=Depends(verify_api_key)):
             "debug_traceback": traceback.format_exc()
         }
 
-    q = req.user_input.lower()
-    # simple intent handling
-    if any(k in q for k in ("treatment", "bite", "first aid")):
-        if TREATMENT_DF is None:
-            assistant = "Treatment data not loaded. Enable model/data paths and restart the server."
-        else:
-            assistant = get_treatment(req.species_name, TREATMENT_DF, chat, LLM)
-    elif any(k in q for k in ("where", "found", "region", "habitat")):
-        if SPECIES_DF is None:
-            assistant = "Species metadata not loaded. Enable model/data paths and restart the server."
-        else:
-            meta = SPECIES_DF[SPECIES_DF["binomial_name"] == req.species_name]
-            assistant = (
-                f"🌍 Found in {meta.iloc[0]['country']} ({meta.iloc[0]['continent']})."
-                if not meta.empty
-                else f"Sorry, no habitat info for {req.species_name}."
-            )
-    elif any(k in q for k in ("venom", "poison")):
-        if SPECIES_DF is None:
-            assistant = "Species metadata not loaded. Enable model/data paths and restart the server."
-        else:
-            meta = SPECIES_DF[SPECIES_DF["binomial_name"] == req.species_name]
-            venomous = (
-                "Yes" if (not meta.empty and meta.iloc[0]["poisonous"] == 1) else "No" if not meta.empty else "Unknown"
-            )
-            assistant = f"☠️ Venomous: {venomous}"
-    # Generate response
-    try:
-        if LLM is not None:
-            # Add context about species if provided
-            species_context = ""
-            if req.species_name and SPECIES_DF is not None:
-                meta = SPECIES_DF[SPECIES_DF["binomial_name"] == req.species_name]
-                if not meta.empty:
-                    row = meta.iloc[0]
-                    species_context = f"\nContext: The question is about {req.species_name}, "
-                    species_context += f"a snake species found in {row['country']} ({row['continent']}). "
-                    species_context += "Venomous: Yes." if row['poisonous'] == 1 else "Venomous: No."
-            
-            prompt = (
-                "You are an expert snake and snakebite consultant. Provide accurate, helpful information about snakes, "
-                "their behavior, habitats, and safety precautions. If asked about medical advice, remind users to "
-                "seek professional medical help for any snakebite.\n\n"
-                f"{format_chat([[msg[0], msg[1]] for msg in chat])}"  # Remove timestamps for prompt
-                f"{species_context}\n"
-                f"\nUser question: {req.user_input}\n"
-                "Assistant: "
-            )
-            out = LLM(prompt, max_tokens=512)
-            assistant = out["choices"][0]["text"].strip()
-        else:
-            # Fallback to metadata if species is provided
-            if req.species_name and SPECIES_DF is not None:
-                meta = SPECIES_DF[SPECIES_DF["binomial_name"] == req.species_name]
-                if not meta.empty:
-                    assistant = (
-                        f"I don't have an LLM available, but here's basic info about {req.species_name}: "
-                        f"Found in {meta.iloc[0]['country']} ({meta.iloc[0]['continent']}). "
-                        "The snake is venomous." if meta.iloc[0]['poisonous'] == 1 else "The snake is not venomous."
-                    )
-                else:
-                    assistant = f"No metadata found for the species {req.species_name}."
-            else:
-                assistant = "LLM is not available. Please provide a species name to get specific information."
-        
-        # Save assistant's response with timestamp
-        append_chat(chat, "Assistant", assistant)
-        chat[-1].append(current_time)
-        chat_histories[conv_id] = chat
-        
-        return {
-            "conversation_id": conv_id,
-            "assistant": assistant,
-            "chat_history": [[msg[0], msg[1]] for msg in chat]  # Remove timestamps from response
-        }
-    except Exception as e:
-        logger.error(f"Error generating response: {str(e)}", exc_info=True)
-        if "No GPU detected, using CPU" in str(e):
-            assistant = "I'm currently initializing. Please try again in a few moments."
-        else:
-            assistant = "I apologize, but I encountered an error processing your request. Please try again."
-        append_chat(chat, "Assistant", assistant)
-        chat[-1].append(current_time)
-        chat_histories[conv_id] = chat
-        return JSONResponse(
-            status_code=500,
-            content={
-                "conversation_id": conv_id,
-                "assistant": assistant,
-                "chat_history": [[msg[0], msg[1]] for msg in chat]
-            }
-        )
 
-    append_chat(chat, "Assistant", assistant)
-    return {"assistant": assistant, "chat_history": chat}
+@app.post("/chat/stream")
+async def api_chat_stream(req: ChatRequest, request: Request, _=Depends(verify_api_key)):
+    """Streaming /chat: the reply is sent as server-sent events while it is generated.
+
+    Events: ``meta`` (conversation_id, species_context, source), one unnamed
+    event per text chunk ({"text": ...}), then ``done`` with tokens, ttft_ms
+    and tokens_per_sec, or ``error``. Generation stops when the client
+    disconnects.
+    """
+    turn = await _prepare_chat(req)
+    response = _answer_without_llm(turn, req.message)
+    source = "llm" if response is None else ("fallback" if LLM is None else "fast_path")
+    policy = _chat_policy(req.message, turn)
+    if response is None:
+        await _load_history(turn)
+    cache_key = _response_cache_key(turn, req.message, policy.params()) if response is None else None
+    if cache_key:
+        response = await RESPONSE_CACHE.get_async(cache_key)
+        source = "cache" if response is not None else source
+    stats = StreamStats()
+    built = None
+    if response is None:
+        try:
+            LLM_WORKER.check()
+        except (LLMQueueFull, LLMUnavailable) as e:
+            raise _llm_busy(e)
+        built = _chat_prompt(turn, req.message, policy.params())
+
+    async def events():
+        meta = {"conversation_id": turn.conv_id, "species_context": turn.species_name, "source": source}
+        if built is None:
+            yield sse_event(meta, "meta")
+            stats.token()
+            stats.finish()
+            await SESSIONS.append_async(turn.conv_id, req.message, response)
+            yield sse_event({"text": response})
+            yield sse_event(stats.summary(), "done")
+            return
+
+        chunks = None
+        parts = []
+        try:
+            # Submitted once the response has started, so a client that leaves before the
+            # first chunk still reaches the aclose() below and the generation is cancelled.
+            try:
+                chunks = TokenStream(
+                    LLM_WORKER, built.prompt, stats, deadline=_policy_deadline(policy), **policy.params(built.max_tokens)
+                )
+            except (LLMQueueFull, LLMUnavailable) as e:
+                yield sse_event(meta, "meta")
+                yield sse_event({"detail": _llm_busy(e).detail}, "error")
+                return
+            meta["queue_position"] = chunks.position
+            yield sse_event(meta, "meta")
+            async for text in chunks:
+                if await request.is_disconnected():
+                    logger.info("Chat stream client disconnected after %d tokens", stats.tokens)
+                    return
+                parts.append(text)
+                yield sse_event({"text": text})
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}", exc_info=True)
+            yield sse_event({"detail": "I apologize, but I encountered an error. Please try again in a moment."}, "error")
+            return
+        finally:
+            if chunks is not None:
+                await chunks.aclose()
+                logger.info("Chat stream %s: %s", turn.conv_id, stats.summary())
+        reply = policy.trim("".join(parts))
+        _record_generation(policy, stats.tokens, reply, stats.finish_reason, stats.summary()["total_ms"])
+        await SESSIONS.append_async(turn.conv_id, req.message, reply)
+        if cache_key and reply and stats.finish_reason not in ("deadline", "cancelled"):
+            RESPONSE_CACHE.set(cache_key, reply)
+        yield sse_event(stats.summary(), "done")
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.post("/chat_form", response_model=ChatResponse)
 async def api_chat_form(
+    request: Request,
     message: str = Form(...),
     _=Depends(verify_api_key),
 ):
@@ -555,7 +1151,9 @@ async def api_chat_form(
     """
     try:
         req = ChatRequest(message=message)
-        return await api_chat(req, True)
+        return await api_chat(req, request, True)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in chat_form endpoint: {str(e)}", exc_info=True)
         return JSONResponse(
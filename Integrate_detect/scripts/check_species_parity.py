@@ -0,0 +1,55 @@
+"""Check that the lean species pipeline matches fastai's Learner.predict.
+
+Usage:
+    python scripts/check_species_parity.py C:\path\to\images [--atol 1e-5]
+
+Loads the species model (SNAKE_MODEL_PATH or the default path), runs every
+image in the folder through both Learner.predict and SpeciesPipeline, and
+reports any image whose predicted class differs or whose probabilities
+differ by more than --atol. Exits with status 1 on any mismatch.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import torch
+from src.model_loader import SpeciesPipeline, load_learner, species_model_path
+from src.image_utils import IMAGE_EXTENSIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image_dir")
+    parser.add_argument("--atol", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    learner = load_learner(species_model_path())
+    pipeline = SpeciesPipeline(learner)
+    paths = sorted(
+        os.path.join(args.image_dir, name)
+        for name in os.listdir(args.image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        print("No images found in", args.image_dir)
+        return 1
+
+    mismatches = 0
+    worst = 0.0
+    for path in paths:
+        with learner.no_bar():
+            expected_class, expected_idx, expected_probs = learner.predict(path)
+        pred_class, pred_idx, probs = pipeline.predict_batch([path])[0]
+        diff = (torch.as_tensor(probs).cpu() - torch.as_tensor(expected_probs).cpu()).abs().max().item()
+        worst = max(worst, diff)
+        if int(expected_idx) != int(pred_idx) or int(expected_class) != pred_class or diff > args.atol:
+            mismatches += 1
+            print(f"MISMATCH {path}: predict={expected_class}/{int(expected_idx)} lean={pred_class}/{int(pred_idx)} max|dp|={diff:.2e}")
+
+    print(f"{len(paths)} images, {mismatches} mismatches, max probability difference {worst:.2e}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
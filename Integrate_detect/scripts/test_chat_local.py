@@ -2,6 +2,7 @@ import os, json, sys
 # Ensure project root is on sys.path so local imports work when running this script
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from src.model_loader import load_models
+from src.data_index import ReferenceData, SpeciesIndex, TreatmentIndex
 import app
 
 # Ensure models are loaded (uses defaults from model_loader if env vars not set)
@@ -10,8 +11,7 @@ SNAKE_MODEL, BITE_MODEL, SPECIES_DF, TREATMENT_DF, LLM = load_models()
 # Inject into app module globals so handlers use them
 app.SNAKE_MODEL = SNAKE_MODEL
 app.BITE_MODEL = BITE_MODEL
-app.SPECIES_DF = SPECIES_DF
-app.TREATMENT_DF = TREATMENT_DF
+app.DATA = ReferenceData(SpeciesIndex(SPECIES_DF), TreatmentIndex(TREATMENT_DF))
 app.LLM = LLM
 
 # Build a chat request (species can be overridden via SPECIES_NAME env var)
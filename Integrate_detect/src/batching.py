@@ -0,0 +1,158 @@
+"""Dynamic micro-batching for image inference.
+
+Concurrent uploads are collected for a short window (or until a maximum
+batch size is reached), run through the model as a single batch and each
+caller receives its own result. This trades a few milliseconds of latency
+for much higher throughput when many requests arrive at once.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+BatchFn = Callable[[Sequence[Any]], List[Any]]
+
+
+class MicroBatcher:
+    """Collect concurrent requests and run them through one batched call.
+
+    Args:
+        predict_batch: blocking function taking a list of inputs and
+            returning a list of results in the same order (and of the same
+            length; a mismatch fails the batch).
+        max_batch_size: flush as soon as this many requests are queued.
+        max_wait_ms: flush after this many milliseconds even if the batch
+            is not full.
+        name: label used in log messages.
+        executor: where the blocking batch function runs; the loop's
+            default executor when None. Use a process pool only with a
+            picklable, module-level ``predict_batch``.
+    """
+
+    def __init__(
+        self,
+        predict_batch: BatchFn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        name: str = "batch",
+        executor: Optional[Executor] = None,
+    ):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, predict_batch: BatchFn, name: str, executor: Optional[Executor] = None) -> "MicroBatcher":
+        """Build a batcher configured by BATCH_MAX_SIZE / BATCH_WINDOW_MS."""
+        return cls(
+            predict_batch,
+            max_batch_size=int(os.getenv("BATCH_MAX_SIZE", "8")),
+            max_wait_ms=float(os.getenv("BATCH_WINDOW_MS", "10")),
+            name=name,
+            executor=executor,
+        )
+
+    def start(self) -> None:
+        """Start the background collector on the running event loop."""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, drain: bool = False) -> None:
+        """Stop the collector; queued requests are served first with drain, failed otherwise."""
+        if self._task is None:
+            return
+        if drain and not self._task.done():
+            await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name}: batcher stopped"))
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one input and wait for its individual result."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        try:
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(RuntimeError(f"{self.name}: batcher stopped"))
+            raise
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._run_batch([(item, fut) for item, fut in batch if not fut.cancelled()])
+            finally:
+                # Stopped mid-batch: nobody would ever resolve these.
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(RuntimeError(f"{self.name}: batcher stopped"))
+                    self._queue.task_done()
+
+    async def _run_batch(self, batch: list) -> None:
+        if not batch:
+            return
+        items = [item for item, _ in batch]
+        logger.debug("%s: running batch of %d", self.name, len(items))
+        try:
+            results = await self._execute(items)
+        except Exception as e:
+            if len(items) == 1:
+                results = [e]
+            else:
+                # One bad upload should not fail everyone else in the
+                # batch; fall back to running the items one by one.
+                logger.warning("%s: batch of %d failed (%s); retrying individually", self.name, len(items), e)
+                results = []
+                for item in items:
+                    try:
+                        results.append((await self._execute([item]))[0])
+                    except Exception as item_exc:
+                        results.append(item_exc)
+        for (_, fut), result in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    async def _execute(self, items: list) -> list:
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.executor, self.predict_batch, items)
+        # A short result list would leave some callers waiting forever.
+        if len(results) != len(items):
+            raise RuntimeError(f"{self.name}: batch function returned {len(results)} results for {len(items)} inputs")
+        return results
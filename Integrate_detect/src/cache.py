@@ -0,0 +1,407 @@
+"""In-memory LRU + TTL caches with an optional SQLite disk tier.
+
+LRUTTLCache is a generic, thread-safe key/value cache for JSON-serializable
+values, bounded by entry count and approximate memory. PredictionCache sits
+in front of the image models: it keys results by a hash of the uploaded
+bytes and can optionally match re-encoded or resized copies of a photo by
+perceptual hash. ResponseCache sits in front of the LLM and keys replies by
+the normalized question and the context it was asked in.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class LRUTTLCache:
+    """Thread-safe LRU cache with per-entry TTL and a memory bound.
+
+    Args:
+        max_entries: maximum number of in-memory entries; 0 disables the cache.
+        max_bytes: approximate upper bound on the size of cached values
+            (measured as their JSON encoding).
+        ttl: seconds an entry stays valid; 0 or None means no expiry.
+        disk_path: optional SQLite file used as a second tier that survives
+            restarts. Memory misses fall through to it and hits are promoted.
+            Writes go to it from a background thread, so ``set`` never
+            waits for the disk; async callers use ``get_async``, which
+            reads it on another thread.
+        disk_max_entries: rows kept in the disk tier before the oldest are pruned.
+        disk_prune_every: disk writes between two prunes of the disk tier.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl: Optional[float] = 3600.0,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 100_000,
+        disk_prune_every: int = 256,
+    ):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl = float(ttl) if ttl else None
+        self.disk_max_entries = disk_max_entries
+        self.disk_prune_every = max(1, int(disk_prune_every))
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, expires)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
+        self._db = None  # reads, under _db_lock
+        self._db_lock = threading.Lock()
+        self._reader: Optional[ThreadPoolExecutor] = None  # runs get_async disk reads
+        self._writer_db = None  # writes, only used on the _writer thread
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._disk_writes = 0
+        if disk_path and self.enabled:
+            self._open_disk(disk_path)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _open_disk(self, disk_path: str) -> None:
+        Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+        self._writer_db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+        self._writer_db.execute("PRAGMA journal_mode=WAL")
+        self._writer_db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+        )
+        self._writer_db.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+        self._prune_disk()
+        # WAL lets lookups read while the writer thread writes.
+        self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-disk")
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-disk-read")
+        logger.info("Opened disk cache tier at %s", disk_path)
+
+    def _write_disk(self, sql: str, params: tuple = ()) -> None:
+        """Run a write on the writer thread; the caller does not wait."""
+        if self._writer is not None:
+            self._writer.submit(self._apply_disk_write, sql, params)
+
+    def _apply_disk_write(self, sql: str, params: tuple) -> None:
+        try:
+            self._writer_db.execute(sql, params)
+            self._disk_writes += 1
+            if self._disk_writes % self.disk_prune_every == 0:
+                self._prune_disk()
+        except Exception as e:
+            logger.warning(f"Disk cache write failed: {e}")
+
+    def flush(self) -> None:
+        """Wait until queued disk writes are done."""
+        if self._writer is not None:
+            self._writer.submit(lambda: None).result()
+
+    def _expiry(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl else None
+
+    def get(self, key: str) -> Any:
+        """Return the cached value for key, or None on a miss (a disk-tier read blocks the caller)."""
+        if not self.enabled:
+            return None
+        found, value = self._get_memory(key)
+        return value if found else self._get_disk(key)
+
+    async def get_async(self, key: str) -> Any:
+        """get for event-loop callers: a disk-tier read runs on the reader thread."""
+        if not self.enabled:
+            return None
+        found, value = self._get_memory(key)
+        if found:
+            return value
+        if self._reader is None:
+            return self._get_disk(key)  # no disk tier; just counts the miss
+        return await asyncio.get_running_loop().run_in_executor(self._reader, self._get_disk, key)
+
+    def _get_memory(self, key: str) -> tuple:
+        """(True, value) on a live in-memory entry, else (False, None); misses are counted by _get_disk."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, _, expires = entry
+                if expires is None or expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                self._remove(key)
+        return False, None
+
+    def _get_disk(self, key: str) -> Any:
+        """Look key up in the disk tier and promote a hit; the SQLite read does not hold _lock."""
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        value = None
+        if row is not None and (row[1] is None or row[1] > time.time()):
+            value = json.loads(row[0])
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self._store(key, value, len(row[0]), row[1])
+            self.hits += 1
+            self.disk_hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        encoded = json.dumps(value, default=str)
+        expires = self._expiry()
+        with self._lock:
+            self._store(key, value, len(encoded), expires)
+        self._write_disk("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)", (key, encoded, expires))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+        self._write_disk("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+        self._write_disk("DELETE FROM cache")
+
+    def _store(self, key: str, value: Any, size: int, expires: Optional[float]) -> None:
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (value, size, expires)
+        self._bytes += size
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _prune_disk(self) -> None:
+        """Drop the oldest rows beyond disk_max_entries (writer thread, every disk_prune_every writes)."""
+        count = self._writer_db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.disk_max_entries:
+            self._writer_db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY rowid LIMIT ?)",
+                (count - self.disk_max_entries,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+            }
+        if self._db is not None:
+            with self._db_lock:
+                stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return stats
+
+
+def image_dhash(image, hash_size: int = 8) -> int:
+    """64-bit difference hash of a PIL image; robust to re-encoding and resizing."""
+    from PIL import Image
+
+    img = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(img.getdata())
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+class PredictionCache(LRUTTLCache):
+    """Cache of model predictions keyed by uploaded image content.
+
+    Exact matches use a digest of the raw upload bytes. When phash_distance
+    is set, a miss falls back to the closest cached perceptual hash within
+    that Hamming distance, so a forwarded or recompressed copy of the same
+    photo reuses the earlier result. The perceptual index covers in-memory
+    entries only.
+
+    Keys also carry the model tag set for their namespace (see
+    ``set_model_tag``), so after a model file or MODEL_BACKEND change the
+    persistent disk tier never serves predictions made by the old model.
+    """
+
+    def __init__(self, *args, phash_distance: Optional[int] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.phash_distance = phash_distance
+        self.near_hits = 0
+        self.model_tags: Dict[str, str] = {}  # namespace ("species", "bite") -> model tag
+        self._phashes: Dict[str, Dict[str, int]] = {}  # scoped namespace -> {cache key: phash}
+
+    @classmethod
+    def from_env(cls) -> "PredictionCache":
+        """Configure from PREDICTION_CACHE_* environment variables."""
+        cache_dir = os.getenv("PREDICTION_CACHE_DIR")
+        phash = os.getenv("PREDICTION_CACHE_PHASH", "0") == "1"
+        return cls(
+            max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "2048")),
+            max_bytes=int(float(os.getenv("PREDICTION_CACHE_MB", "16")) * 1024 * 1024),
+            ttl=float(os.getenv("PREDICTION_CACHE_TTL", "86400")),
+            disk_path=str(Path(cache_dir) / "predictions.sqlite") if cache_dir else None,
+            phash_distance=int(os.getenv("PREDICTION_CACHE_PHASH_DISTANCE", "4")) if phash else None,
+        )
+
+    @property
+    def phash_enabled(self) -> bool:
+        return self.enabled and self.phash_distance is not None
+
+    def set_model_tag(self, namespace: str, tag: str) -> None:
+        """Identify the model now serving namespace; entries from other models stop matching."""
+        self.model_tags[namespace] = tag
+
+    def _scope(self, namespace: str) -> str:
+        tag = self.model_tags.get(namespace)
+        return f"{namespace}@{hashlib.blake2b(tag.encode('utf-8'), digest_size=8).hexdigest()}" if tag else namespace
+
+    def lookup(self, namespace: str, digest: str, phash: Optional[int] = None) -> Any:
+        """Return the cached value for an upload digest, or the nearest phash match."""
+        namespace = self._scope(namespace)
+        value = self.get(f"{namespace}:{digest}")
+        if value is None and phash is not None and self.phash_enabled:
+            nearest = self._nearest(namespace, phash)
+            if nearest is not None:
+                value = self._near_hit(self.get(nearest))
+        return value
+
+    async def lookup_async(self, namespace: str, digest: str, phash: Optional[int] = None) -> Any:
+        """lookup for event-loop callers; disk-tier reads run on the reader thread."""
+        namespace = self._scope(namespace)
+        value = await self.get_async(f"{namespace}:{digest}")
+        if value is None and phash is not None and self.phash_enabled:
+            nearest = self._nearest(namespace, phash)
+            if nearest is not None:
+                value = self._near_hit(await self.get_async(nearest))
+        return value
+
+    def _nearest(self, namespace: str, phash: int) -> Optional[str]:
+        """Cache key of the closest perceptual hash within phash_distance, or None."""
+        with self._lock:
+            candidates = list(self._phashes.get(namespace, {}).items())
+        best_key, best_distance = None, self.phash_distance + 1
+        for cache_key, candidate in candidates:
+            distance = bin(candidate ^ phash).count("1")
+            if distance < best_distance:
+                best_key, best_distance = cache_key, distance
+        return best_key
+
+    def _near_hit(self, value: Any) -> Any:
+        if value is not None:
+            with self._lock:
+                self.misses -= 1  # the exact lookup already counted a miss
+                self.near_hits += 1
+        return value
+
+    def store(self, namespace: str, digest: str, value: Any, phash: Optional[int] = None) -> None:
+        namespace = self._scope(namespace)
+        cache_key = f"{namespace}:{digest}"
+        self.set(cache_key, value)
+        if phash is not None and self.phash_enabled:
+            with self._lock:
+                if cache_key in self._data:
+                    self._phashes.setdefault(namespace, {})[cache_key] = phash
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self._phashes.clear()
+
+    def _remove(self, key: str) -> None:
+        super()._remove(key)
+        namespace = key.split(":", 1)[0]
+        self._phashes.get(namespace, {}).pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["near_duplicate_hits"] = self.near_hits
+        stats["phash_distance"] = self.phash_distance
+        stats["model_tags"] = dict(self.model_tags)
+        return stats
+
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_message(text: str) -> str:
+    """Casefold and drop punctuation so "What should I do?!" and "what should i do" match."""
+    return " ".join(_NON_WORD.sub(" ", text.casefold()).split())
+
+
+class ResponseCache(LRUTTLCache):
+    """Cache of LLM replies keyed by everything that shapes the prompt.
+
+    The key hashes the normalized message together with the exact context
+    block (species and treatment fields), the conversation history included
+    in the prompt, the generation parameters and the model. Editing the
+    treatment data changes the context and therefore the key, so replies
+    generated from old data are never served, including from the disk tier
+    after a restart; they age out through LRU/TTL.
+    """
+
+    def __init__(self, *args, model_tag: str = "", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.model_tag = model_tag
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """Configure from RESPONSE_CACHE_* environment variables."""
+        cache_dir = os.getenv("RESPONSE_CACHE_DIR")
+        return cls(
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+            max_bytes=int(float(os.getenv("RESPONSE_CACHE_MB", "16")) * 1024 * 1024),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+            disk_path=str(Path(cache_dir) / "responses.sqlite") if cache_dir else None,
+        )
+
+    def key(
+        self,
+        kind: str,
+        message: str,
+        context: str = "",
+        history: Sequence[Sequence[str]] = (),
+        params: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Cache key for a generation of the given kind ("chat", "treatment", ...)."""
+        material = json.dumps(
+            [
+                self.model_tag,
+                context,
+                [[normalize_message(user), reply] for user, reply in history],
+                normalize_message(message),
+                params or {},
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        return f"{kind}:{hashlib.blake2b(material.encode('utf-8'), digest_size=16).hexdigest()}"
@@ -0,0 +1,201 @@
+"""Split the machine's CPU cores between image inference, llama.cpp and uvicorn workers.
+
+Without a plan every uvicorn worker starts torch with one intra-op thread
+per core and llama.cpp with up to six, so a chat generation and a batch of
+image predictions fight over the same cores. CpuPlan divides the cores
+available to the process between workers first, then inside each worker
+between a reserve for the event loop, the llama.cpp threads and the image
+models. With CPU_PIN_AFFINITY=1 the pools are also pinned to disjoint
+core sets (Linux only).
+"""
+
+import logging
+import os
+import tempfile
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Held open for the life of the process so no other worker claims our slot.
+_SLOT_LOCK = None
+
+
+def available_cpus() -> List[int]:
+    """CPU ids this process may run on (respects taskset/cgroup affinity)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name, "").strip()
+    return int(value) if value else None
+
+
+def _claim_worker_slot(workers: int) -> Optional[int]:
+    """Claim a unique slot in [0, workers) among sibling uvicorn workers via file locks."""
+    global _SLOT_LOCK
+    if workers <= 1:
+        return 0
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    lock_dir = os.getenv("CPU_SLOT_DIR", tempfile.gettempdir())
+    for slot in range(workers):
+        handle = open(os.path.join(lock_dir, f"snake-detect-cpu-slot-{slot}.lock"), "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _SLOT_LOCK = handle
+        return slot
+    return None
+
+
+@dataclass
+class CpuPlan:
+    """How one server process uses its share of the machine's cores.
+
+    Attributes:
+        total_cores: cores available to the whole server (all workers).
+        workers: uvicorn worker processes sharing those cores.
+        worker_cores: cores budgeted to this worker.
+        reserved_cores: cores left for the event loop and request handling.
+        llm_threads: llama.cpp generation/prompt threads (0 disables the LLM budget).
+        image_cores: cores for torch/fastai/ONNX image inference.
+        inference_threads: size of the image thread pool.
+        torch_threads: torch intra-op threads per pool thread, so that
+            inference_threads * torch_threads <= image_cores.
+        pin: whether pools are pinned to the core sets below.
+        worker_slot: this worker's index when pinning, if one was claimed.
+        image_cpus / llm_cpus: CPU ids the pools are pinned to (empty when not pinning).
+    """
+
+    total_cores: int
+    workers: int
+    worker_cores: int
+    reserved_cores: int
+    llm_threads: int
+    image_cores: int
+    inference_threads: int
+    torch_threads: int
+    pin: bool = False
+    worker_slot: Optional[int] = None
+    worker_cpus: List[int] = field(default_factory=list)
+    image_cpus: List[int] = field(default_factory=list)
+    llm_cpus: List[int] = field(default_factory=list)
+
+    @classmethod
+    def from_env(cls) -> "CpuPlan":
+        """Build the plan from CPU_CORES, WEB_CONCURRENCY, CPU_RESERVED, LLM_THREADS,
+        LLM_CPU_SHARE, INFERENCE_THREADS and CPU_PIN_AFFINITY.
+
+        Unset values are derived: all available cores, one worker, one core
+        reserved per worker once it has at least four, and half of the
+        remaining cores for llama.cpp.
+        """
+        cpus = available_cpus()
+        total = min(_env_int("CPU_CORES") or len(cpus), len(cpus))
+        workers = max(1, _env_int("WEB_CONCURRENCY") or 1)
+        worker_cores = max(1, total // workers)
+
+        reserved = _env_int("CPU_RESERVED")
+        if reserved is None:
+            reserved = 1 if worker_cores >= 4 else 0
+        reserved = min(max(0, reserved), worker_cores - 1)
+        compute = worker_cores - reserved
+
+        llm_threads = _env_int("LLM_THREADS")
+        if llm_threads is None:
+            share = float(os.getenv("LLM_CPU_SHARE", "0.5"))
+            llm_threads = max(1, round(compute * share)) if compute > 1 else 1
+        llm_threads = max(0, llm_threads)
+        # With a single core both sides have to share it.
+        image_cores = max(1, compute - llm_threads)
+
+        inference_threads = max(1, _env_int("INFERENCE_THREADS") or 2)
+        torch_threads = max(1, image_cores // inference_threads)
+
+        plan = cls(
+            total_cores=total,
+            workers=workers,
+            worker_cores=worker_cores,
+            reserved_cores=reserved,
+            llm_threads=llm_threads,
+            image_cores=image_cores,
+            inference_threads=inference_threads,
+            torch_threads=torch_threads,
+        )
+        if os.getenv("CPU_PIN_AFFINITY", "0") == "1":
+            plan._assign_cpus(cpus[:total])
+        return plan
+
+    def _assign_cpus(self, cpus: List[int]) -> None:
+        if not hasattr(os, "sched_setaffinity"):
+            logger.warning("CPU_PIN_AFFINITY=1 but this platform has no sched_setaffinity; not pinning")
+            return
+        slot = _claim_worker_slot(self.workers)
+        if slot is None:
+            logger.warning("Could not claim a CPU slot among %d workers; not pinning", self.workers)
+            return
+        worker_cpus = cpus[slot * self.worker_cores:(slot + 1) * self.worker_cores] or cpus
+        compute = worker_cpus[self.reserved_cores:] or worker_cpus
+        self.pin = True
+        self.worker_slot = slot
+        self.worker_cpus = worker_cpus
+        self.llm_cpus = compute[:self.llm_threads] or compute
+        self.image_cpus = compute[self.llm_threads:self.llm_threads + self.image_cores] or compute
+
+    def apply(self) -> None:
+        """Pin the calling (main) thread and configure torch for this plan."""
+        self.pin_main_thread()
+        self.configure_torch()
+
+    def pin_main_thread(self) -> None:
+        """Restrict the calling thread to this worker's cores.
+
+        Call before any thread pools are created; new threads inherit the
+        affinity of the thread that starts them.
+        """
+        if self.pin:
+            os.sched_setaffinity(0, self.worker_cpus)
+
+    def configure_torch(self) -> None:
+        """Set torch's thread counts; imports torch, so call it where that cost is acceptable."""
+        import torch
+
+        torch.set_num_threads(self.torch_threads)
+        try:
+            # Parallel work already happens across the pool threads.
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+
+    def summary(self) -> Dict:
+        return asdict(self)
+
+    def log(self) -> None:
+        logger.info(
+            "CPU plan: %d core(s) across %d worker(s); this worker: %d core(s) = %d reserved + %d llama.cpp"
+            " + %d image (%d pool thread(s) x %d torch thread(s))%s",
+            self.total_cores, self.workers, self.worker_cores, self.reserved_cores, self.llm_threads,
+            self.image_cores, self.inference_threads, self.torch_threads,
+            f"; pinned slot {self.worker_slot}: image={self.image_cpus} llm={self.llm_cpus}" if self.pin else "",
+        )
+
+
+def pin_current_thread(cpus: Optional[List[int]]) -> None:
+    """Thread-pool initializer: restrict the calling thread (Linux) to cpus."""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+
+def init_process_threads(torch_threads: int, cpus: Optional[List[int]] = None) -> None:
+    """Apply the thread budget inside a freshly started worker process."""
+    import torch
+
+    torch.set_num_threads(max(1, torch_threads))
+    pin_current_thread(cpus)
@@ -0,0 +1,155 @@
+"""Read-only lookup indexes over the species CSV and treatment workbook.
+
+The DataFrames are turned into plain, NaN-cleaned record dicts once at load
+time and indexed by class id and by exact and case-folded scientific name,
+so request handlers do dict lookups instead of boolean-mask scans. Records
+are shared between requests and must not be mutated. Each record is also
+JSON-encoded once (see src.fast_json.prerender) so responses embed the
+bytes instead of re-serializing the record.
+
+ReferenceData bundles the two indexes into one immutable version. Reloads
+build a new one and swap it in with a single assignment; a request keeps
+the version it started with.
+"""
+
+import time
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from src.fast_json import prerender
+from src.region_index import RegionIndex
+from src.snippet_index import SnippetIndex
+
+
+def _clean(value):
+    """None for any missing scalar (NaN, NaT, pd.NA, None), as pd.isna sees it."""
+    import pandas as pd  # already loaded by whoever built the DataFrame
+
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    return value
+
+
+def _int_or_none(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def records_from_frame(df) -> List[dict]:
+    """DataFrame rows as dicts of native Python values with NaN replaced by None."""
+    return [{k: _clean(v) for k, v in row.items()} for row in df.to_dict("records")]
+
+
+def fold(name: Optional[str]) -> str:
+    """Normalize a scientific name for case- and whitespace-insensitive lookups."""
+    return " ".join(str(name).split()).casefold() if name else ""
+
+
+def _prerender_all(records: Iterable[dict]) -> Mapping:
+    """id(record) -> prerendered JSON for that record."""
+    return MappingProxyType({id(record): prerender(record) for record in records})
+
+
+def _first_by(records: Iterable[dict], key) -> Mapping:
+    """Map key(record) -> record, keeping the first row for duplicate keys (like .iloc[0])."""
+    index: Dict = {}
+    for record in records:
+        k = key(record)
+        if k is not None and k != "" and k not in index:
+            index[k] = record
+    return MappingProxyType(index)
+
+
+class SpeciesIndex:
+    """Species metadata by class id and binomial name.
+
+    Each record is the CSV row plus the ``venomous`` and ``subfamily`` aliases
+    the Flutter app reads, i.e. exactly the ``metadata`` object returned by the
+    prediction endpoints. ``regions`` maps place names to species (see
+    src.region_index).
+    """
+
+    def __init__(self, df):
+        records = []
+        for record in records_from_frame(df):
+            # Convert poisonous to venomous for compatibility
+            if "poisonous" in record:
+                record["venomous"] = record["poisonous"]  # Add venomous field for Flutter app
+            if "snake_sub_family" in record:
+                record["subfamily"] = record["snake_sub_family"]  # Add subfamily alias for Flutter app
+            records.append(record)
+        self.records = tuple(records)
+        self.by_class_id = _first_by(records, lambda r: _int_or_none(r.get("class_id")))
+        self.by_name = _first_by(records, lambda r: r.get("binomial_name"))
+        self.by_folded_name = _first_by(records, lambda r: fold(r.get("binomial_name")))
+        self.regions = RegionIndex(self.records)
+        self._fragments = _prerender_all(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def by_class(self, class_id) -> Optional[dict]:
+        return self.by_class_id.get(_int_or_none(class_id))
+
+    def fragment(self, record: Optional[dict]):
+        """Prerendered JSON for a record returned by this index (None for None)."""
+        return self._fragments[id(record)] if record is not None else None
+
+    def get(self, binomial_name: Optional[str]) -> Optional[dict]:
+        """Record for a binomial name; exact match first, then case-insensitive."""
+        if not binomial_name:
+            return None
+        return self.by_name.get(binomial_name) or self.by_folded_name.get(fold(binomial_name))
+
+    def in_region(self, region: str, limit: Optional[int] = None) -> List[dict]:
+        """Species found in the places a free-text region names (typos tolerated), venomous first."""
+        return self.regions.lookup(region, limit)
+
+
+class TreatmentIndex:
+    """Treatment rows by scientific name (exact and case-insensitive), with a snippet index of their text."""
+
+    def __init__(self, df):
+        self.records = tuple(records_from_frame(df))
+        self.by_name = _first_by(self.records, lambda r: r.get("scientific_name"))
+        self.by_folded_name = _first_by(self.records, lambda r: fold(r.get("scientific_name")))
+        self._fragments = _prerender_all(self.records)
+        self.snippets = SnippetIndex(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, scientific_name: Optional[str]) -> Optional[dict]:
+        """Record for a species; exact match first, then case-insensitive."""
+        if not scientific_name:
+            return None
+        return self.by_name.get(scientific_name) or self.by_folded_name.get(fold(scientific_name))
+
+    def fragment(self, record: Optional[dict]):
+        """Prerendered JSON for a record returned by this index (None for None)."""
+        return self._fragments[id(record)] if record is not None else None
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """One consistent version of the species and treatment indexes."""
+
+    species: Optional[SpeciesIndex] = None
+    treatment: Optional[TreatmentIndex] = None
+    version: int = 0
+    loaded_at: float = field(default_factory=time.time)
+
+    def with_changes(self, **changes) -> "ReferenceData":
+        """A new version with some indexes replaced."""
+        return replace(self, version=self.version + 1, loaded_at=time.time(), **changes)
+
+    def summary(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "species_entries": len(self.species) if self.species is not None else None,
+            "treatment_entries": len(self.treatment) if self.treatment is not None else None,
+        }
@@ -0,0 +1,209 @@
+"""Binary snapshots of the species CSV and treatment workbook.
+
+Parsing the treatment workbook with openpyxl is the slowest part of loading
+the data files. The first load writes each parsed DataFrame to an
+uncompressed Arrow IPC file; later starts memory-map that file instead of
+parsing the source again.
+
+A snapshot records the source's size, mtime and SHA-256, taken before the
+source was parsed. Every load, including hot reloads, compares that stamp
+with the source before reading any data: it is used when size and mtime
+match, or when they differ but the content hash still matches (e.g. after
+a copy that reset mtimes), in which case the stamp is refreshed so the
+next load does not hash the file again. Otherwise the source is parsed
+again and the snapshot rewritten. pyarrow is optional; without it, or
+with DATA_SNAPSHOTS=0, the sources are always parsed.
+
+Prebuild the snapshots (e.g. in the Docker image) with:
+
+    python -m src.data_snapshot [--species-csv PATH] [--treatment-xlsx PATH] [--force]
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = "archive/.snapshots"
+_META_KEY = b"snake_detect_source"
+
+
+def snapshots_enabled() -> bool:
+    return os.getenv("DATA_SNAPSHOTS", "1") != "0"
+
+
+def snapshot_dir() -> Path:
+    """DATA_SNAPSHOT_DIR, resolved against the project root when relative."""
+    path = Path(os.getenv("DATA_SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR))
+    if not path.is_absolute():
+        path = Path(__file__).parent.parent.absolute() / path
+    return path
+
+
+def snapshot_path(source: Path, directory: Optional[Path] = None) -> Path:
+    """Snapshot file for a source; the name includes a hash of its absolute path."""
+    source = Path(source).resolve()
+    tag = hashlib.blake2b(str(source).encode(), digest_size=6).hexdigest()
+    return Path(directory or snapshot_dir()) / f"{source.stem}-{tag}.arrow"
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_stamp(source: Path, sha256: Optional[str] = None) -> dict:
+    stat = source.stat()
+    return {
+        "path": str(source.resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256 or _file_sha256(source),
+    }
+
+
+def _read_snapshot(path: Path, source: Path):
+    """Memory-map a snapshot and return (DataFrame, stamp still current), or (None, False) if missing or stale."""
+    import json
+
+    import pyarrow as pa
+
+    if not path.exists():
+        return None, False
+    with pa.memory_map(str(path), "r") as source_map:
+        reader = pa.ipc.open_file(source_map)
+        # The stamp is in the schema; no record batch is read for a stale snapshot.
+        stamp = json.loads((reader.schema.metadata or {}).get(_META_KEY, b"{}"))
+        stat = source.stat()
+        current = stamp.get("size") == stat.st_size and stamp.get("mtime_ns") == stat.st_mtime_ns
+        if not current and stamp.get("sha256") != _file_sha256(source):
+            logger.info("Snapshot %s is stale for %s; reparsing", path.name, source)
+            return None, False
+        table = reader.read_all()
+    # One block per column and buffers released as they are converted: no consolidation copy.
+    return table.to_pandas(split_blocks=True, self_destruct=True), current
+
+
+def write_snapshot(df, source: Path, path: Path, stamp: Optional[dict] = None) -> None:
+    """Write df as an uncompressed Arrow IPC file, atomically, stamped with its source.
+
+    stamp should be taken (with _source_stamp) before the source was parsed,
+    so an edit made while parsing leaves the snapshot stale rather than
+    stamped as current.
+    """
+    import json
+
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_META_KEY] = json.dumps(stamp or _source_stamp(source)).encode()
+    table = table.replace_schema_metadata(metadata)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def load_with_snapshot(source: Path, parse: Callable, directory: Optional[Path] = None, force: bool = False):
+    """Return the DataFrame for source, from its snapshot when valid, else by parse(source).
+
+    A freshly parsed frame is written back as the new snapshot. Snapshot
+    problems (pyarrow missing, unwritable directory, columns Arrow cannot
+    represent) are logged and never fail the load.
+    """
+    source = Path(source)
+    if not snapshots_enabled():
+        return parse(source)
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return parse(source)
+
+    path = snapshot_path(source, directory)
+    if not force:
+        try:
+            df, current = _read_snapshot(path, source)
+            if df is not None:
+                logger.info("Loaded %s from snapshot %s", source.name, path)
+                if not current:
+                    _write_quietly(df, source, path, _source_stamp(source), "Refreshed the source stamp of %s in %s")
+                return df
+        except Exception as e:
+            logger.warning("Could not read snapshot %s: %s", path, e)
+
+    stamp = _source_stamp(source)
+    df = parse(source)
+    _write_quietly(df, source, path, stamp, "Wrote snapshot of %s to %s")
+    return df
+
+
+def _write_quietly(df, source: Path, path: Path, stamp: dict, message: str) -> None:
+    try:
+        write_snapshot(df, source, path, stamp)
+        logger.info(message, source.name, path)
+    except Exception as e:
+        logger.warning("Could not write snapshot of %s to %s: %s", source.name, path, e)
+
+
+def main(argv=None) -> int:
+    """Prebuild the data snapshots for the configured (or given) source files."""
+    from src.model_loader import (
+        DEFAULT_SPECIES_CSV,
+        DEFAULT_TREATMENT_XLSX,
+        _resolve_path,
+        read_species_csv,
+        read_treatment_xlsx,
+    )
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species-csv", help="species CSV (default: SPECIES_CSV or archive/species.csv)")
+    parser.add_argument("--treatment-xlsx", help="treatment workbook (default: TREATMENT_XLSX or the archive copy)")
+    parser.add_argument("--output-dir", help="snapshot directory (default: DATA_SNAPSHOT_DIR or archive/.snapshots)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the snapshots are current")
+    parser.add_argument("--skip-missing", action="store_true", help="exit 0 when a source file does not exist")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.species_csv:
+        os.environ["SPECIES_CSV"] = args.species_csv
+    if args.treatment_xlsx:
+        os.environ["TREATMENT_XLSX"] = args.treatment_xlsx
+    directory = Path(args.output_dir) if args.output_dir else None
+
+    status = 0
+    for env_var, default, parse in (
+        ("SPECIES_CSV", DEFAULT_SPECIES_CSV, read_species_csv),
+        ("TREATMENT_XLSX", DEFAULT_TREATMENT_XLSX, read_treatment_xlsx),
+    ):
+        source = _resolve_path(env_var, default, required=False)
+        if source is None:
+            if not args.skip_missing:
+                status = 1
+            continue
+        df = load_with_snapshot(source, parse, directory, force=args.force)
+        path = snapshot_path(source, directory)
+        if not path.exists():
+            status = 1
+            continue
+        print(f"{source} -> {path} ({len(df)} rows)")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
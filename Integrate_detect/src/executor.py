@@ -0,0 +1,124 @@
+"""Dedicated executors that keep blocking model code off the event loop.
+
+torch releases the GIL during forward passes, so image inference runs on
+a small thread pool. The fastai species model can optionally run in a
+process pool instead; each worker process loads its own copy of the
+learner once via an initializer. llama.cpp gets one thread per Llama
+instance (LLM_POOL_SIZE, default 1); requests reach them through
+src.llm_worker.LLMWorker's queue, which never runs two generations on the
+same instance.
+
+Pool sizes, torch thread counts and optional core pinning come from a
+src.cpu_budget.CpuPlan.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from src.cpu_budget import CpuPlan, init_process_threads, pin_current_thread
+
+logger = logging.getLogger(__name__)
+
+# Learner loaded inside a process-pool worker (see _init_species_worker).
+_WORKER_SNAKE_MODEL = None
+
+
+def _init_species_worker(model_path: str, torch_threads: int = 1, cpus: Optional[List[int]] = None) -> None:
+    """Process-pool initializer: load the fastai learner once per worker."""
+    global _WORKER_SNAKE_MODEL
+    init_process_threads(torch_threads, cpus)
+    # Import through model_loader so its pathlib compatibility patch applies.
+    from src.model_loader import load_species_model
+
+    _WORKER_SNAKE_MODEL = load_species_model(model_path)
+
+
+def predict_species_batch_in_worker(uploaded_files) -> list:
+    """Run predict_species_batch against the worker's own learner."""
+    from src.model_loader import predict_species_batch
+
+    return predict_species_batch(_WORKER_SNAKE_MODEL, uploaded_files)
+
+
+class InferenceExecutor:
+    """Thread/process pools used to run torch, fastai and llama.cpp calls.
+
+    Args:
+        torch_threads: size of the thread pool used for image inference.
+        species_processes: if > 0, the fastai species model can be moved to
+            a process pool of this many workers with start_species_pool().
+        plan: CPU budget; its image/llm core sets pin the pool threads and
+            its image cores are split between species worker processes.
+        llm_instances: maximum number of Llama instances generating at once.
+    """
+
+    def __init__(
+        self,
+        torch_threads: int = 2,
+        species_processes: int = 0,
+        plan: Optional[CpuPlan] = None,
+        llm_instances: int = 1,
+    ):
+        self.plan = plan
+        image_cpus = plan.image_cpus if plan else None
+        llm_cpus = plan.llm_cpus if plan else None
+        self.torch_pool = ThreadPoolExecutor(
+            max_workers=max(1, torch_threads),
+            thread_name_prefix="torch",
+            initializer=pin_current_thread,
+            initargs=(image_cpus,),
+        )
+        # llama.cpp starts its own threads from here, so they inherit the pinning.
+        self.llm_pool = ThreadPoolExecutor(
+            max_workers=max(1, llm_instances),
+            thread_name_prefix="llm",
+            initializer=pin_current_thread,
+            initargs=(llm_cpus,),
+        )
+        self.llm_instances = max(1, llm_instances)
+        self.species_processes = max(0, species_processes)
+        self.species_pool: Optional[Executor] = None
+
+    @classmethod
+    def from_env(cls, plan: Optional[CpuPlan] = None) -> "InferenceExecutor":
+        """Build an executor from INFERENCE_THREADS / FASTAI_PROCESS_POOL / FASTAI_PROCESSES / LLM_POOL_SIZE."""
+        use_processes = os.getenv("FASTAI_PROCESS_POOL", "0") == "1"
+        return cls(
+            torch_threads=plan.inference_threads if plan else int(os.getenv("INFERENCE_THREADS", "2")),
+            species_processes=int(os.getenv("FASTAI_PROCESSES", "1")) if use_processes else 0,
+            plan=plan,
+            llm_instances=int(os.getenv("LLM_POOL_SIZE", "1")),
+        )
+
+    def start_species_pool(self, model_path) -> Executor:
+        """Spawn the fastai worker processes, each loading the learner from model_path."""
+        if self.species_pool is None:
+            torch_threads = max(1, self.plan.image_cores // self.species_processes) if self.plan else 1
+            cpus = self.plan.image_cpus if self.plan else None
+            self.species_pool = ProcessPoolExecutor(
+                max_workers=self.species_processes,
+                initializer=_init_species_worker,
+                initargs=(str(model_path), torch_threads, cpus),
+            )
+            logger.info("fastai species model will run in %d worker process(es)", self.species_processes)
+        return self.species_pool
+
+    async def run(self, pool: Executor, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+    async def run_torch(self, fn: Callable, *args, **kwargs) -> Any:
+        return await self.run(self.torch_pool, fn, *args, **kwargs)
+
+    async def run_llm(self, fn: Callable, *args, **kwargs) -> Any:
+        return await self.run(self.llm_pool, fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = False) -> None:
+        self.torch_pool.shutdown(wait=wait)
+        self.llm_pool.shutdown(wait=wait)
+        if self.species_pool is not None:
+            self.species_pool.shutdown(wait=wait)
@@ -0,0 +1,45 @@
+"""Fast JSON encoding for API responses, with pre-rendered fragments.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. ``prerender`` encodes a value that never changes (e.g. a
+species' metadata record) once; embedding the result in a response costs
+a byte copy instead of re-encoding every field on each request.
+"""
+
+import json
+from typing import Any
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON, matching JSONResponse's output."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def prerender(obj: Any) -> Any:
+    """Encode obj once for embedding in later dumps() calls.
+
+    Returns an orjson Fragment holding the encoded bytes, or obj itself
+    when orjson is unavailable (the standard encoder then serializes it as
+    usual).
+    """
+    if orjson is None or obj is None:
+        return obj
+    return orjson.Fragment(dumps(obj))
+
+
+class FastJSONResponse(Response):
+    """JSONResponse that renders with dumps() and understands prerendered fragments."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
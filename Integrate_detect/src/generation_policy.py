@@ -0,0 +1,130 @@
+"""Generation settings per kind of chat question.
+
+A yes/no question about venom needs a few dozen tokens, first aid a short
+list and an open question a few paragraphs, yet every chat generation used
+to ask for 1024 tokens with no stop strings, and the model often kept going
+by inventing further "User:"/"Assistant:" turns that were thrown away.
+GenerationPolicies maps the intent IntentRouter detects (see src.intents)
+to a GenerationPolicy: max_tokens, stop strings, sampling parameters and a
+wall-clock cap. It also counts, per policy, tokens generated against
+tokens kept in the reply, so budgets can be tuned from ``/llm_status``.
+"""
+
+import os
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from typing import Dict, Optional, Tuple
+
+# The chat prompt ends with "User: ...\nAssistant:"; anything starting a new turn is not part of the reply.
+CHAT_STOP = ("\nUser:", "\nAssistant:", "\nHuman:", "\nUser question:")
+
+OPEN = "open"
+
+
+@dataclass(frozen=True)
+class GenerationPolicy:
+    name: str
+    max_tokens: int
+    temperature: float = 0.7
+    top_p: float = 0.95
+    repeat_penalty: float = 1.1
+    stop: Tuple[str, ...] = CHAT_STOP
+    deadline: Optional[float] = None  # seconds from submission; None = the worker's default
+
+    def params(self, max_tokens: Optional[int] = None) -> dict:
+        """Keyword arguments for the llama.cpp completion call."""
+        return {
+            "max_tokens": self.max_tokens if max_tokens is None else max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "repeat_penalty": self.repeat_penalty,
+            "stop": list(self.stop),
+        }
+
+    def trim(self, text: str) -> str:
+        """Reply without any invented follow-up turn (llama.cpp stops there already; this covers
+        text from other sources, e.g. a deadline cut or a cached reply)."""
+        cut = min((i for i in (text.find(s) for s in self.stop) if i >= 0), default=-1)
+        return (text[:cut] if cut >= 0 else text).strip()
+
+
+DEFAULT_POLICIES: Dict[str, GenerationPolicy] = {
+    policy.name: policy
+    for policy in (
+        GenerationPolicy("first_aid", max_tokens=320, temperature=0.2, top_p=0.9, deadline=45),
+        GenerationPolicy("venomous", max_tokens=96, temperature=0.1, top_p=0.9, deadline=15),
+        GenerationPolicy("symptoms", max_tokens=256, temperature=0.3, top_p=0.9, deadline=30),
+        GenerationPolicy("habitat", max_tokens=160, temperature=0.3, top_p=0.9, deadline=20),
+        GenerationPolicy("antivenom", max_tokens=192, temperature=0.2, top_p=0.9, deadline=25),
+        GenerationPolicy(OPEN, max_tokens=768, temperature=0.7, deadline=90),
+    )
+}
+
+
+@dataclass
+class _PolicyStats:
+    requests: int = 0
+    generated_tokens: int = 0
+    kept_tokens: int = 0
+    generation_ms: float = 0.0
+    finish_reasons: Counter = field(default_factory=Counter)
+
+
+class GenerationPolicies:
+    """Policy table keyed by intent, with per-policy token accounting.
+
+    Args:
+        policies: name -> GenerationPolicy; must contain "open", used for
+            open-ended, multi-intent and unrecognised questions.
+    """
+
+    def __init__(self, policies: Dict[str, GenerationPolicy] = DEFAULT_POLICIES):
+        if OPEN not in policies:
+            raise ValueError("generation policies need an 'open' entry")
+        self.policies = dict(policies)
+        self._stats: Dict[str, _PolicyStats] = {name: _PolicyStats() for name in self.policies}
+
+    @classmethod
+    def from_env(cls) -> "GenerationPolicies":
+        """Defaults, overridable per policy with CHAT_POLICY_<NAME>_MAX_TOKENS / _DEADLINE / _TEMPERATURE."""
+        policies = {}
+        for name, policy in DEFAULT_POLICIES.items():
+            prefix = f"CHAT_POLICY_{name.upper()}_"
+            deadline = os.getenv(prefix + "DEADLINE")
+            policies[name] = replace(
+                policy,
+                max_tokens=int(os.getenv(prefix + "MAX_TOKENS", str(policy.max_tokens))),
+                temperature=float(os.getenv(prefix + "TEMPERATURE", str(policy.temperature))),
+                deadline=(float(deadline) or None) if deadline is not None else policy.deadline,
+            )
+        return cls(policies)
+
+    def for_intent(self, match) -> GenerationPolicy:
+        """Policy for an IntentMatch (or None); explanations get the open policy whatever the topic."""
+        if match is None or match.intent is None or match.open_ended:
+            return self.policies[OPEN]
+        return self.policies.get(match.intent, self.policies[OPEN])
+
+    def record(self, policy: GenerationPolicy, generated: int, kept: int, finish_reason: str, generation_ms: float = 0.0) -> None:
+        stats = self._stats.setdefault(policy.name, _PolicyStats())
+        stats.requests += 1
+        stats.generated_tokens += generated
+        stats.kept_tokens += kept
+        stats.generation_ms += generation_ms
+        stats.finish_reasons[finish_reason or "stop"] += 1
+
+    def stats(self) -> dict:
+        out = {}
+        for name, policy in self.policies.items():
+            stats = self._stats[name]
+            out[name] = {
+                "max_tokens": policy.max_tokens,
+                "deadline_s": policy.deadline,
+                "requests": stats.requests,
+                "generated_tokens": stats.generated_tokens,
+                "kept_tokens": stats.kept_tokens,
+                "kept_ratio": round(stats.kept_tokens / stats.generated_tokens, 3) if stats.generated_tokens else None,
+                "avg_generation_ms": round(stats.generation_ms / stats.requests, 1) if stats.requests else None,
+                "finish_reasons": dict(stats.finish_reasons),
+            }
+        return out
@@ -0,0 +1,175 @@
+"""Deterministic answers for the chat questions that do not need the LLM.
+
+Most chat messages ask the same few things about the species that was just
+identified: first aid, whether it is venomous, symptoms, where it lives or
+which antivenom to use. IntentRouter classifies a message with precompiled
+patterns; when exactly one intent matches a short, closed question that
+does not describe the patient's condition, and the data to answer it is
+available, ``answer_intent`` renders the reply from
+the species/treatment records in well under a millisecond. Everything else
+(open-ended, multi-part or unknown questions) goes to the LLM.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+GENERAL_FIRST_AID = (
+    "**SNAKEBITE EMERGENCY PROTOCOL:**\n\n"
+    "1. **Call Emergency Services Immediately** (911 or local emergency number)\n"
+    "2. **Keep the victim calm and still** - movement speeds venom spread\n"
+    "3. **Remove jewelry/tight clothing** near the bite before swelling\n"
+    "4. **Position the bite below heart level**\n"
+    "5. **Clean the wound gently** with soap and water\n"
+    "6. **Cover with clean, dry dressing**\n\n"
+    "**DO NOT:**\n"
+    "❌ Cut the wound\n"
+    "❌ Apply ice\n"
+    "❌ Apply tourniquet\n"
+    "❌ Try to suck out venom\n\n"
+    "⚠️ **Time is critical! Get to a hospital immediately!**"
+)
+
+GENERAL_SYMPTOMS = (
+    "**Common Venomous Snakebite Symptoms:**\n\n"
+    "• Pain and swelling at bite site\n"
+    "• Puncture marks (may be faint)\n"
+    "• Redness and bruising\n"
+    "• Difficulty breathing\n"
+    "• Nausea and vomiting\n"
+    "• Blurred vision\n"
+    "• Sweating and salivating\n"
+    "• Numbness or tingling\n\n"
+    "**If you experience any of these symptoms after a snakebite, seek immediate medical attention!**"
+)
+
+SEEK_CARE = "⚠️ **CRITICAL: Seek immediate medical attention. Call emergency services now!**"
+
+_INTENT_PATTERNS: Dict[str, str] = {
+    "first_aid": (
+        r"\bfirst[\s-]?aid\b|\btreat(?:ment|ed|ing)?\b|\bwhat (?:should|do|can|must) (?:i|we|you|they) do\b"
+        r"|\bwhat to do\b|\bhow (?:do|should) (?:i|we) (?:treat|handle)\b"
+    ),
+    "venomous": r"\bvenomous\b|\bvenom\b|\bpoison(?:ous)?\b|\bdangerous\b|\bdeadly\b|\blethal\b|\bharmful\b",
+    "symptoms": r"\bsymptoms?\b|\bsigns?\b|\bwhat (?:will )?happens?\b|\beffects?\b",
+    "habitat": (
+        r"\bwhere\b.*\b(?:found|live|lives|from|occur|occurs)\b|\bhabitat\b|\bnative\b|\bdistribution\b"
+        r"|\bfound in\b|\bwhich (?:countries|country|region|regions)\b"
+    ),
+    "antivenom": r"\banti[\s-]?venoms?\b|\bantivenins?\b|\basv\b",
+}
+
+# Cues that the user wants an explanation or discussion rather than a fact.
+_OPEN_ENDED = re.compile(
+    r"\bwhy\b|\bexplain\b|\bcompare\b|\bdifference\b|\bwhat if\b|\bhow come\b|\btell me (?:more|about)\b"
+    r"|\bdescribe\b|\bversus\b|\bvs\.?\b|\bopinion\b|\bhistory\b|\bstory\b",
+    re.IGNORECASE,
+)
+
+# Descriptions of the patient's condition ("my leg is swelling", "bitten 2 hours ago"): a
+# templated reply would ignore them, so such messages go to the LLM.
+_CLINICAL = re.compile(
+    r"\bswell(?:ing|s|ed)?\b|\bswollen\b|\bpain(?:ful)?\b|\bhurts?\b|\bbleed(?:ing|s)?\b|\bblood\b"
+    r"|\bbruis(?:e|ed|es|ing)\b|\bblisters?\b|\bnumb(?:ness)?\b|\btingl(?:e|es|ing)\b|\bdizz(?:y|iness)\b"
+    r"|\bfaint(?:ed|ing)?\b|\bvomit(?:ing|ed)?\b|\bnause(?:a|ous)\b|\bbreath(?:e|ing|less)?\b"
+    r"|\bblurr(?:ed|y)\b|\bvision\b|\bdroop(?:ing|y)?\b|\beyelids?\b|\bdrows(?:y|iness)\b|\bconfus(?:ed|ion)\b"
+    r"|\bsweat(?:ing|y)?\b|\bfever\b|\bchest\b|\bheadache\b|\bweak(?:ness)?\b|\bparaly[sz](?:ed|is)\b"
+    r"|\bunconscious\b|\bseizures?\b|\bpregnant\b|\bbaby\b|\bchild\b|\b(?:hours?|minutes?|mins?) ago\b",
+    re.IGNORECASE,
+)
+
+# Intents that only make sense about a specific species.
+_NEEDS_SPECIES = {"venomous", "habitat", "antivenom"}
+
+MAX_FAST_PATH_WORDS = 20
+
+
+@dataclass(frozen=True)
+class IntentMatch:
+    intent: Optional[str]
+    confidence: float
+    reason: str = ""
+    open_ended: bool = False  # asks for an explanation rather than a fact
+
+
+class IntentRouter:
+    """Classify chat messages into a handful of factual intents with precompiled patterns."""
+
+    def __init__(self, patterns: Dict[str, str] = _INTENT_PATTERNS):
+        self._patterns: Tuple[Tuple[str, "re.Pattern"], ...] = tuple(
+            (name, re.compile(pattern, re.IGNORECASE)) for name, pattern in patterns.items()
+        )
+
+    def route(self, message: str, has_species: bool) -> IntentMatch:
+        """Best intent for message and how safe it is to answer without the LLM (0..1)."""
+        matched = [name for name, pattern in self._patterns if pattern.search(message)]
+        if not matched:
+            return IntentMatch(None, 0.0, "no intent")
+        if len(matched) > 1:
+            # "first aid" + "bitten" style overlaps are still one question
+            if set(matched) == {"first_aid", "antivenom"}:
+                matched = ["first_aid"]
+            else:
+                return IntentMatch(None, 0.3, f"several intents: {', '.join(matched)}")
+        intent = matched[0]
+        if _OPEN_ENDED.search(message):
+            return IntentMatch(intent, 0.3, "open-ended question", open_ended=True)
+        if _CLINICAL.search(message):
+            return IntentMatch(intent, 0.5, "describes the patient's condition")
+        if len(message.split()) > MAX_FAST_PATH_WORDS:
+            return IntentMatch(intent, 0.5, "long message")
+        if intent in _NEEDS_SPECIES and not has_species:
+            return IntentMatch(intent, 0.4, "no species context")
+        return IntentMatch(intent, 0.95)
+
+
+def answer_intent(
+    intent: str,
+    species_name: Optional[str],
+    species: Optional[dict],
+    treatment: Optional[dict],
+) -> Optional[str]:
+    """Render the templated reply for an intent, or None if the records cannot answer it.
+
+    species/treatment are records from src.data_index (NaN-cleaned dicts).
+    """
+    name = (species or {}).get("binomial_name") or species_name
+    if intent == "first_aid":
+        if not treatment:
+            return GENERAL_FIRST_AID
+        response = f"For {name} bite:\n\n"
+        if treatment.get("immediate_first_aid_core") is not None:
+            response += f"**Immediate First Aid:**\n{treatment['immediate_first_aid_core']}\n\n"
+        if treatment.get("initial_hospital_actions") is not None:
+            response += f"**Medical Care:**\n{treatment['initial_hospital_actions']}\n\n"
+        if treatment.get("antivenom_name_or_type") is not None:
+            response += f"**Antivenom:**\n{treatment['antivenom_name_or_type']}\n\n"
+        return response + SEEK_CARE
+
+    if intent == "symptoms":
+        if treatment and treatment.get("symptoms") is not None:
+            return (
+                f"**Typical symptoms after a {name} bite:**\n{treatment['symptoms']}\n\n"
+                "Symptoms can be delayed for hours; any bite needs medical assessment.\n\n" + SEEK_CARE
+            )
+        return GENERAL_SYMPTOMS
+
+    if species is None:
+        return None
+    if intent == "venomous":
+        venomous = species.get("poisonous") == 1
+        response = f"**{name}** - Venomous: {'Yes' if venomous else 'No'}\n\n"
+        response += f"Region: {species.get('country') or 'Unknown'} ({species.get('continent') or 'Unknown'})\n\n"
+        if venomous:
+            return response + "This is a venomous species. If bitten, seek immediate medical attention!"
+        return response + "This is a non-venomous species. However, any bite should be evaluated by a medical professional."
+    if intent == "habitat":
+        if species.get("country") is None and species.get("continent") is None:
+            return None
+        common = f" ({species['common_name']})" if species.get("common_name") else ""
+        return f"🌍 {name}{common} is found in {species.get('country') or 'Unknown'} ({species.get('continent') or 'Unknown'})."
+    if intent == "antivenom":
+        if not treatment or treatment.get("antivenom_name_or_type") is None:
+            return None
+        return f"**Antivenom for {name}:**\n{treatment['antivenom_name_or_type']}\n\n" + SEEK_CARE
+    return None
@@ -0,0 +1,246 @@
+"""Reuse of llama.cpp KV state for prompt prefixes shared between requests.
+
+Every chat prompt starts with the same system prompt, and the next turn of
+a conversation starts with the previous turn's prompt and reply. llama.cpp
+only skips re-evaluating a prefix when it is still in the context from the
+previous call, so a second user's request makes the first user's next turn
+evaluate everything again.
+
+PrefixStateCache plugs into ``Llama.set_cache``: before a completion,
+llama-cpp-python looks up the saved state whose tokens share the longest
+prefix with the new prompt and restores it when that beats what is in the
+context, so only the remaining tokens are evaluated; after a completion it
+saves the state under prompt + reply tokens. On top of that:
+
+* ``prime`` evaluates a fixed prefix (the system prompt) once at load time
+  and pins its state so eviction never drops it;
+* unpinned states are evicted least-recently-used to stay within a byte
+  budget, optionally spilling to a directory with its own budget, from
+  where a hit promotes them back to memory.
+
+States are interchangeable between instances of the same model and
+context size, so one cache serves a whole LLM pool; it is locked because
+the instances generate on separate threads.
+"""
+
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[int, ...]
+
+
+def _common_prefix(a: Sequence[int], b: Sequence[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def _state_size(state) -> int:
+    return int(getattr(state, "llama_state_size", 0) or 0)
+
+
+class PrefixStateCache:
+    """Longest-prefix cache of llama.cpp states (LlamaState) within a byte budget.
+
+    Implements the mapping interface ``Llama.set_cache`` expects: keys are
+    token sequences and a lookup returns the state whose key shares the
+    longest prefix with the given tokens.
+
+    Args:
+        capacity_bytes: memory budget for unpinned states.
+        save_completions: keep the state after each completion (the
+            per-conversation prefixes); if False only primed prefixes are kept.
+        disk_dir: optional directory for states evicted from memory.
+        disk_capacity_bytes: budget for disk_dir.
+    """
+
+    def __init__(
+        self,
+        capacity_bytes: int,
+        save_completions: bool = True,
+        disk_dir: Optional[Path] = None,
+        disk_capacity_bytes: int = 0,
+    ):
+        self.capacity_bytes = capacity_bytes
+        self.save_completions = save_completions
+        self.pinned: Dict[Key, object] = {}
+        self._states: "OrderedDict[Key, object]" = OrderedDict()
+        self.disk_dir = Path(disk_dir) if disk_dir and disk_capacity_bytes > 0 else None
+        self.disk_capacity_bytes = disk_capacity_bytes
+        self._disk: "OrderedDict[Key, Tuple[Path, int]]" = OrderedDict()
+        self._counts = Counter()
+        self._lock = threading.RLock()
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            # States depend on the exact model and context; never reuse files from an earlier run.
+            for stale in self.disk_dir.glob("*.state"):
+                stale.unlink(missing_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["PrefixStateCache"]:
+        """Build from LLM_PREFIX_CACHE_MB (0 = off), LLM_PREFIX_CACHE_CONVERSATIONS,
+        LLM_PREFIX_CACHE_DIR and LLM_PREFIX_CACHE_DISK_MB."""
+        megabytes = float(os.getenv("LLM_PREFIX_CACHE_MB", "512"))
+        if megabytes <= 0:
+            return None
+        return cls(
+            capacity_bytes=int(megabytes * 1024 * 1024),
+            save_completions=os.getenv("LLM_PREFIX_CACHE_CONVERSATIONS", "1") == "1",
+            disk_dir=os.getenv("LLM_PREFIX_CACHE_DIR") or None,
+            disk_capacity_bytes=int(float(os.getenv("LLM_PREFIX_CACHE_DISK_MB", "2048")) * 1024 * 1024),
+        )
+
+    # -- Llama.set_cache interface ----------------------------------------
+
+    @property
+    def cache_size(self) -> int:
+        return sum(_state_size(state) for state in self._states.values())
+
+    def _find_longest_prefix_key(self, key: Key) -> Optional[Key]:
+        best, best_len = None, 0
+        for candidates in (self.pinned, self._states, self._disk):
+            for candidate in candidates:
+                n = _common_prefix(candidate, key)
+                if n > best_len:
+                    best, best_len = candidate, n
+        return best
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._find_longest_prefix_key(tuple(key)) is not None
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._get(tuple(key))
+
+    def _get(self, key: Key):
+        found = self._find_longest_prefix_key(key)
+        if found is None:
+            self._counts["misses"] += 1
+            raise KeyError("no cached prefix")
+        self._counts["hits"] += 1
+        self._counts["reused_tokens"] += _common_prefix(found, key)
+        if found in self.pinned:
+            return self.pinned[found]
+        if found in self._states:
+            self._states.move_to_end(found)
+            return self._states[found]
+        try:
+            state = self._load_from_disk(found)
+        except Exception as e:
+            logger.warning(f"Could not read spilled LLM state: {e}")
+            raise KeyError("cached prefix unreadable") from e
+        self._counts["disk_hits"] += 1
+        self._store(found, state)
+        return state
+
+    def __setitem__(self, key, state) -> None:
+        if not self.save_completions:
+            return
+        with self._lock:
+            self._store(tuple(key), state)
+
+    # -- pinned prefixes --------------------------------------------------
+
+    def pin(self, key, state) -> None:
+        """Keep state for key regardless of the budget."""
+        with self._lock:
+            self.pinned[tuple(key)] = state
+
+    def prime(self, llm, text: str) -> int:
+        """Evaluate text from an empty context and pin the resulting state; returns its token count.
+
+        Must run on the thread that owns llm, before it serves requests.
+        """
+        started = time.perf_counter()
+        tokens = llm.tokenize(text.encode("utf-8"))
+        llm.reset()
+        llm.eval(tokens)
+        state = llm.save_state()
+        self.pin(tokens, state)
+        logger.info(
+            "Primed LLM prefix of %d tokens in %.0f ms (%.1f MB state)",
+            len(tokens),
+            (time.perf_counter() - started) * 1000,
+            _state_size(state) / 1e6,
+        )
+        return len(tokens)
+
+    def attach(self, llms, prefixes: Sequence[str] = ()) -> None:
+        """Install this cache on a Llama (or each of a list) and prime the given fixed prefixes once."""
+        llms = llms if isinstance(llms, (list, tuple)) else [llms]
+        for llm in llms:
+            llm.set_cache(self)
+        for prefix in prefixes:
+            try:
+                self.prime(llms[0], prefix)
+            except Exception as e:
+                logger.warning(f"Could not prime LLM prefix cache: {e}")
+
+    # -- storage ----------------------------------------------------------
+
+    def _store(self, key: Key, state) -> None:
+        if key in self.pinned:
+            return
+        self._states.pop(key, None)
+        self._states[key] = state
+        size = self.cache_size
+        while self._states and size > self.capacity_bytes:
+            old_key, old_state = self._states.popitem(last=False)
+            size -= _state_size(old_state)
+            self._counts["evictions"] += 1
+            self._spill(old_key, old_state)
+
+    def _spill(self, key: Key, state) -> None:
+        size = _state_size(state)
+        if self.disk_dir is None or size > self.disk_capacity_bytes:
+            return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=str(self.disk_dir), suffix=".state")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning(f"Could not spill LLM state to {self.disk_dir}: {e}")
+            return
+        self._disk[key] = (Path(tmp), size)
+        used = sum(s for _, s in self._disk.values())
+        while used > self.disk_capacity_bytes:
+            _, (path, old_size) = self._disk.popitem(last=False)
+            path.unlink(missing_ok=True)
+            used -= old_size
+
+    def _load_from_disk(self, key: Key):
+        path, _ = self._disk.pop(key)
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        finally:
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return self._stats()
+
+    def _stats(self) -> dict:
+        return {
+            "pinned": len(self.pinned),
+            "entries": len(self._states),
+            "bytes": self.cache_size,
+            "pinned_bytes": sum(_state_size(s) for s in self.pinned.values()),
+            "capacity_bytes": self.capacity_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": sum(s for _, s in self._disk.values()),
+            **{name: self._counts[name] for name in ("hits", "misses", "disk_hits", "evictions", "reused_tokens")},
+        }
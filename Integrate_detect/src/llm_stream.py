@@ -0,0 +1,112 @@
+"""Token streaming from llama.cpp to server-sent events.
+
+Generations run on the LLMWorker's thread; each chunk is handed to the
+event loop through an asyncio queue. When the consumer stops early (client
+disconnected, or the response generator was closed) the job is cancelled:
+dropped if still queued, otherwise stopped at the next token instead of
+running to max_tokens for nobody.
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+
+_DONE = object()
+
+
+@dataclass
+class StreamStats:
+    """Timing of one streamed generation."""
+
+    started: float = field(default_factory=time.perf_counter)
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+    tokens: int = 0
+    cancelled: bool = False
+    queue_position: Optional[int] = None
+    finish_reason: Optional[str] = None
+
+    def token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.tokens += 1
+
+    def finish(self, cancelled: bool = False) -> None:
+        if self.finished is None:
+            self.finished = time.perf_counter()
+            self.cancelled = cancelled
+
+    def summary(self) -> dict:
+        end = self.finished or time.perf_counter()
+        ttft = (self.first_token - self.started) if self.first_token is not None else None
+        decode = end - self.first_token if self.first_token is not None else 0.0
+        # The first token's time is prompt processing; rate counts the tokens after it.
+        rate = (self.tokens - 1) / decode if self.tokens > 1 and decode > 0 else None
+        return {
+            "tokens": self.tokens,
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "tokens_per_sec": round(rate, 2) if rate is not None else None,
+            "total_ms": round((end - self.started) * 1000, 1),
+            "cancelled": self.cancelled,
+            "finish_reason": self.finish_reason,
+            "queue_position": self.queue_position,
+        }
+
+
+def sse_event(data, event: Optional[str] = None) -> str:
+    """Format one server-sent event; data is JSON-encoded."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class TokenStream:
+    """Completion text chunks from an LLMWorker, as an async iterator.
+
+    The job is submitted on construction, so LLMQueueFull/LLMUnavailable
+    are raised by the constructor and ``position`` is known immediately.
+    Construct it inside the response generator, so that closing the
+    generator always reaches aclose(). kwargs are passed to LLMWorker.submit (max_tokens, stop,
+    deadline, ...). aclose(), or leaving the iteration early, cancels the
+    generation whether it is queued or running.
+    """
+
+    def __init__(self, worker, prompt: str, stats: Optional[StreamStats] = None, **kwargs):
+        self.worker = worker
+        self.stats = stats if stats is not None else StreamStats()
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.job = worker.submit(prompt, on_text=self._put, **kwargs)
+        self.stats.queue_position = worker.position(self.job)
+        self.job.future.add_done_callback(lambda _: self._queue.put_nowait(_DONE))
+
+    @property
+    def position(self) -> Optional[int]:
+        return self.worker.position(self.job)
+
+    def _put(self, text: str) -> None:
+        # Called on the LLM thread; chunks are queued ahead of the job's completion.
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, text)
+        except RuntimeError:  # event loop already closed
+            self.job.cancel()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _DONE:
+                    break
+                self.stats.token()
+                yield item
+            out = self.job.future.result()
+            self.stats.finish_reason = out["choices"][0]["finish_reason"]
+            self.stats.finish(cancelled=self.stats.finish_reason == "cancelled")
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        if self.stats.finished is None:
+            self.stats.finish(cancelled=True)
+        self.worker.cancel(self.job)
@@ -0,0 +1,323 @@
+"""Single owner of the Llama instances, with an explicit generation queue.
+
+A llama.cpp ``Llama`` object must never run two generations at once.
+LLMWorker queues every request and a dispatcher task hands each job to an
+idle instance, running it on the executor's LLM threads; with one instance
+generations are strictly sequential, with a pool of N (see
+src.model_loader.load_llm_pool) up to N run side by side. Jobs carry
+optional deadlines:
+
+* ``max_queue_wait`` - seconds a job may wait for its turn before it fails
+  with LLMQueueTimeout instead of starting late;
+* ``deadline`` - seconds from submission after which a running generation
+  stops at the next token and returns what it has (finish_reason
+  "deadline").
+
+When the awaiting caller is cancelled, or the ``disconnected`` check given
+to ``result`` reports that the client went away, a queued job is dropped
+and a running one stops at the next token. Generations always
+use llama.cpp's streaming API internally so they can be interrupted;
+non-streaming callers get the usual completion dict back.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailable(RuntimeError):
+    """No LLM is loaded."""
+
+
+class LLMQueueFull(RuntimeError):
+    """Too many generations are already waiting."""
+
+
+class LLMQueueTimeout(TimeoutError):
+    """A job waited longer than its max_queue_wait."""
+
+
+class LLMCancelled(RuntimeError):
+    """The caller disconnected, so its job was cancelled."""
+
+
+@dataclass(eq=False)
+class GenerationJob:
+    prompt: str
+    kwargs: dict
+    future: asyncio.Future
+    deadline: Optional[float] = None  # time.monotonic() value
+    queue_deadline: Optional[float] = None
+    on_text: Optional[Callable[[str], None]] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    enqueued: float = field(default_factory=time.monotonic)
+    started: Optional[float] = None
+    cancelled: threading.Event = field(default_factory=threading.Event)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+
+class LLMWorker:
+    """Schedule generations so each Llama instance runs one at a time.
+
+    Args:
+        pool: executor the generations run on, with a thread per instance.
+        llm: a Llama instance, or a list of interchangeable instances.
+        max_queue: jobs allowed to wait (excluding the running one).
+        deadline: default seconds a generation may take from submission.
+        max_queue_wait: default seconds a job may wait before starting.
+    """
+
+    def __init__(
+        self,
+        pool: Executor,
+        llm=None,
+        max_queue: int = 16,
+        deadline: Optional[float] = 120.0,
+        max_queue_wait: Optional[float] = 30.0,
+    ):
+        self.pool = pool
+        self.max_queue = max(0, max_queue)
+        self.deadline = deadline
+        self.max_queue_wait = max_queue_wait
+        self._queue: Deque[GenerationJob] = collections.deque()
+        self._running: Dict[GenerationJob, object] = {}
+        self._tasks: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._counts: Dict[str, int] = collections.Counter()
+        self.instances: list = []
+        self._idle: Deque = collections.deque()
+        self.llm = llm
+
+    @classmethod
+    def from_env(cls, pool: Executor) -> "LLMWorker":
+        """Build from LLM_MAX_QUEUE, LLM_DEADLINE and LLM_MAX_QUEUE_WAIT (seconds; 0 = none)."""
+        deadline = float(os.getenv("LLM_DEADLINE", "120"))
+        queue_wait = float(os.getenv("LLM_MAX_QUEUE_WAIT", "30"))
+        return cls(
+            pool,
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "16")),
+            deadline=deadline or None,
+            max_queue_wait=queue_wait or None,
+        )
+
+    @property
+    def llm(self):
+        """The first instance, or None when no LLM is loaded."""
+        return self.instances[0] if self.instances else None
+
+    @llm.setter
+    def llm(self, value) -> None:
+        """Set the instance(s) to generate with; only call this while nothing is running."""
+        if value is None:
+            value = []
+        self.instances = list(value) if isinstance(value, (list, tuple)) else [value]
+        self._idle = collections.deque(self.instances)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # -- submitting -------------------------------------------------------
+
+    def submit(
+        self,
+        prompt: str,
+        on_text: Optional[Callable[[str], None]] = None,
+        deadline: Optional[float] = None,
+        max_queue_wait: Optional[float] = None,
+        **kwargs,
+    ) -> GenerationJob:
+        """Queue a generation; kwargs go to the llama.cpp call.
+
+        on_text is called from the LLM thread with each generated chunk.
+        Raises LLMUnavailable or LLMQueueFull.
+        """
+        self.check()
+        loop = asyncio.get_running_loop()
+        self._ensure_dispatcher(loop)
+        now = time.monotonic()
+        deadline = self.deadline if deadline is None else deadline
+        queue_wait = self.max_queue_wait if max_queue_wait is None else max_queue_wait
+        job = GenerationJob(
+            prompt=prompt,
+            kwargs=kwargs,
+            future=loop.create_future(),
+            deadline=now + deadline if deadline else None,
+            queue_deadline=now + queue_wait if queue_wait else None,
+            on_text=on_text,
+            enqueued=now,
+        )
+        self._queue.append(job)
+        self._counts["submitted"] += 1
+        if queue_wait:
+            loop.call_later(queue_wait, self._expire, job)
+        self._wakeup.set()
+        return job
+
+    def check(self) -> None:
+        """Raise LLMUnavailable or LLMQueueFull if a job submitted now would be refused."""
+        if self.llm is None:
+            raise LLMUnavailable("LLM not loaded")
+        if len(self._queue) >= self.max_queue:
+            self._counts["rejected"] += 1
+            raise LLMQueueFull(f"{len(self._queue)} generations already queued")
+
+    async def result(
+        self,
+        job: GenerationJob,
+        disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        poll: float = 0.5,
+    ) -> dict:
+        """Wait for job; if the caller is cancelled, the job is cancelled too.
+
+        disconnected (e.g. Starlette's ``request.is_disconnected``) is checked
+        every poll seconds while the job is unfinished; once it returns True
+        the job is cancelled and LLMCancelled is raised.
+        """
+        try:
+            if disconnected is not None:
+                while not job.future.done():
+                    await asyncio.wait((job.future,), timeout=poll)
+                    if not job.future.done() and await disconnected():
+                        self.cancel(job)
+                        raise LLMCancelled(f"client disconnected; LLM job {job.id} cancelled")
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            self.cancel(job)
+            raise
+
+    async def generate(
+        self, prompt: str, disconnected: Optional[Callable[[], Awaitable[bool]]] = None, **kwargs
+    ) -> dict:
+        """Queue a generation and return its completion dict (``out["choices"][0]["text"]``)."""
+        return await self.result(self.submit(prompt, **kwargs), disconnected)
+
+    def cancel(self, job: GenerationJob) -> None:
+        """Drop job if it is still queued, or stop it at the next token if running."""
+        if job.future.done():
+            return
+        job.cancel()
+        try:
+            self._queue.remove(job)
+        except ValueError:
+            return  # running; the LLM thread notices the flag
+        self._counts["cancelled"] += 1
+        job.future.cancel()
+
+    def position(self, job: GenerationJob) -> Optional[int]:
+        """Jobs that must start before this one (0 while it runs or once an instance is free), None once finished."""
+        if job in self._running:
+            return 0
+        try:
+            index = self._queue.index(job)
+        except ValueError:
+            return None
+        return max(0, index + 1 - len(self._idle))
+
+    def snapshot(self) -> dict:
+        return {
+            "loaded": self.llm is not None,
+            "instances": len(self.instances),
+            "busy": len(self._running),
+            "queued": len(self._queue),
+            "running": [job.id for job in self._running],
+            "max_queue": self.max_queue,
+            "deadline_s": self.deadline,
+            "max_queue_wait_s": self.max_queue_wait,
+            **{name: self._counts[name] for name in ("submitted", "completed", "deadline", "cancelled", "expired", "rejected", "failed")},
+        }
+
+    # -- running ----------------------------------------------------------
+
+    def _ensure_dispatcher(self, loop: asyncio.AbstractEventLoop) -> None:
+        task = self._dispatcher
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        while True:
+            while not (self._queue and self._idle):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            job = self._queue.popleft()
+            if job.queue_deadline is not None and time.monotonic() > job.queue_deadline:
+                self._expire(job)
+                continue
+            llm = self._idle.popleft()
+            self._running[job] = llm
+            task = asyncio.get_running_loop().create_task(self._execute(job, llm))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job: GenerationJob, llm) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            out = await loop.run_in_executor(self.pool, self._run, job, llm)
+        except Exception as e:
+            self._counts["failed"] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            finish_reason = out["choices"][0]["finish_reason"]
+            self._counts[finish_reason if finish_reason in ("cancelled", "deadline") else "completed"] += 1
+            if not job.future.done():
+                job.future.set_result(out)
+        finally:
+            del self._running[job]
+            if any(llm is instance for instance in self.instances):
+                self._idle.append(llm)
+            self._wakeup.set()
+
+    def _expire(self, job: GenerationJob) -> None:
+        """Fail job with LLMQueueTimeout unless it has already started."""
+        if job.started is not None or job in self._running or job.future.done():
+            return
+        try:
+            self._queue.remove(job)
+        except ValueError:
+            pass
+        self._counts["expired"] += 1
+        waited = time.monotonic() - job.enqueued
+        job.future.set_exception(LLMQueueTimeout(f"waited {waited:.1f}s for the LLM"))
+
+    def _run(self, job: GenerationJob, llm) -> dict:
+        """Run one generation on an LLM thread, stopping early on cancel or deadline."""
+        job.started = time.monotonic()
+        parts = []
+        finish_reason = None
+        chunks = llm(job.prompt, stream=True, **job.kwargs)
+        try:
+            for chunk in chunks:
+                if job.cancelled.is_set():
+                    finish_reason = "cancelled"
+                    break
+                if job.deadline is not None and time.monotonic() > job.deadline:
+                    finish_reason = "deadline"
+                    logger.warning("LLM job %s hit its deadline after %d chunks", job.id, len(parts))
+                    break
+                choice = chunk["choices"][0]
+                parts.append(choice["text"])
+                if job.on_text is not None:
+                    job.on_text(choice["text"])
+                finish_reason = choice.get("finish_reason") or finish_reason
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        return {
+            "id": job.id,
+            "choices": [{"text": "".join(parts), "index": 0, "finish_reason": finish_reason or "stop"}],
+            "tokens": len(parts),  # llama.cpp streams one token per chunk
+            "queue_ms": round((job.started - job.enqueued) * 1000, 1),
+            "generation_ms": round((time.monotonic() - job.started) * 1000, 1),
+        }
@@ -0,0 +1,339 @@
+"""Export the image models to TorchScript / ONNX with optional int8 quantization.
+
+Build step (run once, e.g. while building the Docker image):
+
+    python -m src.model_export --quantize static --channels-last \
+        --parity-dir path/to/sample/images
+
+The default format is TorchScript, which needs nothing beyond torch.
+``--format onnx`` or ``--format both`` also needs ``pip install onnx onnxruntime``.
+
+This writes ``bite.*`` and ``species.*`` into MODEL_EXPORT_DIR (default
+``models/optimized``), a ``manifest.json`` describing them and a
+``parity_report.json`` comparing every exported network with the eager one
+(top-1 agreement, probability drift, latency and file size). At startup,
+MODEL_BACKEND=torchscript or MODEL_BACKEND=onnx makes ``load_models`` use
+the exported networks; the default ``eager`` keeps the original models.
+
+Quantization:
+- ``dynamic``: int8 weights, activations quantized on the fly. TorchScript
+  only quantizes Linear layers this way; ONNX Runtime also covers convs.
+- ``static``: int8 weights and activations calibrated on --calibration-dir
+  (or --parity-dir) images; the largest speed-up for the conv-heavy models.
+"""
+
+import argparse
+import copy
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "torchscript", "onnx")
+DEFAULT_EXPORT_DIR = "models/optimized"
+MANIFEST = "manifest.json"
+PARITY_REPORT = "parity_report.json"
+
+
+def model_backend() -> str:
+    """Runtime backend selected by MODEL_BACKEND (eager, torchscript or onnx)."""
+    backend = os.getenv("MODEL_BACKEND", "eager").strip().lower()
+    if backend not in BACKENDS:
+        logger.warning("Unknown MODEL_BACKEND=%s; using eager", backend)
+        return "eager"
+    return backend
+
+
+def export_dir() -> Path:
+    """MODEL_EXPORT_DIR, resolved relative to the project root like other model paths."""
+    p = Path(os.getenv("MODEL_EXPORT_DIR", DEFAULT_EXPORT_DIR))
+    if not p.is_absolute():
+        p = Path(__file__).parent.parent.absolute() / p
+    return p
+
+
+class ExportedModule:
+    """Callable wrapper giving TorchScript and ONNX networks the torch-module calls we use."""
+
+    def __init__(self, run, channels_last: bool = False, description: str = ""):
+        self._run = run
+        self.channels_last = channels_last
+        self.description = description
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        x = x.as_subclass(torch.Tensor)  # drop fastai tensor subclasses
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        return self._run(x)
+
+    def eval(self):
+        return self
+
+    def parameters(self):
+        return iter(())
+
+    def __repr__(self):
+        return f"ExportedModule({self.description})"
+
+
+def _torchscript_runner(path: Path):
+    module = torch.jit.load(str(path), map_location="cpu").eval()
+
+    def run(x):
+        with torch.inference_mode():
+            return module(x)
+    return run
+
+
+def _onnx_runner(path: Path):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+
+    def run(x):
+        return torch.from_numpy(session.run(None, {input_name: x.detach().cpu().numpy()})[0])
+    return run
+
+
+def load_exported_model(name: str, backend: str, directory: Optional[Path] = None) -> Optional[ExportedModule]:
+    """Load an exported network listed in the manifest, or None if unavailable."""
+    directory = directory or export_dir()
+    manifest_path = directory / MANIFEST
+    try:
+        entry = json.loads(manifest_path.read_text())["models"][name][backend]
+        path = directory / entry["file"]
+        run = _torchscript_runner(path) if backend == "torchscript" else _onnx_runner(path)
+    except Exception as e:
+        logger.warning("No usable %s export of the %s model in %s (%s); using eager", backend, name, directory, e)
+        return None
+    description = f"{backend}:{entry['file']} quantize={entry.get('quantize', 'none')}"
+    logger.info("Using exported %s model %s", name, description)
+    return ExportedModule(run, channels_last=entry.get("channels_last", False), description=description)
+
+
+# ------------------------------- Export -------------------------------
+
+
+def _quantize_torch(model, mode: str, calibration: List[torch.Tensor], example: torch.Tensor):
+    if mode == "dynamic":
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), example_inputs=(example,))
+    with torch.inference_mode():
+        for batch in calibration:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def _export_torchscript(model, example, out: Path, quantize: str, calibration, channels_last: bool) -> None:
+    model = copy.deepcopy(model).cpu().eval()  # keep the eager reference untouched
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        example = example.contiguous(memory_format=torch.channels_last)
+        calibration = [b.contiguous(memory_format=torch.channels_last) for b in calibration]
+    if quantize != "none":
+        model = _quantize_torch(model, quantize, calibration, example)
+    with torch.inference_mode():
+        traced = torch.jit.freeze(torch.jit.trace(model, example).eval())
+    traced.save(str(out))
+
+
+def _export_onnx(model, example, out: Path, quantize: str, calibration) -> None:
+    model = model.cpu().eval()
+    fp32 = out if quantize == "none" else out.with_suffix(".fp32.onnx")
+    torch.onnx.export(
+        model, (example,), str(fp32),
+        input_names=["input"], output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17, dynamo=False,
+    )
+    if quantize == "none":
+        return
+    from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_dynamic, quantize_static
+
+    if quantize == "dynamic":
+        quantize_dynamic(str(fp32), str(out), weight_type=QuantType.QInt8)
+    else:
+        class Reader(CalibrationDataReader):
+            def __init__(self):
+                self._batches = iter([{"input": b.numpy()} for b in calibration])
+
+            def get_next(self):
+                return next(self._batches, None)
+
+        quantize_static(str(fp32), str(out), Reader(), weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8)
+    fp32.unlink()
+
+
+def _list_images(directory: Optional[str]) -> list:
+    from src.image_utils import IMAGE_EXTENSIONS
+
+    if not directory:
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def _batches(preprocess, paths: list, batch_size: int, fallback_shape) -> List[torch.Tensor]:
+    if not paths:
+        # No sample images: random inputs still catch export bugs but make the
+        # agreement numbers much less meaningful.
+        return [torch.rand(fallback_shape)]
+    return [preprocess(paths[i:i + batch_size]).as_subclass(torch.Tensor).cpu()
+            for i in range(0, len(paths), batch_size)]
+
+
+def _timed(fn, batches) -> tuple:
+    outputs = []
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for b in batches:
+            outputs.append(fn(b))
+    elapsed = (time.perf_counter() - start) * 1000 / max(1, len(batches))
+    return torch.cat(outputs), elapsed
+
+
+def _parity(eager, exported: ExportedModule, batches, activation) -> Dict:
+    ref, eager_ms = _timed(eager, batches)
+    out, exported_ms = _timed(exported, batches)
+    ref_probs, probs = activation(ref.float()), activation(out.float())
+    agree = (ref_probs.argmax(dim=1) == probs.argmax(dim=1)).float().mean().item()
+    diff = (ref_probs - probs).abs()
+    return {
+        "samples": len(ref),
+        "top1_agreement": round(agree, 6),
+        "max_abs_prob_diff": round(diff.max().item(), 6),
+        "mean_abs_prob_diff": round(diff.mean().item(), 6),
+        "eager_ms_per_batch": round(eager_ms, 2),
+        "exported_ms_per_batch": round(exported_ms, 2),
+    }
+
+
+def export_models(
+    formats: List[str],
+    quantize: str = "none",
+    channels_last: bool = False,
+    names: List[str] = ("bite", "species"),
+    parity_dir: Optional[str] = None,
+    calibration_dir: Optional[str] = None,
+    output_dir: Optional[Path] = None,
+    batch_size: int = 8,
+    image_size: int = 224,
+) -> Dict:
+    """Export the selected models and return the parity report."""
+    from src.image_utils import images_to_batch
+    from src.model_loader import SpeciesPipeline, bite_model_path, load_bite_model, load_learner, species_model_path
+
+    output_dir = Path(output_dir or export_dir())
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {"models": {}}
+    parity_paths = _list_images(parity_dir)
+    calibration_paths = _list_images(calibration_dir) or parity_paths
+    if quantize == "static" and not calibration_paths:
+        raise SystemExit("Static quantization needs sample images: pass --calibration-dir or --parity-dir")
+    fallback = (batch_size, 3, image_size, image_size)
+
+    targets = {}
+    if "bite" in names:
+        targets["bite"] = (
+            load_bite_model(bite_model_path(), device=torch.device("cpu")),
+            lambda paths: torch.from_numpy(images_to_batch(paths)),
+            lambda x: torch.softmax(x, dim=1),
+        )
+    if "species" in names:
+        pipeline = SpeciesPipeline(load_learner(species_model_path()))
+        pipeline.device = torch.device("cpu")
+        targets["species"] = (pipeline.model.cpu(), pipeline.preprocess, lambda x: torch.softmax(x, dim=1))
+
+    report = {
+        "quantize": quantize,
+        "channels_last": channels_last,
+        "inputs": f"{len(parity_paths)} images from {parity_dir}" if parity_paths else "random tensors",
+        "models": {},
+    }
+    for name, (model, preprocess, activation) in targets.items():
+        parity_batches = _batches(preprocess, parity_paths, batch_size, fallback)
+        calibration = _batches(preprocess, calibration_paths, batch_size, fallback)
+        example = parity_batches[0][:1]
+        entries = manifest["models"].setdefault(name, {})
+        for fmt in formats:
+            out = output_dir / f"{name}.{'pt' if fmt == 'torchscript' else 'onnx'}"
+            logger.info("Exporting %s model to %s (quantize=%s, channels_last=%s)", name, out, quantize, channels_last)
+            if fmt == "torchscript":
+                _export_torchscript(model, example, out, quantize, calibration, channels_last)
+            else:
+                _export_onnx(model, example, out, quantize, calibration)
+            entries[fmt] = {
+                "file": out.name,
+                "quantize": quantize,
+                "channels_last": channels_last and fmt == "torchscript",
+                "input_shape": list(example.shape[1:]),
+            }
+            runner = _torchscript_runner(out) if fmt == "torchscript" else _onnx_runner(out)
+            exported = ExportedModule(runner, channels_last=entries[fmt]["channels_last"], description=out.name)
+            result = _parity(model, exported, parity_batches, activation)
+            result["file_mb"] = round(out.stat().st_size / 2**20, 2)
+            report["models"].setdefault(name, {})[fmt] = result
+
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    (output_dir / PARITY_REPORT).write_text(json.dumps(report, indent=2))
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export the image models to TorchScript/ONNX.")
+    parser.add_argument("--format", choices=["torchscript", "onnx", "both"], default="torchscript")
+    parser.add_argument("--quantize", choices=["none", "dynamic", "static"], default="none")
+    parser.add_argument("--channels-last", action="store_true", help="use channels_last layout (TorchScript)")
+    parser.add_argument("--models", nargs="+", choices=["bite", "species"], default=["bite", "species"])
+    parser.add_argument("--parity-dir", help="folder of sample images for the parity report")
+    parser.add_argument("--calibration-dir", help="folder of images for static quantization (defaults to --parity-dir)")
+    parser.add_argument("--output-dir", help=f"defaults to MODEL_EXPORT_DIR or {DEFAULT_EXPORT_DIR}")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--min-agreement", type=float, default=0.0,
+                        help="exit non-zero if any export's top-1 agreement falls below this")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    formats = ["torchscript", "onnx"] if args.format == "both" else [args.format]
+    if "onnx" in formats:
+        missing = [name for name in ("onnx", "onnxruntime") if importlib.util.find_spec(name) is None]
+        if missing:
+            print(
+                f"--format {args.format} needs {' and '.join(missing)}: pip install onnx onnxruntime "
+                "(or export with --format torchscript)",
+                file=sys.stderr,
+            )
+            return 2
+    report = export_models(
+        formats,
+        quantize=args.quantize,
+        channels_last=args.channels_last,
+        names=args.models,
+        parity_dir=args.parity_dir,
+        calibration_dir=args.calibration_dir,
+        output_dir=args.output_dir,
+        batch_size=args.batch_size,
+    )
+    print(json.dumps(report, indent=2))
+    worst = min(r["top1_agreement"] for m in report["models"].values() for r in m.values())
+    return 1 if worst < args.min_agreement else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,23 @@
-import torch
-from torchvision import models, transforms
+"""Model and data loading for the API.
+
+torch, torchvision, fastai, llama_cpp and pandas are imported inside the
+functions that need them, so importing this module (and starting the web
+server) is cheap. Each artifact has its own loader so the server can load
+them concurrently and start serving as soon as any one is ready.
+"""
+
+import copy
 import os
-import warnings
-from typing import Optional
-import torch
-from torchvision import models, transforms
-from fastai.vision.all import load_learner, PILImage
-try:
-    from llama_cpp import Llama
-except Exception:
-    Llama = None
-import pandas as pd
 import pathlib
+import warnings
 from pathlib import Path
+from typing import Optional
+
+from src.image_utils import images_to_batch, open_rgb
 
-# Fix PosixPath issue on Windows for fastai
-pathlib.PosixPath = pathlib.WindowsPath
+# Fix PosixPath issue on Windows for fastai (learners pickled on Linux)
+if os.name == "nt":
+    pathlib.PosixPath = pathlib.WindowsPath
 
 
 def _resolve_path(env_var: str, default: str, required: bool = True) -> Optional[Path]:
@@ -53,70 +55,149 @@ def _resolve_path(env_var: str, default: str, required: bool = True) -> Optional
     return None
 
 
-def load_models(
-    snake_model_path_env: str = "SNAKE_MODEL_PATH",
-    bite_model_path_env: str = "BITE_MODEL_PATH",
-    species_csv_env: str = "SPECIES_CSV",
-    treatment_xlsx_env: str = "TREATMENT_XLSX",
-    llm_model_env: str = "LLM_MODEL_PATH",
-) -> tuple:
-    """Load models and data files used by the API.
-    
-    Default paths (if not set in environment):
-    - Snake classification model: models/snake_bite_best_densenet.pth
-    - Bite detection model: models/model.pkl
-    - Species data: archive/species.csv
-    - Treatment data: archive/snakebite_treatment_aid_100species.csv.xlsx
-    - LLM model: optional, set via LLM_MODEL_PATH
-    
-    All relative paths are resolved relative to the project root directory.
-    """
-    """Load models and data used by the API.
+# Default paths relative to project root
+DEFAULT_SNAKE_MODEL = "models/model.pkl"
+DEFAULT_BITE_MODEL = "models/snake_bite_best_densenet.pth"
+DEFAULT_SPECIES_CSV = "archive/species.csv"
+DEFAULT_TREATMENT_XLSX = "archive/snakebite_treatment_aid_100species.csv.xlsx"
+DEFAULT_LLM_MODEL = "models/mistral-7b-instruct-v0.2.Q4_K_M.gguf"  # Optional - Mistral 7B Instruct (Q4 quantized, ~4GB)
 
-    Paths can be overridden with environment variables. The LLM is optional
-    and will be set to None if its model file is missing or the llama_cpp
-    package isn't installed.
-    """
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.debug("Starting model loading...")
-    # Default paths relative to project root
-    default_snake = "models/model.pkl"
-    default_bite = "models/snake_bite_best_densenet.pth"
-    default_species = "archive/species.csv"
-    default_treatment = "archive/snakebite_treatment_aid_100species.csv.xlsx"
-    default_llm = "models/mistral-7b-instruct-v0.2.Q4_K_M.gguf"  # Optional - Mistral 7B Instruct (Q4 quantized, ~4GB)
-
-    # ------------------- Snake Classifier (FastAI) -------------------
-    snake_model_path = _resolve_path(snake_model_path_env, default_snake, required=True)
-    snake_model = load_learner(snake_model_path)
-
-    # ------------------- Bite Classifier (Densenet PyTorch) -------------------
-    bite_model_path = _resolve_path(bite_model_path_env, default_bite, required=True)
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+def species_model_path(snake_model_path_env: str = "SNAKE_MODEL_PATH") -> Path:
+    """Resolve the fastai species model path (used by process-pool workers)."""
+    return _resolve_path(snake_model_path_env, DEFAULT_SNAKE_MODEL, required=True)
+
+
+def bite_model_path(bite_model_path_env: str = "BITE_MODEL_PATH") -> Path:
+    """Resolve the DenseNet bite model checkpoint path."""
+    return _resolve_path(bite_model_path_env, DEFAULT_BITE_MODEL, required=True)
+
+
+def load_learner(model_path):
+    """fastai's load_learner, imported on first use."""
+    from fastai.vision.all import load_learner as fastai_load_learner
+
+    return fastai_load_learner(model_path)
+
+
+def load_bite_model(model_path, device=None):
+    """Build the DenseNet-121 bite classifier and load its checkpoint."""
+    import torch
+    from torchvision import models
+
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     bite_model = models.densenet121(pretrained=False)
     num_features = bite_model.classifier.in_features
     bite_model.classifier = torch.nn.Linear(num_features, 2)  # NonVenomous / Venomous
 
     # Load checkpoint safely
-    checkpoint = torch.load(str(bite_model_path), map_location=device)
+    checkpoint = torch.load(str(model_path), map_location=device)
     if isinstance(checkpoint, dict) and "model" in checkpoint:
         bite_model.load_state_dict(checkpoint["model"])
     else:
         bite_model.load_state_dict(checkpoint)
     bite_model.to(device)
     bite_model.eval()
+    return bite_model
+
+
+def load_species_classifier(snake_model_path_env: str = "SNAKE_MODEL_PATH"):
+    """Load the species model configured for this server (see load_species_model)."""
+    return load_species_model(species_model_path(snake_model_path_env))
+
+
+def load_bite_classifier(bite_model_path_env: str = "BITE_MODEL_PATH"):
+    """Load the bite model, using the MODEL_BACKEND export when one is available."""
+    # MODEL_BACKEND=torchscript|onnx swaps in networks built by src.model_export
+    from src.model_export import load_exported_model, model_backend
+
+    backend = model_backend()
+    bite_model = load_exported_model("bite", backend) if backend != "eager" else None
+    if bite_model is None:
+        bite_model = load_bite_model(bite_model_path(bite_model_path_env))
+    return bite_model
+
+
+def _file_stamp(path: Optional[Path]) -> str:
+    if path is None or not Path(path).exists():
+        return "-"
+    stat = Path(path).stat()
+    return f"{Path(path).name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def prediction_model_tag(kind: str) -> str:
+    """Identity of the species/bite model being served: backend, model file and export manifest stamps.
+
+    Used to scope cached predictions so a model update never serves old results.
+    """
+    from src.model_export import MANIFEST, export_dir, model_backend
+
+    backend = model_backend()
+    try:
+        path = species_model_path() if kind == "species" else bite_model_path()
+    except FileNotFoundError:
+        path = None  # served from an export only
+    parts = [kind, backend, _file_stamp(path)]
+    if backend != "eager":
+        parts.append(_file_stamp(export_dir() / MANIFEST))
+    if kind == "species":
+        parts.append("lean" if os.getenv("LEAN_INFERENCE", "1") != "0" else "learner")
+    return "|".join(parts)
+
+
+def data_source_paths(species_csv_env: str = "SPECIES_CSV", treatment_xlsx_env: str = "TREATMENT_XLSX") -> tuple:
+    """Resolved (species CSV, treatment workbook) paths; either may be None if missing."""
+    return (
+        _resolve_path(species_csv_env, DEFAULT_SPECIES_CSV, required=False),
+        _resolve_path(treatment_xlsx_env, DEFAULT_TREATMENT_XLSX, required=False),
+    )
+
+
+def read_species_csv(path):
+    import pandas as pd
 
-    # ------------------- Species Metadata & Treatment -------------------
-    species_csv = _resolve_path(species_csv_env, default_species, required=True)
-    treatment_xlsx = _resolve_path(treatment_xlsx_env, default_treatment, required=True)
+    return pd.read_csv(path)
+
+
+def read_treatment_xlsx(path):
+    import pandas as pd
 
-    species_df = pd.read_csv(species_csv)
     # read_excel may need openpyxl engine
-    treatment_df = pd.read_excel(treatment_xlsx)
+    return pd.read_excel(path)
+
+
+def load_species_data(species_csv_env: str = "SPECIES_CSV"):
+    """Read the species metadata CSV into a DataFrame (via its Arrow snapshot when current)."""
+    from src.data_snapshot import load_with_snapshot
+
+    return load_with_snapshot(_resolve_path(species_csv_env, DEFAULT_SPECIES_CSV, required=True), read_species_csv)
+
+
+def load_treatment_data(treatment_xlsx_env: str = "TREATMENT_XLSX"):
+    """Read the treatment workbook into a DataFrame (via its Arrow snapshot when current)."""
+    from src.data_snapshot import load_with_snapshot
+
+    return load_with_snapshot(
+        _resolve_path(treatment_xlsx_env, DEFAULT_TREATMENT_XLSX, required=True), read_treatment_xlsx
+    )
 
-    # ------------------- LLaMA/Mistral LLM (optional) -------------------
-    llm_model = _resolve_path(llm_model_env, default_llm, required=False)
+
+def load_llm(llm_model_env: str = "LLM_MODEL_PATH", llm_threads: Optional[int] = None, n_ctx: Optional[int] = None):
+    """Load the optional llama.cpp model, or return None when it is unavailable.
+
+    llm_threads is the llama.cpp thread budget from the CPU plan (see
+    src.cpu_budget); without it up to six threads are used. n_ctx pins the
+    context size instead of trying 4096, 2048 and 1024 in turn.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    try:
+        from llama_cpp import Llama
+    except Exception:
+        Llama = None
+
+    llm_model = _resolve_path(llm_model_env, DEFAULT_LLM_MODEL, required=False)
     
     llm = None
     if llm_model and Llama is not None:
@@ -124,11 +205,12 @@ def load_models(
         # chance of success on machines with limited memory or CPU.
         logger.info(f"Attempting to load LLM from {llm_model}")
         cpu_count = max(1, os.cpu_count() or 1)
+        threads = llm_threads if llm_threads else min(6, cpu_count)
         attempts = [
-            (4096, min(6, cpu_count)),
-            (2048, min(4, cpu_count)),
+            (4096, threads),
+            (2048, min(4, threads)),
             (1024, 1),
-        ]
+        ] if n_ctx is None else [(n_ctx, threads)]
         last_exc = None
         for n_ctx, n_threads in attempts:
             try:
@@ -137,6 +219,8 @@ def load_models(
                     model_path=str(llm_model),
                     n_ctx=n_ctx,
                     n_threads=n_threads,
+                    # llama.cpp defaults prompt evaluation to every core
+                    n_threads_batch=n_threads,
                     n_batch=512,
                     verbose=True,  # Enable verbose to see loading details
                 )
@@ -154,38 +238,290 @@ def load_models(
             logger.warning("llama_cpp package not available; LLM functionality disabled")
         elif not llm_model:
             logger.info("No LLM model path configured; LLM functionality disabled")
+    return llm
+
+
+def llm_metadata(llm_model_env: str = "LLM_MODEL_PATH") -> Optional[dict]:
+    """GGUF metadata of the configured LLM, read without loading its weights."""
+    try:
+        from llama_cpp import Llama
+    except Exception:
+        return None
+    llm_model = _resolve_path(llm_model_env, DEFAULT_LLM_MODEL, required=False)
+    if llm_model is None:
+        return None
+    probe = Llama(model_path=str(llm_model), vocab_only=True, verbose=False)
+    try:
+        return dict(probe.metadata)
+    finally:
+        if hasattr(probe, "close"):
+            probe.close()
 
+
+def llm_context_bytes(metadata: dict, n_ctx: int, overhead_mb: float = 256) -> int:
+    """Memory one llama.cpp context needs beyond the shared weights.
+
+    The f16 KV cache is 2 (K and V) x layers x n_ctx x the key/value width,
+    which is narrower than the embedding under grouped-query attention; the
+    compute buffers are covered by overhead_mb.
+    """
+    arch = metadata.get("general.architecture", "llama")
+    n_layer = int(metadata[f"{arch}.block_count"])
+    n_embd = int(metadata[f"{arch}.embedding_length"])
+    n_head = int(metadata.get(f"{arch}.attention.head_count", 1))
+    n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+    kv_width = n_embd * n_head_kv // max(1, n_head)
+    return 2 * n_layer * n_ctx * kv_width * 2 + int(overhead_mb * 1024 * 1024)
+
+
+def available_memory_bytes() -> Optional[int]:
+    """Physical memory currently available, where the platform reports it."""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def load_llm_pool(
+    size: int,
+    memory_budget: Optional[int] = None,
+    llm_model_env: str = "LLM_MODEL_PATH",
+    llm_threads: Optional[int] = None,
+) -> list:
+    """Load up to size llama.cpp instances of the same GGUF for concurrent generation.
+
+    Every instance memory-maps the same file, so the weights are held once
+    in the page cache while each instance has its own context and KV cache.
+    The pool shrinks to what memory_budget (bytes; default half the
+    available memory before loading) fits, at llm_context_bytes per context
+    for the n_ctx the first instance actually loaded with, and llm_threads
+    is split between the instances. Returns an empty list when no LLM is
+    configured.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+
+    size = max(1, size)
+    metadata = None
+    if size > 1:
+        try:
+            metadata = llm_metadata(llm_model_env)
+        except Exception as e:
+            logger.warning(f"Could not read LLM metadata, loading a single instance: {e}")
+        if metadata is None:
+            size = 1
+        elif memory_budget is None:
+            available = available_memory_bytes()
+            memory_budget = available // 2 if available else None
+
+    threads = llm_threads if llm_threads else min(6, max(1, os.cpu_count() or 1))
+    per_instance = max(1, threads // size)
+    first = load_llm(llm_model_env, per_instance)
+    if first is None:
+        return []
+    n_ctx = first.n_ctx()
+
+    if size > 1 and memory_budget is not None:
+        # load_llm may have fallen back to a smaller context than 4096; size the pool for that one.
+        per_context = llm_context_bytes(metadata, n_ctx, float(os.getenv("LLM_CONTEXT_OVERHEAD_MB", "256")))
+        fits = max(1, memory_budget // per_context)
+        if fits < size:
+            logger.warning(
+                f"LLM pool limited to {fits} of {size} instances by the "
+                f"{memory_budget / 2**20:.0f} MB budget ({per_context / 2**20:.0f} MB per context at n_ctx={n_ctx})"
+            )
+            size = fits
+            if max(1, threads // size) != per_instance:
+                # The first instance was given a thread share for the larger pool; reload it with its real share.
+                per_instance = max(1, threads // size)
+                del first
+                first = load_llm(llm_model_env, per_instance, n_ctx=n_ctx)
+                if first is None:
+                    return []
+
+    pool = [first]
+    for _ in range(size - 1):
+        llm = load_llm(llm_model_env, per_instance, n_ctx=n_ctx)
+        if llm is None:
+            break
+        pool.append(llm)
+    logger.info(f"LLM pool: {len(pool)} instance(s), n_ctx={n_ctx}, {per_instance} thread(s) each")
+    return pool
+
+
+def load_models(
+    snake_model_path_env: str = "SNAKE_MODEL_PATH",
+    bite_model_path_env: str = "BITE_MODEL_PATH",
+    species_csv_env: str = "SPECIES_CSV",
+    treatment_xlsx_env: str = "TREATMENT_XLSX",
+    llm_model_env: str = "LLM_MODEL_PATH",
+    llm_threads: Optional[int] = None,
+) -> tuple:
+    """Load models and data files used by the API, one after another.
+    
+    Default paths (if not set in environment):
+    - Snake classification model: models/model.pkl
+    - Bite detection model: models/snake_bite_best_densenet.pth
+    - Species data: archive/species.csv
+    - Treatment data: archive/snakebite_treatment_aid_100species.csv.xlsx
+    - LLM model: optional, set via LLM_MODEL_PATH
+    
+    All relative paths are resolved relative to the project root directory.
+    The LLM is optional and will be set to None if its model file is missing
+    or the llama_cpp package isn't installed. The server loads the same
+    artifacts concurrently instead (see app.startup_event).
+    """
+    snake_model = load_species_classifier(snake_model_path_env)
+    bite_model = load_bite_classifier(bite_model_path_env)
+    species_df = load_species_data(species_csv_env)
+    treatment_df = load_treatment_data(treatment_xlsx_env)
+    llm = load_llm(llm_model_env, llm_threads)
     return snake_model, bite_model, species_df, treatment_df, llm
 
 
+def warmup_image_model(predict_batch, model, size: int = 224) -> None:
+    """Run one blank image through a model so the first real request is not slow."""
+    from PIL import Image
+
+    predict_batch(model, [Image.new("RGB", (size, size), (128, 128, 128))])
+
+
+def warmup_llm(llm) -> None:
+    """Generate one token to fault in the mmap'd weights."""
+    llm("Hello", max_tokens=1)
+
+
 # ------------------------------- Helper Functions -------------------------------
 
 
+class SpeciesPipeline:
+    """Raw torch module and exact inference transforms pulled out of a fastai Learner.
+
+    Learner.predict builds a DataLoader per call and runs it through
+    get_preds; this applies the same validation item/batch transforms,
+    loss activation and decoding directly, running the module under
+    torch.inference_mode.
+    """
+
+    def __init__(self, learner):
+        import torch
+        from fastai.data.load import fa_collate
+        from fastai.torch_core import to_device
+        from fastai.vision.core import PILImage
+
+        self._collate = fa_collate
+        self._to_device = to_device
+        self._torch = torch
+        self._pil_image = PILImage
+        dl = learner.dls.valid
+        self.model = learner.model.eval()
+        # Private copies pinned to the validation split so random transforms
+        # (e.g. Resize's crop position) behave exactly as in get_preds.
+        self.after_item = copy.copy(dl.after_item)
+        self.after_batch = copy.copy(dl.after_batch)
+        self.after_item.split_idx = self.after_batch.split_idx = 1
+        self.device = learner.dls.device
+        self.vocab = learner.dls.vocab
+        self.activation = getattr(learner.loss_func, "activation", lambda x: x)
+        self.decodes = getattr(learner.loss_func, "decodes", lambda x: x)
+
+    def preprocess(self, images):
+        """Apply the learner's item and batch transforms, returning the model input batch."""
+        items = [self.after_item((self._pil_image.create(open_rgb(img)),)) for img in images]
+        return self.after_batch(self._to_device(self._collate(items), self.device))[0]
+
+    def predict_batch(self, images) -> list:
+        """Return (pred_class, pred_idx, probs) per image, like Learner.predict."""
+        batch = self.preprocess(images)
+        with self._torch.inference_mode():
+            probs = self.activation(self.model(batch))
+            decoded = self.decodes(probs)
+        return [(int(self.vocab[int(idx)]), idx, p) for p, idx in zip(probs, decoded)]
+
+
+def load_species_model(model_path, lean: Optional[bool] = None):
+    """Load the fastai species learner, wrapped in a SpeciesPipeline unless LEAN_INFERENCE=0.
+
+    With MODEL_BACKEND=torchscript|onnx the pipeline's network is replaced
+    by the exported one from src.model_export; the fastai transforms still
+    come from the learner.
+    """
+    from src.model_export import load_exported_model, model_backend
+
+    learner = load_learner(model_path)
+    if lean is None:
+        lean = os.getenv("LEAN_INFERENCE", "1") != "0"
+    backend = model_backend()
+    if not lean:
+        if backend != "eager":
+            warnings.warn(f"MODEL_BACKEND={backend} needs LEAN_INFERENCE for the species model; using eager")
+        return learner
+    pipeline = SpeciesPipeline(learner)
+    exported = load_exported_model("species", backend) if backend != "eager" else None
+    if exported is not None:
+        pipeline.model = exported
+    return pipeline
+
+
 def predict_species(snake_model, uploaded_file):
+    if isinstance(snake_model, SpeciesPipeline):
+        return snake_model.predict_batch([uploaded_file])[0]
+    from fastai.vision.all import PILImage
+
     img = PILImage.create(uploaded_file)
     pred_class, pred_idx, probs = snake_model.predict(img)
     return int(pred_class), pred_idx, probs
 
 
+def predict_species_batch(snake_model, uploaded_files) -> list:
+    """Predict species for several images with a single forward pass.
+
+    Accepts file-like objects, bytes or PIL images. Returns a list of
+    (pred_class, pred_idx, probs) tuples in input order, matching the
+    output of predict_species for each image.
+    """
+    if isinstance(snake_model, SpeciesPipeline):
+        return snake_model.predict_batch(uploaded_files)
+    from fastai.vision.all import PILImage
+
+    items = [PILImage.create(open_rgb(f)) for f in uploaded_files]
+    dl = snake_model.dls.test_dl(items, num_workers=0)
+    with snake_model.no_bar():
+        probs, _, decoded = snake_model.get_preds(dl=dl, with_decoded=True)
+    vocab = snake_model.dls.vocab
+    return [(int(vocab[int(idx)]), idx, p) for p, idx in zip(probs, decoded)]
+
+
+def _model_device(model):
+    """Device of a model's parameters; CPU for exported runtimes without any."""
+    import torch
+
+    param = next(iter(model.parameters()), None)
+    return param.device if param is not None else torch.device("cpu")
+
+
 def predict_bite(bite_model, uploaded_file):
     """Predict whether bite image indicates poisonous or non-poisonous bite."""
-    from PIL import Image
+    return predict_bite_batch(bite_model, [uploaded_file])[0]
+
+
+def predict_bite_batch(bite_model, uploaded_files) -> list:
+    """Predict several bite images with a single forward pass.
+
+    Accepts file-like objects, bytes or PIL images. Preprocessing is
+    vectorized over the whole batch (see images_to_batch). Returns a list
+    of (label, confidence) tuples in input order.
+    """
+    import torch
 
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
-    ])
-    img = Image.open(uploaded_file).convert("RGB")
-    input_tensor = transform(img).unsqueeze(0)
-    device = next(bite_model.parameters()).device
-    input_tensor = input_tensor.to(device)
+    batch = torch.from_numpy(images_to_batch(uploaded_files))
+    batch = batch.to(_model_device(bite_model))
 
     with torch.no_grad():
-        output = bite_model(input_tensor)
-        probs = torch.softmax(output, dim=1)
-        class_idx = torch.argmax(probs, dim=1).item()
-        confidence = probs[0, class_idx].item()
+        probs = torch.softmax(bite_model(batch), dim=1)
+        confidences, class_idxs = probs.max(dim=1)
 
-    label = "Venomous" if class_idx == 1 else "NonVenomous"
-    return label, confidence
+    return [
+        ("Venomous" if idx == 1 else "NonVenomous", conf)
+        for idx, conf in zip(class_idxs.tolist(), confidences.tolist())
+    ]
@@ -0,0 +1,245 @@
+"""Chat prompt assembly within the LLM's context window.
+
+load_llm may fall back to a 2048- or 1024-token context, while a chat
+prompt carries the system prompt, the species/treatment context, recent
+history and the new message, and then asks for up to 1024 new tokens.
+PromptBuilder counts tokens with the loaded model's tokenizer and fits the
+parts into ``n_ctx``:
+
+* the system prompt and the user's message are always kept (an oversized
+  message is truncated);
+* generation is reserved ``generation_share`` of the window up front and
+  gets whatever is left over after assembly, up to the requested
+  max_tokens;
+* the context block gets ``context_share`` of the remaining space (more if
+  history does not need its part), losing its last lines first;
+* history fills the rest newest-first; older exchanges are dropped and the
+  oldest kept one may have its reply shortened;
+* if the assembled prompt still leaves fewer than ``min_generation``
+  tokens to generate (the parts tokenize longer together, or the system
+  prompt alone nearly fills the window), history and then context are
+  dropped. max_tokens is never below 1: llama.cpp reads ``max_tokens <= 0``
+  as "until the context is full".
+
+Without a tokenizer (no LLM loaded) tokens are estimated from characters.
+"""
+
+import functools
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import List, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token for English text, used when no tokenizer is available.
+_CHARS_PER_TOKEN = 4
+# Shortest reply excerpt worth keeping from a trimmed history exchange.
+_MIN_HISTORY_TOKENS = 24
+# Fewest new tokens a chat reply is given before history and context are sacrificed.
+_MIN_GENERATION_TOKENS = 32
+
+
+class Tokenizer:
+    """Token counts and truncation with a llama.cpp model's vocabulary."""
+
+    def __init__(self, llm=None, cache_size: int = 4096):
+        self.llm = llm
+        # System prompt, context lines and history repeat across requests.
+        self.count = functools.lru_cache(maxsize=cache_size)(self.count_uncached)
+
+    def _tokens(self, text: str) -> List[int]:
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=False)
+
+    def count_uncached(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.llm is None:
+            return -(-len(text) // _CHARS_PER_TOKEN)
+        return len(self._tokens(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest start of text within max_tokens (including a trailing ellipsis)."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.llm is None:
+            return text[: max(0, (max_tokens - 1) * _CHARS_PER_TOKEN)].rstrip() + "…"
+        tokens = self._tokens(text)[: max_tokens - 1]
+        return self.llm.detokenize(tokens).decode("utf-8", errors="ignore").rstrip() + "…"
+
+
+@dataclass
+class BuiltPrompt:
+    prompt: str
+    max_tokens: int
+    accounting: dict = field(default_factory=dict)
+
+
+class PromptBuilder:
+    """Fit system prompt, context, history and message into n_ctx tokens.
+
+    Args:
+        n_ctx: the model's context window.
+        tokenizer: Tokenizer for the loaded model.
+        generation_share: fraction of n_ctx reserved for the reply before
+            context and history are placed.
+        context_share: fraction of the remaining space the context block
+            may use before history gets its part.
+        reserve: tokens kept free for BOS and tokenizer boundary effects.
+        min_generation: smallest generation budget worth building a prompt for.
+    """
+
+    def __init__(
+        self,
+        n_ctx: int,
+        tokenizer: Tokenizer,
+        generation_share: float = 0.25,
+        context_share: float = 0.6,
+        reserve: int = 16,
+        min_generation: int = _MIN_GENERATION_TOKENS,
+    ):
+        self.n_ctx = n_ctx
+        self.tokenizer = tokenizer
+        self.generation_share = generation_share
+        self.context_share = context_share
+        self.reserve = reserve
+        self.min_generation = min_generation
+
+    @classmethod
+    def for_llm(cls, llm) -> "PromptBuilder":
+        """Builder for a loaded Llama (or None), configured by PROMPT_GENERATION_SHARE / PROMPT_CONTEXT_SHARE."""
+        n_ctx = llm.n_ctx() if llm is not None else int(os.getenv("PROMPT_DEFAULT_N_CTX", "4096"))
+        return cls(
+            n_ctx,
+            Tokenizer(llm),
+            generation_share=float(os.getenv("PROMPT_GENERATION_SHARE", "0.25")),
+            context_share=float(os.getenv("PROMPT_CONTEXT_SHARE", "0.6")),
+        )
+
+    def build(
+        self,
+        prefix: str,
+        context: str,
+        history: Sequence[Sequence[str]],
+        message: str,
+        max_tokens: int,
+    ) -> BuiltPrompt:
+        """Assemble ``{prefix}{context}\\n\\nRecent Conversation:...\\nUser: {message}\\nAssistant:``.
+
+        With enough room the result is identical to the untrimmed prompt.
+        """
+        wanted = max(1, min(max_tokens, self.min_generation))
+        built = self._assemble(prefix, context, history, message, max_tokens)
+        if built.max_tokens < wanted and history:
+            built = self._assemble(prefix, context, (), message, max_tokens)
+            built.accounting["history_dropped"] = len(history)
+        if built.max_tokens < wanted and context:
+            built = self._assemble(prefix, "", (), message, max_tokens)
+            built.accounting.update(history_dropped=len(history), context_lines_dropped=len(context.split("\n")))
+        if built.max_tokens < 1:
+            logger.warning(
+                "Prompt of %d tokens leaves no room to generate in n_ctx=%d; asking for 1 token",
+                built.accounting["prompt"],
+                self.n_ctx,
+            )
+            built.max_tokens = built.accounting["max_tokens"] = 1
+        return built
+
+    def _assemble(
+        self,
+        prefix: str,
+        context: str,
+        history: Sequence[Sequence[str]],
+        message: str,
+        max_tokens: int,
+    ) -> BuiltPrompt:
+        count = self.tokenizer.count
+        available = self.n_ctx - self.reserve
+        generation_floor = min(max_tokens, int(self.n_ctx * self.generation_share))
+
+        system_tokens = count(prefix)
+        message_budget = max(0, available - generation_floor - system_tokens - 8)
+        if count(message) > message_budget:
+            message = self.tokenizer.truncate(message, message_budget)
+        tail = f"\nUser: {message}\nAssistant:"
+        fixed = system_tokens + count(tail)
+        free = max(0, available - generation_floor - fixed)
+
+        # Context first, up to its share (or everything history does not need).
+        history_wanted = sum(count(f"User: {user}\nAssistant: {reply}\n") for user, reply in history)
+        if history:
+            history_wanted += count("Recent Conversation:\n")
+        context_budget = max(int(free * self.context_share), free - history_wanted)
+        context_text, context_tokens, dropped_lines = self._fit_context(context, context_budget)
+        history_budget = free - context_tokens - count("\n\n")
+        history_text, history_tokens, kept, shortened = self._fit_history(history, history_budget)
+
+        prompt = f"{prefix}{context_text}\n\n{history_text}{tail}"
+        # Parts tokenize slightly differently on their own; count the real prompt (uncached).
+        prompt_tokens = self.tokenizer.count_uncached(prompt)
+        generation = max(0, min(max_tokens, available - prompt_tokens))
+        accounting = {
+            "n_ctx": self.n_ctx,
+            "prompt": prompt_tokens,
+            "system": system_tokens,
+            "context": context_tokens,
+            "context_lines_dropped": dropped_lines,
+            "history": history_tokens,
+            "history_kept": kept,
+            "history_dropped": len(history) - kept,
+            "history_shortened": shortened,
+            "message": count(tail),
+            "max_tokens": generation,
+            "requested_max_tokens": max_tokens,
+        }
+        return BuiltPrompt(prompt, generation, accounting)
+
+    def _fit_context(self, context: str, budget: int):
+        """Keep context lines in order until the budget runs out; returns (text, tokens, dropped)."""
+        count = self.tokenizer.count
+        if count(context) <= budget:
+            return context, count(context), 0
+        lines = context.split("\n")
+        kept: List[str] = []
+        used = 0
+        for line in lines:
+            cost = count(line) + 1
+            if used + cost > budget:
+                excerpt = self.tokenizer.truncate(line, budget - used - 1)
+                if excerpt:
+                    kept.append(excerpt)
+                    used += count(excerpt) + 1
+                break
+            kept.append(line)
+            used += cost
+        text = "\n".join(kept)
+        return text, count(text), len(lines) - len(kept)
+
+    def _fit_history(self, history: Sequence[Sequence[str]], budget: int):
+        """Newest exchanges first; returns (text, tokens, exchanges kept, whether one was shortened)."""
+        count = self.tokenizer.count
+        header = "Recent Conversation:\n"
+        if not history or budget <= count(header) + _MIN_HISTORY_TOKENS:
+            return "", 0, 0, False
+        used = count(header)
+        kept: List[str] = []
+        shortened = False
+        for user, reply in reversed(history):
+            entry = f"User: {user}\nAssistant: {reply}\n"
+            cost = count(entry)
+            if used + cost > budget:
+                room = budget - used - count(f"User: {user}\nAssistant: \n")
+                if room >= _MIN_HISTORY_TOKENS:
+                    entry = f"User: {user}\nAssistant: {self.tokenizer.truncate(reply, room)}\n"
+                    kept.append(entry)
+                    used += count(entry)
+                    shortened = True
+                break
+            kept.append(entry)
+            used += cost
+        if not kept:
+            return "", 0, 0, False
+        text = header + "".join(reversed(kept))
+        return text, count(text), len(kept), shortened
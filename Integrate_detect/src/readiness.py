@@ -0,0 +1,67 @@
+"""Per-artifact load status reported by the /ready endpoint.
+
+Models and data files load concurrently in the background after the server
+starts, so each endpoint checks only the artifacts it needs instead of
+waiting for everything (notably the multi-GB LLM).
+"""
+
+import time
+from typing import Dict, Iterable, Optional
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"  # optional artifact that is not configured or was skipped
+
+
+class ModelStatus:
+    """Load state, timings and errors for a fixed set of named artifacts.
+
+    Args:
+        names: artifacts to track.
+        optional: artifacts the server is considered ready without (their
+            failure or absence only disables a feature).
+    """
+
+    def __init__(self, names: Iterable[str], optional: Iterable[str] = ()):
+        self.optional = set(optional)
+        self._entries: Dict[str, dict] = {name: {"state": PENDING} for name in names}
+
+    def loading(self, name: str) -> None:
+        self._entries[name] = {"state": LOADING, "started": time.time()}
+
+    def ready(self, name: str, warmup_ms: Optional[float] = None) -> None:
+        entry = self._entries[name]
+        entry["state"] = READY
+        if "started" in entry:
+            entry["load_seconds"] = round(time.time() - entry["started"], 3)
+        if warmup_ms is not None:
+            entry["warmup_ms"] = round(warmup_ms, 1)
+
+    def failed(self, name: str, error: str) -> None:
+        entry = self._entries[name]
+        entry["state"] = FAILED
+        entry["error"] = error
+
+    def disabled(self, name: str, reason: str) -> None:
+        self._entries[name] = {"state": DISABLED, "reason": reason}
+
+    def state(self, name: str) -> str:
+        return self._entries[name]["state"]
+
+    def is_ready(self, name: str) -> bool:
+        return self.state(name) == READY
+
+    def is_loading(self, name: str) -> bool:
+        return self.state(name) in (PENDING, LOADING)
+
+    def all_ready(self) -> bool:
+        """True once every required artifact is ready."""
+        return all(e["state"] == READY for n, e in self._entries.items() if n not in self.optional)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            name: {k: v for k, v in entry.items() if k != "started"}
+            for name, entry in self._entries.items()
+        }
@@ -0,0 +1,220 @@
+"""Region -> species lookup that tolerates typos in free-text locations.
+
+Every country and continent named in the species table (plus a few common
+alternative names) becomes a normalized place key. Queries such as
+"rural Kerala, Sri Lnaka" are split into word n-grams, which are matched
+against the keys exactly or, for names of six letters or more, within a
+small edit distance using a symmetric-delete index. Shorter names must
+match exactly: one edit turns Iraq into Iran, Bali into Mali and "woman"
+into Oman, and a wrong place puts another country's snakes into the chat
+context. A phrase that ends a continent/region name also matches it, as
+the old substring search did: "Asia" covers "Southeast Asia" and "Latin
+America" the Americas. Lookups touch only the n-grams of the query and the
+deletes of each, so their cost does not depend on the number of species.
+Results are ranked venomous first, then exact place matches ahead of fuzzy
+ones, then by binomial name, so the order no longer depends on CSV row
+order.
+"""
+
+import heapq
+import re
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+
+# Alternative names seen in field reports -> the place name used in species.csv.
+# An alias is only indexed when its target occurs in the data.
+REGION_ALIASES = {
+    "usa": "united states",
+    "united states of america": "united states",
+    "uk": "united kingdom",
+    "britain": "united kingdom",
+    "great britain": "united kingdom",
+    "ceylon": "sri lanka",
+    "burma": "myanmar",
+    "siam": "thailand",
+    "persia": "iran",
+    "holland": "netherlands",
+    "ivory coast": "cote d ivoire",
+    "drc": "democratic republic of the congo",
+    "congo kinshasa": "democratic republic of the congo",
+    "png": "papua new guinea",
+    "uae": "united arab emirates",
+    "south east asia": "southeast asia",
+    "se asia": "southeast asia",
+}
+
+_SEPARATORS = re.compile(r"[,;/|()]+|\band\b")
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+# Maximum words in a place key that a query n-gram is compared against.
+_MAX_NGRAM = 4
+
+
+def normalize_place(text: Optional[str]) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def split_places(field: Optional[str]) -> List[str]:
+    """Split a country/continent cell such as "India, Sri Lanka" into normalized places."""
+    if not field:
+        return []
+    return [p for p in (normalize_place(part) for part in _SEPARATORS.split(str(field))) if p]
+
+
+def _max_distance(term: str) -> int:
+    """Edit distance tolerated for a term: none below six letters, more for long names."""
+    n = len(term.replace(" ", ""))
+    if n < 6:
+        return 0
+    return 1 if n < 10 else 2
+
+
+def _deletes(term: str, distance: int) -> Set[str]:
+    """All strings obtained by deleting up to distance characters from term."""
+    results = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {t[:i] + t[i + 1:] for t in frontier for i in range(len(t))}
+        results |= frontier
+    return results
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent swaps count once), capped at limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class RegionIndex:
+    """Inverted index from normalized place names to species records.
+
+    Args:
+        records: species records with ``country``, ``continent``,
+            ``poisonous`` and ``binomial_name`` fields.
+        aliases: alternative name -> canonical place name.
+    """
+
+    def __init__(self, records: Sequence[dict], aliases: Optional[Dict[str, str]] = None):
+        postings: Dict[str, List[dict]] = {}
+        regions: Set[str] = set()
+        for record in records:
+            continents = split_places(record.get("continent"))
+            regions.update(continents)
+            for place in dict.fromkeys(split_places(record.get("country")) + continents):
+                postings.setdefault(place, []).append(record)
+        for alias, target in (REGION_ALIASES if aliases is None else aliases).items():
+            alias, target = normalize_place(alias), normalize_place(target)
+            if target in postings and alias not in postings:
+                postings[alias] = postings[target]
+
+        # place -> species, already in ranked order
+        self.places: Dict[str, Tuple[dict, ...]] = {
+            place: tuple(sorted(species, key=self._rank_key)) for place, species in postings.items()
+        }
+        self._longest = max((len(place) for place in self.places), default=0)
+        # Trailing words of multi-word regions -> those regions ("asia" -> {"southeast asia"}).
+        self._region_tails: Dict[str, Tuple[str, ...]] = {}
+        for region in sorted(regions):
+            words = region.split()
+            for i in range(1, len(words)):
+                tail = " ".join(words[i:])
+                self._region_tails[tail] = self._region_tails.get(tail, ()) + (region,)
+        self._word_counts = {place.count(" ") + 1 for place in self.places}
+        self._word_counts |= {tail.count(" ") + 1 for tail in self._region_tails}
+        grouped: Dict[str, Set[str]] = {}
+        for place in self.places:
+            for variant in _deletes(place, _max_distance(place)):
+                grouped.setdefault(variant, set()).add(place)
+        self._deletes: Dict[str, FrozenSet[str]] = {k: frozenset(v) for k, v in grouped.items()}
+
+    @staticmethod
+    def _rank_key(record: dict, fuzzy: bool = False) -> tuple:
+        return (record.get("poisonous") != 1, fuzzy, str(record.get("binomial_name") or ""))
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def match_place(self, term: str) -> Optional[Tuple[str, int]]:
+        """Closest indexed place for a normalized term, as (place, distance), or None."""
+        if term in self.places:
+            return term, 0
+        limit = _max_distance(term)
+        if not limit or len(term) > self._longest + limit:
+            return None
+        candidates: Set[str] = set()
+        for variant in _deletes(term, limit):
+            candidates.update(self._deletes.get(variant, ()))
+        best = None
+        for place in candidates:
+            allowed = min(limit, _max_distance(place))
+            distance = _edit_distance(term, place, allowed)
+            if distance <= allowed and (best is None or (distance, place) < (best[1], best[0])):
+                best = (place, distance)
+        return best
+
+    def match(self, query: Optional[str]) -> List[Tuple[str, int]]:
+        """Places mentioned in a free-text location, longest phrases first, as (place, distance).
+
+        A phrase also yields, at distance 0, the regions it ends ("asia" ->
+        "southeast asia"); only whole trailing words count, so "south" does
+        not match "south america".
+        """
+        words = normalize_place(query).split()
+        used = [False] * len(words)
+        matches = []
+        for n in range(min(_MAX_NGRAM, len(words)), 0, -1):
+            if n not in self._word_counts:
+                continue
+            for start in range(len(words) - n + 1):
+                if any(used[start:start + n]):
+                    continue
+                term = " ".join(words[start:start + n])
+                found = self.match_place(term)
+                broader = self._region_tails.get(term, ())
+                if found is None and not broader:
+                    continue
+                if found is not None:
+                    matches.append(found)
+                matches.extend((region, 0) for region in broader)
+                used[start:start + n] = [True] * n
+        return matches
+
+    def lookup(self, query: Optional[str], limit: Optional[int] = None) -> List[dict]:
+        """Species found in the places named by query, venomous first."""
+        matches = self.match(query)
+        if len(matches) == 1:
+            species = self.places[matches[0][0]]
+            return list(species[:limit] if limit else species)
+        # Each place's list is already ranked; merge them lazily and stop at limit.
+        streams = [
+            ((self._rank_key(record, distance > 0), record) for record in self.places[place])
+            for place, distance in matches
+        ]
+        results: List[dict] = []
+        seen: Set[int] = set()
+        for _, record in heapq.merge(*streams, key=lambda item: item[0]):
+            if id(record) in seen:
+                continue
+            seen.add(id(record))
+            results.append(record)
+            if limit and len(results) >= limit:
+                break
+        return results
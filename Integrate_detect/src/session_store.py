@@ -0,0 +1,385 @@
+"""Conversation histories and per-user species context.
+
+Chat keeps, per conversation_id, the recent (message, reply) exchanges that
+go into the next prompt, and per user_id the species last identified for
+that user. Held in plain dicts these grow with every new id and are private
+to one worker process. SessionStore is the interface app.py uses; two
+implementations:
+
+* MemorySessionStore - LRU with an idle TTL and entry/byte bounds; each
+  history is a fixed-size ring (deque) of the last ``history_turns``
+  exchanges, which is all a prompt ever includes.
+* SQLiteSessionStore - the same semantics in a SQLite file (WAL), so
+  several worker processes behind one port share conversations.
+
+``SessionStore.from_env()`` picks the SQLite store when SESSION_STORE_PATH
+is set. Request handlers use the ``*_async`` methods: the memory store
+answers inline, the SQLite store runs its queries on a thread of its own
+so a busy database lock never stalls the event loop.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Exchange = Tuple[str, str]
+
+# Approximate per-entry bookkeeping (dict slot, deque, tuples) on top of the text itself.
+_ENTRY_OVERHEAD = 240
+_EXCHANGE_OVERHEAD = 120
+
+
+def _text_bytes(*texts: str) -> int:
+    return sum(len(t.encode("utf-8")) for t in texts)
+
+
+class SessionStore(ABC):
+    """Recent chat exchanges per conversation and last species per user.
+
+    Args:
+        history_turns: exchanges kept per conversation.
+        max_conversations / max_users: entries kept before the least recently
+            used are evicted.
+        ttl: seconds an entry may stay unused; 0 or None means no expiry.
+    """
+
+    def __init__(
+        self,
+        history_turns: int = 3,
+        max_conversations: int = 10_000,
+        max_users: int = 100_000,
+        ttl: Optional[float] = 86400.0,
+    ):
+        self.history_turns = max(1, int(history_turns))
+        self.max_conversations = max(1, int(max_conversations))
+        self.max_users = max(1, int(max_users))
+        self.ttl = float(ttl) if ttl else None
+        self.evictions = self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        """Configure from SESSION_* environment variables (SQLite when SESSION_STORE_PATH is set)."""
+        common = dict(
+            history_turns=int(os.getenv("SESSION_HISTORY_TURNS", "3")),
+            max_conversations=int(os.getenv("SESSION_MAX_CONVERSATIONS", "10000")),
+            max_users=int(os.getenv("SESSION_MAX_USERS", "100000")),
+            ttl=float(os.getenv("SESSION_TTL", "86400")),
+        )
+        path = os.getenv("SESSION_STORE_PATH")
+        if path:
+            return SQLiteSessionStore(path, **common)
+        return MemorySessionStore(max_bytes=int(float(os.getenv("SESSION_STORE_MB", "64")) * 1024 * 1024), **common)
+
+    @abstractmethod
+    def history(self, conv_id: str) -> List[Exchange]:
+        """Exchanges of a conversation, oldest first ([] for an unknown or expired id)."""
+
+    @abstractmethod
+    def append(self, conv_id: str, message: str, reply: str) -> None:
+        """Record an exchange; the oldest one drops out once history_turns are kept."""
+
+    @abstractmethod
+    def species(self, user_id: Optional[str]) -> Optional[str]:
+        """Species last identified for user_id, or None."""
+
+    @abstractmethod
+    def set_species(self, user_id: str, species_name: str) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+    async def _call(self, fn, *args):
+        """Run a store method for an async caller; stores doing blocking I/O override this."""
+        return fn(*args)
+
+    async def history_async(self, conv_id: str) -> List[Exchange]:
+        return await self._call(self.history, conv_id)
+
+    async def append_async(self, conv_id: str, message: str, reply: str) -> None:
+        await self._call(self.append, conv_id, message, reply)
+
+    async def species_async(self, user_id: Optional[str]) -> Optional[str]:
+        return await self._call(self.species, user_id)
+
+    async def set_species_async(self, user_id: str, species_name: str) -> None:
+        await self._call(self.set_species, user_id, species_name)
+
+
+class MemorySessionStore(SessionStore):
+    """In-process store: LRU + idle TTL, bounded by entries and approximate bytes.
+
+    max_bytes bounds the conversation histories (user entries are tiny and
+    bounded by max_users); ``stats()["bytes"]`` counts both.
+    """
+
+    def __init__(self, *args, max_bytes: int = 64 * 1024 * 1024, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_bytes = max(0, int(max_bytes))
+        # conv_id -> (ring of exchanges, bytes, last used)
+        self._conversations: "collections.OrderedDict[str, list]" = collections.OrderedDict()
+        # user_id -> (species, last used)
+        self._users: "collections.OrderedDict[str, Tuple[str, float]]" = collections.OrderedDict()
+        self._bytes = 0  # histories
+        self._user_bytes = 0
+        self._lock = threading.Lock()
+
+    def _expired(self, used: float, now: float) -> bool:
+        return self.ttl is not None and now - used > self.ttl
+
+    def history(self, conv_id: str) -> List[Exchange]:
+        now = time.time()
+        with self._lock:
+            entry = self._conversations.get(conv_id)
+            if entry is None:
+                return []
+            if self._expired(entry[2], now):
+                self._drop_conversation(conv_id)
+                self.expirations += 1
+                return []
+            entry[2] = now
+            self._conversations.move_to_end(conv_id)
+            return list(entry[0])
+
+    def append(self, conv_id: str, message: str, reply: str) -> None:
+        now = time.time()
+        size = _text_bytes(message, reply) + _EXCHANGE_OVERHEAD
+        with self._lock:
+            entry = self._conversations.get(conv_id)
+            if entry is None or self._expired(entry[2], now):
+                if entry is not None:
+                    self._drop_conversation(conv_id)
+                entry = [collections.deque(maxlen=self.history_turns), _ENTRY_OVERHEAD, now]
+                self._conversations[conv_id] = entry
+                self._bytes += _ENTRY_OVERHEAD
+            ring: Deque[Exchange] = entry[0]
+            if len(ring) == ring.maxlen:
+                dropped = _text_bytes(*ring[0]) + _EXCHANGE_OVERHEAD
+                entry[1] -= dropped
+                self._bytes -= dropped
+            ring.append((message, reply))
+            entry[1] += size
+            entry[2] = now
+            self._bytes += size
+            self._conversations.move_to_end(conv_id)
+            while len(self._conversations) > 1 and (
+                len(self._conversations) > self.max_conversations or self._bytes > self.max_bytes
+            ):
+                self._drop_conversation(next(iter(self._conversations)))
+                self.evictions += 1
+
+    def _drop_conversation(self, conv_id: str) -> None:
+        entry = self._conversations.pop(conv_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def species(self, user_id: Optional[str]) -> Optional[str]:
+        if not user_id:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if self._expired(entry[1], now):
+                self._drop_user(user_id)
+                self.expirations += 1
+                return None
+            self._users[user_id] = (entry[0], now)
+            self._users.move_to_end(user_id)
+            return entry[0]
+
+    def set_species(self, user_id: str, species_name: str) -> None:
+        with self._lock:
+            self._drop_user(user_id)
+            self._users[user_id] = (species_name, time.time())
+            self._user_bytes += _text_bytes(user_id, species_name) + _ENTRY_OVERHEAD
+            while len(self._users) > self.max_users:
+                self._drop_user(next(iter(self._users)))
+                self.evictions += 1
+
+    def _drop_user(self, user_id: str) -> None:
+        entry = self._users.pop(user_id, None)
+        if entry is not None:
+            self._user_bytes -= _text_bytes(user_id, entry[0]) + _ENTRY_OVERHEAD
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "conversations": len(self._conversations),
+                "users": len(self._users),
+                "bytes": self._bytes + self._user_bytes,
+                "max_bytes": self.max_bytes,
+                "max_conversations": self.max_conversations,
+                "max_users": self.max_users,
+                "history_turns": self.history_turns,
+                "ttl_s": self.ttl,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Store in a SQLite file shared by all worker processes.
+
+    Each process keeps its own connection; WAL mode lets readers proceed
+    while another process writes. Expired and surplus entries are pruned
+    every ``prune_every`` writes rather than on each request. The async
+    methods queue their queries on a single store thread.
+    """
+
+    def __init__(self, path: str, *args, prune_every: int = 256, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.prune_every = max(1, prune_every)
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions")
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS exchanges ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, conv_id TEXT NOT NULL, message TEXT NOT NULL, reply TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS exchanges_conv ON exchanges (conv_id, id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS conversations (conv_id TEXT PRIMARY KEY, used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS conversations_used ON conversations (used)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS species (user_id TEXT PRIMARY KEY, name TEXT NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS species_used ON species (used)")
+        with self._lock:
+            self._prune()
+        logger.info("Opened session store at %s", path)
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _live(self, used: Optional[float], now: float) -> bool:
+        return used is not None and (self.ttl is None or now - used <= self.ttl)
+
+    def history(self, conv_id: str) -> List[Exchange]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT used FROM conversations WHERE conv_id = ?", (conv_id,)).fetchone()
+            if not self._live(row[0] if row else None, now):
+                return []
+            self._db.execute("UPDATE conversations SET used = ? WHERE conv_id = ?", (now, conv_id))
+            rows = self._db.execute(
+                "SELECT message, reply FROM exchanges WHERE conv_id = ? ORDER BY id DESC LIMIT ?",
+                (conv_id, self.history_turns),
+            ).fetchall()
+        return [(message, reply) for message, reply in reversed(rows)]
+
+    def append(self, conv_id: str, message: str, reply: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT used FROM conversations WHERE conv_id = ?", (conv_id,)).fetchone()
+                if row is not None and not self._live(row[0], now):
+                    self._db.execute("DELETE FROM exchanges WHERE conv_id = ?", (conv_id,))
+                    self.expirations += 1
+                self._db.execute(
+                    "INSERT INTO conversations (conv_id, used) VALUES (?, ?) "
+                    "ON CONFLICT(conv_id) DO UPDATE SET used = excluded.used",
+                    (conv_id, now),
+                )
+                self._db.execute(
+                    "INSERT INTO exchanges (conv_id, message, reply) VALUES (?, ?, ?)", (conv_id, message, reply)
+                )
+                # Keep the ring: only the newest history_turns exchanges per conversation.
+                self._db.execute(
+                    "DELETE FROM exchanges WHERE conv_id = ? AND id NOT IN "
+                    "(SELECT id FROM exchanges WHERE conv_id = ? ORDER BY id DESC LIMIT ?)",
+                    (conv_id, conv_id, self.history_turns),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._after_write()
+
+    def species(self, user_id: Optional[str]) -> Optional[str]:
+        if not user_id:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT name, used FROM species WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None or not self._live(row[1], now):
+                return None
+            self._db.execute("UPDATE species SET used = ? WHERE user_id = ?", (now, user_id))
+            return row[0]
+
+    def set_species(self, user_id: str, species_name: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO species (user_id, name, used) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET name = excluded.name, used = excluded.used",
+                (user_id, species_name, time.time()),
+            )
+            self._after_write()
+
+    def _after_write(self) -> None:
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self._prune()
+
+    def _prune(self) -> None:
+        """Drop expired entries and the least recently used beyond the entry limits."""
+        try:
+            if self.ttl is not None:
+                cutoff = time.time() - self.ttl
+                expired = self._db.execute("DELETE FROM conversations WHERE used < ?", (cutoff,)).rowcount
+                expired += self._db.execute("DELETE FROM species WHERE used < ?", (cutoff,)).rowcount
+                self.expirations += max(0, expired)
+            evicted = self._db.execute(
+                "DELETE FROM conversations WHERE conv_id IN "
+                "(SELECT conv_id FROM conversations ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_conversations,),
+            ).rowcount
+            evicted += self._db.execute(
+                "DELETE FROM species WHERE user_id IN (SELECT user_id FROM species ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_users,),
+            ).rowcount
+            self.evictions += max(0, evicted)
+            self._db.execute("DELETE FROM exchanges WHERE conv_id NOT IN (SELECT conv_id FROM conversations)")
+        except sqlite3.OperationalError as e:
+            # Another process holds the write lock; its own prune or our next one will catch up.
+            logger.warning(f"Session store prune skipped: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            conversations = self._db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            users = self._db.execute("SELECT COUNT(*) FROM species").fetchone()[0]
+            exchanges = self._db.execute("SELECT COUNT(*) FROM exchanges").fetchone()[0]
+            pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "conversations": conversations,
+            "users": users,
+            "exchanges": exchanges,
+            "bytes": pages * page_size,
+            "max_conversations": self.max_conversations,
+            "max_users": self.max_users,
+            "history_turns": self.history_turns,
+            "ttl_s": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,171 @@
+"""Question-relevant excerpts of a species' treatment record.
+
+Chat prompts used to carry every treatment field for the species whatever
+was asked. SnippetIndex splits each text field of each treatment record
+into sentence-sized snippets once, when the data is loaded, and scores
+them against a question with BM25 (plus the field's own name, so "which
+antivenom?" finds the antivenom column). ``select`` returns the best
+snippets that fit a token budget, grouped back by field in workbook order.
+Questions that match nothing get the first-aid field, the one part of the
+record that is always relevant.
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+NAME_FIELD = "scientific_name"
+
+# Column -> label used in prompts; other columns are humanized.
+FIELD_LABELS = {
+    "immediate_first_aid_core": "First Aid",
+    "initial_hospital_actions": "Medical Care",
+    "antivenom_name_or_type": "Antivenom",
+    "symptoms": "Symptoms",
+}
+DEFAULT_FIELDS = ("immediate_first_aid_core",)
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE = re.compile(r"(?<=[.;!?])\s+|\n+")
+_STOPWORDS = frozenset(
+    "a about after an and are as at be been bite bitten by can could do does for from get got had has have how i if "
+    "in is it its me my of on or our should snake so that the their them then there these this to was we what when "
+    "which who why will with would you your".split()
+)
+# Question words -> vocabulary used in the treatment workbook.
+_EXPANSIONS = {
+    "treat": ("first", "aid", "hospital"),
+    "treatment": ("first", "aid", "hospital"),
+    "help": ("first", "aid"),
+    "antidote": ("antivenom",),
+    "asv": ("antivenom",),
+    "serum": ("antivenom",),
+    "sign": ("symptom",),
+    "feel": ("symptom",),
+    "happen": ("symptom",),
+    "doctor": ("hospital", "medical"),
+    "er": ("hospital",),
+}
+
+
+def terms(text: str) -> List[str]:
+    """Lowercase word stems without stopwords ("symptoms" -> "symptom")."""
+    words = []
+    for word in _WORD.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def field_label(field: str) -> str:
+    return FIELD_LABELS.get(field) or field.replace("_", " ").strip().capitalize()
+
+
+@dataclass(frozen=True)
+class Snippet:
+    field: str
+    position: int  # order within the field
+    text: str
+    tf: Tuple[Tuple[str, int], ...]
+    length: int
+
+
+class SnippetIndex:
+    """Per-record, per-field snippets scored with BM25.
+
+    Args:
+        records: treatment records (dicts) as held by TreatmentIndex.
+        fields: text fields to index; default every field except the name.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, records: Sequence[dict], fields: Optional[Sequence[str]] = None):
+        self.fields: Tuple[str, ...] = tuple(
+            fields
+            if fields is not None
+            else dict.fromkeys(k for record in records for k in record if k != NAME_FIELD)
+        )
+        self._snippets: Dict[int, Tuple[Snippet, ...]] = {}
+        document_frequency: Counter = Counter()
+        total_length = count = 0
+        for record in records:
+            snippets = []
+            for field in self.fields:
+                value = record.get(field)
+                if not isinstance(value, str) or not value.strip():
+                    continue
+                # The column name counts as part of every snippet, so field names match questions.
+                name_terms = terms(field.replace("_", " "))
+                for position, sentence in enumerate(s for s in _SENTENCE.split(value.strip()) if s.strip()):
+                    tf = Counter(terms(sentence) + name_terms)
+                    snippet = Snippet(field, position, sentence.strip(), tuple(tf.items()), sum(tf.values()))
+                    snippets.append(snippet)
+                    document_frequency.update(tf.keys())
+                    total_length += snippet.length
+                    count += 1
+            self._snippets[id(record)] = tuple(snippets)
+        self._average_length = total_length / count if count else 1.0
+        self._idf = {
+            term: math.log(1 + (count - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()
+        }
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self._snippets.values())
+
+    def snippets(self, record: Optional[dict]) -> Tuple[Snippet, ...]:
+        return self._snippets.get(id(record), ()) if record is not None else ()
+
+    def query_terms(self, question: str) -> Counter:
+        words = terms(question)
+        expanded = list(words)
+        for word in words:
+            expanded.extend(_EXPANSIONS.get(word, ()))
+        return Counter(expanded)
+
+    def score(self, snippet: Snippet, query: Counter) -> float:
+        norm = self.k1 * (1 - self.b + self.b * snippet.length / self._average_length)
+        total = 0.0
+        for term, tf in snippet.tf:
+            if term in query:
+                total += self._idf.get(term, 0.0) * tf * (self.k1 + 1) / (tf + norm)
+        return total
+
+    def select(
+        self,
+        record: Optional[dict],
+        question: str,
+        budget: int,
+        count_tokens: Callable[[str], int],
+    ) -> List[Tuple[str, str]]:
+        """(label, text) pairs for the most relevant snippets within budget tokens, in field order."""
+        snippets = self.snippets(record)
+        if not snippets:
+            return []
+        query = self.query_terms(question)
+        scored = sorted(
+            ((self.score(s, query), i, s) for i, s in enumerate(snippets)), key=lambda item: (-item[0], item[1])
+        )
+        chosen = [s for score, _, s in scored if score > 0]
+        if not chosen:
+            chosen = [s for s in snippets if s.field in DEFAULT_FIELDS] or list(snippets[:1])
+
+        kept: List[Snippet] = []
+        used = 0
+        for snippet in chosen:
+            cost = count_tokens(snippet.text) + 4  # "- Label: " and the newline
+            if used + cost > budget:
+                continue
+            kept.append(snippet)
+            used += cost
+
+        by_field: Dict[str, List[Snippet]] = {}
+        for snippet in sorted(kept, key=lambda s: (self.fields.index(s.field), s.position)):
+            by_field.setdefault(snippet.field, []).append(snippet)
+        return [(field_label(field), " ".join(s.text for s in group)) for field, group in by_field.items()]
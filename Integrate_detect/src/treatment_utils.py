@@ -1,8 +1,19 @@
-def get_treatment(snake_name: str, treatment_df, chat_history, llm) -> str:
-    row = treatment_df[treatment_df["scientific_name"].str.lower() == snake_name.lower()]
-    if not row.empty:
-        info = row.iloc[0].to_dict()
+from src.prompt_budget import Tokenizer
 
+TREATMENT_QUESTION = "first aid steps, hospital treatment and antivenom"
+
+
+def get_treatment(snake_name: str, treatment_index, chat_history, llm, cache=None, budget: int = 256) -> str:
+    """Ask the LLM for first-aid steps using the species' row from a TreatmentIndex.
+
+    Only the parts of the row about first aid, hospital care and antivenom
+    are put in the prompt, within budget tokens.
+
+    If cache (a src.cache.ResponseCache) is given, the answer for the same
+    species row and conversation is reused instead of generating it again.
+    """
+    info = treatment_index.get(snake_name)
+    if info is not None:
         # Prepare prompt with full chat history
         history_str = ""
         for sender, msg in chat_history:
@@ -11,14 +22,23 @@ def get_treatment(snake_name: str, treatment_df, chat_history, llm) -> str:
             else:
                 history_str += f"Assistant: {msg}\n"
 
+        excerpts = treatment_index.snippets.select(info, TREATMENT_QUESTION, budget, Tokenizer(llm).count_uncached)
+        data = "; ".join(f"{label}: {text}" for label, text in excerpts)
         prompt = (
             history_str +
-            f"You are a medical expert. Based on this data: {info}, "
+            f"You are a medical expert. Based on this data: {data}, "
             f"what should a person do immediately if bitten by a {snake_name}? "
             f"Give step-by-step first aid and antivenom details if available."
         )
 
+        key = cache.key("treatment", snake_name, data, [], {"max_tokens": 512, "history": history_str}) if cache else None
+        cached = cache.get(key) if key else None
+        if cached is not None:
+            return cached
         output = llm(prompt, max_tokens=512)
-        return output["choices"][0]["text"].strip()
+        answer = output["choices"][0]["text"].strip()
+        if key and answer:
+            cache.set(key, answer)
+        return answer
     else:
         return f"No treatment info found for {snake_name}."
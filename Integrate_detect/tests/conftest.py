@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import the app's modules the way app.py does ("from src.x import ...").
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
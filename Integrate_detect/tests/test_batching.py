@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from src.batching import MicroBatcher
+
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+def test_concurrent_submits_share_one_batch():
+    calls = []
+
+    def predict(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(4)))
+        finally:
+            await batcher.stop()
+
+    assert _run(main()) == [0, 2, 4, 6]
+    assert calls == [[0, 1, 2, 3]]
+
+
+def test_failing_item_does_not_fail_the_rest():
+    def predict(items):
+        if "bad" in items:
+            raise ValueError("bad input")
+        return [item.upper() for item in items]
+
+    async def main():
+        batcher = MicroBatcher(predict, max_batch_size=3, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in ("a", "bad", "c")), return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    a, bad, c = _run(main())
+    assert (a, c) == ("A", "C")
+    assert isinstance(bad, ValueError)
+
+
+def test_short_result_list_fails_callers_instead_of_hanging():
+    async def main():
+        batcher = MicroBatcher(lambda items: list(items)[:-1], max_batch_size=3, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    results = _run(main())
+    assert len(results) == 3
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_single_short_result_raises():
+    async def main():
+        batcher = MicroBatcher(lambda items: [], max_batch_size=1)
+        try:
+            await batcher.submit(1)
+        finally:
+            await batcher.stop()
+
+    with pytest.raises(RuntimeError):
+        _run(main())
+
+
+def test_stop_with_drain_serves_queued_requests():
+    def predict(items):
+        return [item + 1 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(predict, max_batch_size=2, max_wait_ms=20)
+        pending = [asyncio.ensure_future(batcher.submit(i)) for i in range(5)]
+        await asyncio.sleep(0)
+        await batcher.stop(drain=True)
+        return await asyncio.gather(*pending)
+
+    assert _run(main()) == [1, 2, 3, 4, 5]
+
+
+def test_stop_without_drain_fails_waiting_callers():
+    def predict(items):
+        return items
+
+    async def main():
+        batcher = MicroBatcher(predict, max_batch_size=8, max_wait_ms=1000)
+        pending = [asyncio.ensure_future(batcher.submit(i)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        return await asyncio.gather(*pending, return_exceptions=True)
+
+    results = _run(main())
+    assert all(isinstance(r, RuntimeError) and "stopped" in str(r) for r in results)
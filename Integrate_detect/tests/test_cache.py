@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+from src.cache import LRUTTLCache, PredictionCache, ResponseCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUTTLCache(max_entries=2, ttl=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_bound_and_ttl():
+    cache = LRUTTLCache(max_entries=100, max_bytes=20, ttl=0.05)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.get("a") is None  # over 20 bytes of JSON
+    assert cache.get("b") == "y" * 10
+    time.sleep(0.06)
+    assert cache.get("b") is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = LRUTTLCache(max_entries=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = LRUTTLCache(max_entries=10, disk_path=path)
+    first.set("k", {"label": "cobra"})
+    first.flush()
+    second = LRUTTLCache(max_entries=10, disk_path=path)
+    assert second.get("k") == {"label": "cobra"}
+    assert second.stats()["disk_hits"] == 1
+
+
+def test_async_disk_reads_run_off_the_loop_without_the_lock(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    writer = LRUTTLCache(max_entries=10, disk_path=path)
+    writer.set("k", [1, 2])
+    writer.flush()
+    cache = LRUTTLCache(max_entries=10, disk_path=path)
+    seen = []
+    execute = cache._db.execute
+
+    class Spy:
+        def execute(self, *args):
+            seen.append((threading.current_thread().name, cache._lock.locked()))
+            return execute(*args)
+
+    cache._db = Spy()
+
+    async def lookups():
+        return await cache.get_async("k"), await cache.get_async("k"), await cache.get_async("missing")
+
+    assert asyncio.run(lookups()) == ([1, 2], [1, 2], None)
+    assert len(seen) == 2  # the second lookup was served from memory
+    assert all(name.startswith("cache-disk-read") and not locked for name, locked in seen)
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (2, 1, 1)
+
+
+def test_disk_tier_is_pruned_periodically(tmp_path):
+    cache = LRUTTLCache(max_entries=1000, disk_path=str(tmp_path / "c.sqlite"), disk_max_entries=10, disk_prune_every=5)
+    for i in range(40):
+        cache.set(f"k{i}", i)
+    cache.flush()
+    assert cache.stats()["disk_entries"] <= 10 + 5
+
+
+def test_prediction_cache_is_scoped_by_model_tag(tmp_path):
+    path = str(tmp_path / "predictions.sqlite")
+    cache = PredictionCache(max_entries=10, disk_path=path)
+    cache.set_model_tag("species", "model.pkl:100:1")
+    cache.store("species", "digest", {"pred_class": 3})
+    assert cache.lookup("species", "digest") == {"pred_class": 3}
+    cache.flush()
+
+    updated = PredictionCache(max_entries=10, disk_path=path)
+    updated.set_model_tag("species", "model.pkl:200:2")
+    assert updated.lookup("species", "digest") is None
+    updated.set_model_tag("species", "model.pkl:100:1")
+    assert updated.lookup("species", "digest") == {"pred_class": 3}
+
+
+def test_phash_near_match_respects_model_tag():
+    cache = PredictionCache(max_entries=10, phash_distance=2)
+    cache.set_model_tag("bite", "old")
+    cache.store("bite", "d1", {"label": "bite"}, phash=0b1011)
+    assert cache.lookup("bite", "other", phash=0b1010) == {"label": "bite"}
+    assert asyncio.run(cache.lookup_async("bite", "other", phash=0b1010)) == {"label": "bite"}
+    assert cache.stats()["near_duplicate_hits"] == 2
+    cache.set_model_tag("bite", "new")
+    assert cache.lookup("bite", "other", phash=0b1010) is None
+
+
+def test_response_cache_key_normalizes_message():
+    cache = ResponseCache(max_entries=10, model_tag="m")
+    assert cache.key("chat", "What should I do?!", "ctx") == cache.key("chat", "what should i do", "ctx")
+    assert cache.key("chat", "what should i do", "ctx") != cache.key("chat", "what should i do", "other ctx")
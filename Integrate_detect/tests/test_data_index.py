@@ -0,0 +1,58 @@
+import orjson
+import pandas as pd
+
+from src.data_index import SpeciesIndex, TreatmentIndex, records_from_frame
+
+
+def _species_frame():
+    return pd.DataFrame(
+        {
+            "class_id": [0, 1],
+            "binomial_name": ["Naja naja", "Python molurus"],
+            "poisonous": [1, 0],
+            "snake_sub_family": ["Elapinae", None],
+            "country": ["India", "India"],
+            "continent": ["Asia", "Asia"],
+        }
+    )
+
+
+def test_missing_values_of_every_kind_become_none():
+    df = pd.DataFrame(
+        {
+            "name": ["a", "b", "c", "d"],
+            "float": [1.5, float("nan"), 2.0, 3.0],
+            "when": pd.to_datetime(["2024-01-01", None, "2024-01-03", "2024-01-04"]),
+            "nullable": pd.array([1, None, 3, pd.NA], dtype="Int64"),
+            "text": ["x", None, "z", "w"],
+        }
+    )
+    records = records_from_frame(df)
+    assert records[1] == {"name": "b", "float": None, "when": None, "nullable": None, "text": None}
+    assert records[3]["nullable"] is None
+
+
+def test_species_index_lookups_and_aliases():
+    index = SpeciesIndex(_species_frame())
+    cobra = index.by_class(0)
+    assert cobra["binomial_name"] == "Naja naja"
+    assert cobra["venomous"] == 1 and cobra["subfamily"] == "Elapinae"
+    assert index.get("naja NAJA") is cobra
+    assert index.by_class("7") is None
+    assert index.by_class(1)["subfamily"] is None
+    assert orjson.loads(orjson.dumps({"m": index.fragment(cobra)}))["m"]["binomial_name"] == "Naja naja"
+
+
+def test_treatment_index_cleans_and_prerenders_workbook_values():
+    df = pd.DataFrame(
+        {
+            "scientific_name": ["Naja naja"],
+            "immediate_first_aid_core": ["Keep still."],
+            "antivenom_name_or_type": [None],
+            "reviewed": [pd.NaT],
+        }
+    )
+    index = TreatmentIndex(df)
+    record = index.get("naja naja")
+    assert record["antivenom_name_or_type"] is None and record["reviewed"] is None
+    assert orjson.loads(orjson.dumps(index.fragment(record)))["reviewed"] is None
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from src import data_snapshot  # noqa: E402
+from src.data_snapshot import load_with_snapshot  # noqa: E402
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "species.csv"
+    path.write_text("binomial_name,poisonous\nNaja naja,1\n")
+    return path
+
+
+@pytest.fixture
+def parse():
+    calls = []
+
+    def parse(path):
+        calls.append(path)
+        return pd.read_csv(path)
+
+    parse.calls = calls
+    return parse
+
+
+def load(source, parse, tmp_path):
+    return load_with_snapshot(source, parse, directory=tmp_path / "snapshots")
+
+
+def test_second_load_comes_from_the_snapshot(source, parse, tmp_path):
+    first = load(source, parse, tmp_path)
+    second = load(source, parse, tmp_path)
+    assert len(parse.calls) == 1
+    assert second.to_dict("records") == first.to_dict("records") == [{"binomial_name": "Naja naja", "poisonous": 1}]
+
+
+def test_edited_source_is_reparsed(source, parse, tmp_path):
+    load(source, parse, tmp_path)
+    source.write_text("binomial_name,poisonous\nDaboia russelii,1\nPython molurus,0\n")
+    assert len(load(source, parse, tmp_path)) == 2
+    assert len(parse.calls) == 2
+    load(source, parse, tmp_path)
+    assert len(parse.calls) == 2
+
+
+def test_touched_source_refreshes_the_stamp(source, parse, tmp_path, monkeypatch):
+    load(source, parse, tmp_path)
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    load(source, parse, tmp_path)
+    assert len(parse.calls) == 1  # same content: snapshot still used
+
+    hashed = []
+    sha256 = data_snapshot._file_sha256
+    monkeypatch.setattr(data_snapshot, "_file_sha256", lambda path: hashed.append(path) or sha256(path))
+    load(source, parse, tmp_path)
+    assert hashed == [] and len(parse.calls) == 1
+
+
+def test_edit_during_parse_leaves_the_snapshot_stale(source, parse, tmp_path):
+    def parse_while_edited(path):
+        df = parse(path)
+        source.write_text("binomial_name,poisonous\nBungarus caeruleus,1\n")
+        return df
+
+    load_with_snapshot(source, parse_while_edited, directory=tmp_path / "snapshots")
+    df = load(source, parse, tmp_path)
+    assert df["binomial_name"].tolist() == ["Bungarus caeruleus"]
+    assert len(parse.calls) == 2
@@ -0,0 +1,63 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from src.image_utils import UploadTooLarge, expand_upload
+
+
+def make_zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def make_tar(members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("make", [make_zip, make_tar])
+def test_archives_expand_to_their_images_in_order(make):
+    archive = make([("b.jpg", b"B"), ("notes.txt", b"x"), ("dir/.hidden.png", b"h"), ("a.PNG", b"A")])
+    assert expand_upload("upload", archive) == [("b.jpg", b"B"), ("a.PNG", b"A")]
+
+
+def test_plain_file_is_one_image():
+    assert expand_upload("a.jpg", b"\xff\xd8 not an archive") == [("a.jpg", b"\xff\xd8 not an archive")]
+    with pytest.raises(UploadTooLarge):
+        expand_upload("a.jpg", b"x" * 10, max_images=0)
+
+
+@pytest.mark.parametrize("make", [make_zip, make_tar])
+def test_member_count_limit(make):
+    archive = make([(f"{i}.jpg", b"x") for i in range(10)])
+    assert len(expand_upload("u", archive, max_images=10)) == 10
+    with pytest.raises(UploadTooLarge, match="Too many images"):
+        expand_upload("u", archive, max_images=9)
+
+
+@pytest.mark.parametrize("make", [make_zip, make_tar])
+def test_member_and_total_size_limits(make):
+    archive = make([(f"{i}.jpg", b"\0" * 1000) for i in range(4)])
+    with pytest.raises(UploadTooLarge, match="999 byte limit"):
+        expand_upload("u", archive, max_member_bytes=999)
+    assert len(expand_upload("u", archive, max_total_bytes=4000)) == 4
+    with pytest.raises(UploadTooLarge, match="once extracted"):
+        expand_upload("u", archive, max_total_bytes=3999)
+
+
+def test_zip_bomb_stops_before_decompressing_everything():
+    # 200 x 1 MB of zeros compresses to a few hundred KB; only max_images members may be read.
+    archive = make_zip([(f"{i}.jpg", b"\0" * (1 << 20)) for i in range(200)])
+    assert len(archive) < 1 << 20
+    with pytest.raises(UploadTooLarge):
+        expand_upload("bomb.zip", archive, max_images=64, max_total_bytes=32 << 20)
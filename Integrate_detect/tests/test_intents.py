@@ -0,0 +1,79 @@
+import pytest
+
+from src.intents import GENERAL_FIRST_AID, GENERAL_SYMPTOMS, SEEK_CARE, IntentRouter, answer_intent
+
+SPECIES = {"binomial_name": "Naja naja", "common_name": "Indian cobra", "country": "India", "continent": "Asia", "poisonous": 1}
+TREATMENT = {
+    "scientific_name": "Naja naja",
+    "immediate_first_aid_core": "Immobilize the limb.",
+    "initial_hospital_actions": None,
+    "antivenom_name_or_type": "Polyvalent ASV",
+    "symptoms": "Ptosis, breathing difficulty.",
+}
+
+
+@pytest.mark.parametrize(
+    "message, intent",
+    [
+        ("What should I do?", "first_aid"),
+        ("first aid please", "first_aid"),
+        ("Is it venomous?", "venomous"),
+        ("what are the symptoms", "symptoms"),
+        ("Where is it found?", "habitat"),
+        ("which antivenom works", "antivenom"),
+        ("I was bitten, which antivenom?", "antivenom"),
+        ("I was bitten, what should I do?", "first_aid"),
+    ],
+)
+def test_closed_questions_take_the_fast_path(message, intent):
+    match = IntentRouter().route(message, has_species=True)
+    assert (match.intent, match.confidence, match.open_ended) == (intent, 0.95, False)
+
+
+def test_questions_left_to_the_llm():
+    router = IntentRouter()
+    assert router.route("tell me a joke", True).intent is None
+    several = router.route("is it venomous and where is it found", True)
+    assert several.intent is None and several.confidence < 0.5
+    why = router.route("why is it venomous", True)
+    assert why.intent == "venomous" and why.open_ended and why.confidence < 0.5
+    long = router.route("what are the symptoms " + "really " * 20, True)
+    assert long.intent == "symptoms" and long.confidence == 0.5
+    assert router.route("is it venomous", has_species=False).confidence == 0.4
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "I was bitten, my leg is swelling and I feel dizzy",
+        "bitten 2 hours ago, what should I do?",
+        "my child was bitten and is vomiting, which antivenom?",
+        "is it venomous? my hand is numb",
+    ],
+)
+def test_messages_describing_the_patient_go_to_the_llm(message):
+    match = IntentRouter().route(message, has_species=True)
+    assert match.confidence < 0.8
+
+
+def test_bite_reports_alone_do_not_trigger_first_aid():
+    router = IntentRouter()
+    assert router.route("I was bitten", True).intent is None
+    assert router.route("emergency!", True).intent is None
+
+
+def test_answers_from_records():
+    first_aid = answer_intent("first_aid", "Naja naja", SPECIES, TREATMENT)
+    assert "Immobilize the limb." in first_aid and "Polyvalent ASV" in first_aid
+    assert "Medical Care" not in first_aid and first_aid.endswith(SEEK_CARE)
+    assert "Venomous: Yes" in answer_intent("venomous", None, SPECIES, None)
+    assert answer_intent("habitat", None, SPECIES, None) == "🌍 Naja naja (Indian cobra) is found in India (Asia)."
+    assert "Ptosis" in answer_intent("symptoms", "Naja naja", SPECIES, TREATMENT)
+
+
+def test_missing_records_fall_back_or_defer():
+    assert answer_intent("first_aid", None, None, None) == GENERAL_FIRST_AID
+    assert answer_intent("symptoms", None, None, None) == GENERAL_SYMPTOMS
+    assert answer_intent("venomous", "Naja naja", None, None) is None
+    assert answer_intent("antivenom", None, SPECIES, {}) is None
+    assert answer_intent("habitat", None, {"binomial_name": "X", "country": None, "continent": None}, None) is None
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.llm_stream import TokenStream
+from src.llm_worker import LLMCancelled, LLMQueueFull, LLMQueueTimeout, LLMUnavailable, LLMWorker
+
+
+class FakeLLM:
+    """Streams `tokens` chunks, `delay` seconds apart, and records overlapping calls."""
+
+    def __init__(self, tokens=5, delay=0.01):
+        self.tokens, self.delay = tokens, delay
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, prompt, stream=False, max_tokens=16, **kwargs):
+        def chunks():
+            with self.lock:
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+            try:
+                n = min(max_tokens, self.tokens)
+                for i in range(n):
+                    time.sleep(self.delay)
+                    yield {"choices": [{"text": f" {prompt}{i}", "finish_reason": "length" if i == n - 1 else None}]}
+            finally:
+                with self.lock:
+                    self.active -= 1
+
+        return chunks()
+
+
+@pytest.fixture
+def pool():
+    with ThreadPoolExecutor(2) as executor:
+        yield executor
+
+
+def test_generations_on_one_instance_run_one_at_a_time(pool):
+    llm = FakeLLM()
+    worker = LLMWorker(pool, llm)
+
+    async def scenario():
+        return await asyncio.gather(*(worker.generate(p, max_tokens=3) for p in "abc"))
+
+    outs = asyncio.run(scenario())
+    assert [o["choices"][0]["text"] for o in outs] == [" a0 a1 a2", " b0 b1 b2", " c0 c1 c2"]
+    assert all(o["tokens"] == 3 and o["choices"][0]["finish_reason"] == "length" for o in outs)
+    assert llm.peak == 1
+    assert worker.snapshot()["completed"] == 3
+
+
+def test_pool_instances_run_side_by_side(pool):
+    first, second = FakeLLM(delay=0.05), FakeLLM(delay=0.05)
+    worker = LLMWorker(pool, [first, second])
+
+    async def scenario():
+        await asyncio.gather(worker.generate("a"), worker.generate("b"))
+
+    asyncio.run(scenario())
+    assert first.peak == second.peak == 1
+    assert worker.snapshot()["instances"] == 2
+
+
+def test_unavailable_and_full_queue(pool):
+    async def scenario():
+        with pytest.raises(LLMUnavailable):
+            LLMWorker(pool).submit("a")
+        worker = LLMWorker(pool, FakeLLM(), max_queue=1)
+        worker.check()
+        job = worker.submit("a")
+        with pytest.raises(LLMQueueFull):
+            worker.check()
+        with pytest.raises(LLMQueueFull):
+            worker.submit("b")
+        await worker.result(job)
+        return worker.snapshot()
+
+    assert asyncio.run(scenario())["rejected"] == 2
+
+
+def test_positions_cancel_and_queue_timeout(pool):
+    worker = LLMWorker(pool, FakeLLM(tokens=10, delay=0.02))
+
+    async def scenario():
+        running, queued = worker.submit("a"), worker.submit("b")
+        await asyncio.sleep(0.05)
+        assert (worker.position(running), worker.position(queued)) == (0, 1)
+        worker.cancel(queued)
+        assert queued.future.cancelled() and worker.position(queued) is None
+        late = worker.submit("c", max_queue_wait=0.05)
+        with pytest.raises(LLMQueueTimeout):
+            await worker.result(late)
+        await worker.result(running)
+        return worker.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert (snapshot["cancelled"], snapshot["expired"], snapshot["completed"]) == (1, 1, 1)
+
+
+def test_deadline_stops_generation_and_is_counted_separately(pool):
+    worker = LLMWorker(pool, FakeLLM(tokens=50, delay=0.02))
+
+    async def scenario():
+        return await worker.generate("a", deadline=0.1, max_tokens=50)
+
+    out = asyncio.run(scenario())
+    assert out["choices"][0]["finish_reason"] == "deadline"
+    assert 0 < out["tokens"] < 50
+    snapshot = worker.snapshot()
+    assert (snapshot["deadline"], snapshot["completed"]) == (1, 0)
+
+
+def test_disconnected_caller_cancels_running_job(pool):
+    llm = FakeLLM(tokens=100, delay=0.01)
+    worker = LLMWorker(pool, llm)
+    gone = []
+
+    async def disconnected():
+        return bool(gone)
+
+    async def scenario():
+        job = worker.submit("a", max_tokens=100)
+        asyncio.get_running_loop().call_later(0.05, gone.append, True)
+        with pytest.raises(LLMCancelled):
+            await worker.result(job, disconnected, poll=0.01)
+        out = await job.future
+        return out
+
+    out = asyncio.run(scenario())
+    assert out["choices"][0]["finish_reason"] == "cancelled"
+    assert out["tokens"] < 100
+    assert worker.snapshot()["cancelled"] == 1
+
+
+def test_stream_closed_before_its_first_chunk_cancels_the_job(pool):
+    worker = LLMWorker(pool, FakeLLM(tokens=100, delay=0.01))
+
+    async def events():
+        chunks = None
+        try:
+            chunks = TokenStream(worker, "a", max_tokens=100)
+            yield "meta"
+            async for text in chunks:
+                yield text
+        finally:
+            if chunks is not None:
+                await chunks.aclose()
+
+    async def scenario():
+        running = worker.submit("r", max_tokens=100)
+        stream = events()
+        assert await stream.__anext__() == "meta"
+        await stream.aclose()
+        await worker.result(running)
+        return worker.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["cancelled"] == 1 and snapshot["completed"] == 1
@@ -0,0 +1,56 @@
+import pytest
+
+from src import model_loader
+
+METADATA = {
+    "general.architecture": "llama",
+    "llama.block_count": 32,
+    "llama.embedding_length": 4096,
+    "llama.attention.head_count": 32,
+}
+
+
+class FakeLlama:
+    def __init__(self, threads, n_ctx):
+        self.threads, self._n_ctx = threads, n_ctx
+
+    def n_ctx(self):
+        return self._n_ctx
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Record load_llm calls; an unpinned load falls back to a 1024-token context."""
+    calls = []
+
+    def load_llm(env, threads, n_ctx=None):
+        calls.append((threads, n_ctx))
+        return FakeLlama(threads, n_ctx or 1024)
+
+    monkeypatch.setattr(model_loader, "load_llm", load_llm)
+    monkeypatch.setattr(model_loader, "llm_metadata", lambda env: METADATA)
+    return calls
+
+
+def test_pool_is_sized_for_the_loaded_context(loads):
+    per_4096 = model_loader.llm_context_bytes(METADATA, 4096)
+    per_1024 = model_loader.llm_context_bytes(METADATA, 1024)
+    budget = 3 * per_1024
+    assert budget // per_4096 < 3  # a 4096 estimate would have shrunk the pool
+
+    pool = model_loader.load_llm_pool(3, memory_budget=budget, llm_threads=6)
+    assert [llm.n_ctx() for llm in pool] == [1024, 1024, 1024]
+    assert loads == [(2, None), (2, 1024), (2, 1024)]
+
+
+def test_shrunk_pool_reloads_first_instance_with_its_thread_share(loads):
+    budget = 2 * model_loader.llm_context_bytes(METADATA, 1024)
+    pool = model_loader.load_llm_pool(4, memory_budget=budget, llm_threads=8)
+    assert len(pool) == 2
+    assert [llm.threads for llm in pool] == [4, 4]
+    assert loads == [(2, None), (4, 1024), (4, 1024)]
+
+
+def test_no_llm_configured(monkeypatch, loads):
+    monkeypatch.setattr(model_loader, "load_llm", lambda env, threads, n_ctx=None: None)
+    assert model_loader.load_llm_pool(2, memory_budget=1 << 40) == []
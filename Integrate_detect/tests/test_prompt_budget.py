@@ -0,0 +1,54 @@
+import logging
+
+from src.prompt_budget import PromptBuilder, Tokenizer
+
+PREFIX = "You are a snakebite assistant.\n\n"
+HISTORY = [("where is it found", "In India."), ("is it venomous", "Yes, very.")]
+
+
+def builder(n_ctx, **kwargs):
+    return PromptBuilder(n_ctx, Tokenizer(), **kwargs)
+
+
+def test_untrimmed_prompt_when_everything_fits():
+    built = builder(4096).build(PREFIX, "Species: Naja naja", HISTORY, "what now?", 256)
+    assert built.prompt == (
+        PREFIX + "Species: Naja naja\n\nRecent Conversation:\n"
+        "User: where is it found\nAssistant: In India.\n"
+        "User: is it venomous\nAssistant: Yes, very.\n"
+        "\nUser: what now?\nAssistant:"
+    )
+    assert built.max_tokens == 256
+    assert built.accounting["history_dropped"] == 0
+
+
+def test_small_window_trims_context_and_history_but_keeps_message():
+    context = "\n".join(f"Line {i}: " + "x" * 200 for i in range(20))
+    history = [(f"question {i}", "answer " * 50) for i in range(10)]
+    built = builder(1024).build(PREFIX, context, history, "what now?", 512)
+    assert built.prompt.startswith(PREFIX) and built.prompt.endswith("\nUser: what now?\nAssistant:")
+    assert built.accounting["context_lines_dropped"] > 0
+    assert built.accounting["history_dropped"] > 0
+    assert built.accounting["prompt"] + built.max_tokens <= 1024
+    assert built.max_tokens >= 256  # generation_share of the window
+
+
+def test_generation_budget_never_falls_to_zero(caplog):
+    huge_prefix = "y" * 4 * 1020  # ~1020 tokens: the system prompt alone fills the window
+    with caplog.at_level(logging.WARNING):
+        built = builder(1024).build(huge_prefix, "Species: Naja naja", HISTORY, "what now?", 512)
+    assert built.max_tokens == 1
+    assert built.accounting["max_tokens"] == 1
+    assert "no room to generate" in caplog.text
+
+
+def test_history_then_context_dropped_to_reach_minimum_generation():
+    prefix = "y" * 4 * 800
+    context = "Species: Naja naja. " * 8  # ~40 tokens
+    built = builder(1024, generation_share=0.0).build(prefix, context, HISTORY, "hi", 512)
+    assert built.accounting["history_kept"] == len(HISTORY) and built.max_tokens < 190
+
+    built = builder(1024, generation_share=0.0, min_generation=190).build(prefix, context, HISTORY, "hi", 512)
+    assert built.max_tokens >= 190
+    assert built.accounting["history_kept"] == 0 and built.accounting["history_dropped"] == len(HISTORY)
+    assert built.accounting["context"] == 0
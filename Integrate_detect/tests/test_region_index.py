@@ -0,0 +1,70 @@
+from src.region_index import RegionIndex, normalize_place
+
+RECORDS = [
+    {"binomial_name": "Python molurus", "country": "India, Sri Lanka", "continent": "Asia", "poisonous": 0},
+    {"binomial_name": "Naja naja", "country": "India, Sri Lanka", "continent": "Asia", "poisonous": 1},
+    {"binomial_name": "Bungarus caeruleus", "country": "India", "continent": "Asia", "poisonous": 1},
+    {"binomial_name": "Crotalus atrox", "country": "United States; Mexico", "continent": "North America", "poisonous": 1},
+    {"binomial_name": "Bothrops atrox", "country": "Brazil, Peru", "continent": "South America", "poisonous": 1},
+    {"binomial_name": "Trimeresurus albolabris", "country": "Thailand", "continent": "Southeast Asia", "poisonous": 1},
+    {"binomial_name": "Echis coloratus", "country": "Oman, Iran", "continent": "Middle East", "poisonous": 1},
+    {"binomial_name": "Naja nigricollis", "country": "Mali", "continent": "Africa", "poisonous": 1},
+]
+
+
+def names(records):
+    return [r["binomial_name"] for r in records]
+
+
+def test_exact_place_ranks_venomous_first_then_by_name():
+    index = RegionIndex(RECORDS)
+    assert names(index.lookup("India")) == ["Bungarus caeruleus", "Naja naja", "Python molurus"]
+    assert names(index.lookup("India", limit=2)) == ["Bungarus caeruleus", "Naja naja"]
+
+
+def test_typos_in_longer_names_and_free_text_are_tolerated():
+    index = RegionIndex(RECORDS)
+    assert index.match_place("sri lnaka") == ("sri lanka", 1)
+    assert index.match_place("thailnd") == ("thailand", 1)
+    assert names(index.lookup("rural kerala, India")) == ["Bungarus caeruleus", "Naja naja", "Python molurus"]
+    assert names(index.lookup("somewhere in Sri Lnaka")) == ["Naja naja", "Python molurus"]
+
+
+def test_short_names_must_match_exactly():
+    index = RegionIndex(RECORDS)
+    assert index.match_place("inida") is None
+    assert index.lookup("Iraq") == []  # not Iran
+    assert index.lookup("Bali") == []  # not Mali
+    assert index.lookup("the woman was bitten") == []  # not Oman
+    assert names(index.lookup("Oman")) == ["Echis coloratus"]
+
+
+def test_region_names_match_the_regions_they_end():
+    index = RegionIndex(RECORDS)
+    assert names(index.lookup("Asia")) == ["Bungarus caeruleus", "Naja naja", "Trimeresurus albolabris", "Python molurus"]
+    assert names(index.lookup("America")) == ["Bothrops atrox", "Crotalus atrox"]
+    assert names(index.lookup("Latin America")) == ["Bothrops atrox", "Crotalus atrox"]
+    # Only whole trailing words: "south" is not South America.
+    assert "Bothrops atrox" not in names(index.lookup("south India"))
+
+
+def test_aliases_and_multiword_places():
+    index = RegionIndex(RECORDS)
+    assert names(index.lookup("USA")) == ["Crotalus atrox"]
+    assert names(index.lookup("north america")) == ["Crotalus atrox"]
+    assert names(index.lookup("SE Asia")) == ["Trimeresurus albolabris"]
+    assert names(index.lookup("Ceylon")) == ["Naja naja", "Python molurus"]
+
+
+def test_several_places_merge_without_duplicates():
+    index = RegionIndex(RECORDS)
+    found = names(index.lookup("Mexico or Sri Lanka"))
+    assert sorted(found) == ["Crotalus atrox", "Naja naja", "Python molurus"]
+    assert found[-1] == "Python molurus"  # only non-venomous one
+
+
+def test_unknown_or_empty_query():
+    index = RegionIndex(RECORDS)
+    assert index.lookup("Atlantis") == []
+    assert index.lookup(None) == []
+    assert normalize_place("  Côte d'Ivoire ") == normalize_place("cote d ivoire")
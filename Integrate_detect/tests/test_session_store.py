@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+import pytest
+
+from src import session_store
+from src.session_store import MemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemorySessionStore(**kwargs)
+        return SQLiteSessionStore(str(tmp_path / "sessions.sqlite"), prune_every=1, **kwargs)
+
+    return make
+
+
+def test_history_keeps_the_last_turns(make_store):
+    store = make_store(history_turns=2)
+    for i in range(4):
+        store.append("c", f"q{i}", f"a{i}")
+    assert store.history("c") == [("q2", "a2"), ("q3", "a3")]
+    assert store.history("unknown") == []
+
+
+def test_species_per_user(make_store):
+    store = make_store()
+    assert store.species(None) is None and store.species("u") is None
+    store.set_species("u", "Naja naja")
+    store.set_species("u", "Daboia russelii")
+    assert store.species("u") == "Daboia russelii"
+
+
+def test_entries_expire_after_ttl(make_store, clock):
+    store = make_store(ttl=60)
+    store.append("c", "q", "a")
+    store.set_species("u", "Naja naja")
+    clock[0] += 30
+    assert store.history("c") == [("q", "a")]  # use refreshes the entry
+    clock[0] += 59
+    assert store.species("u") is None
+    assert store.history("c") == [("q", "a")]
+    clock[0] += 61
+    assert store.history("c") == []
+
+
+def test_least_recently_used_conversations_are_evicted(make_store, clock):
+    store = make_store(max_conversations=2)
+    for conv_id in ("a", "b"):
+        clock[0] += 1
+        store.append(conv_id, "q", "r")
+    clock[0] += 1
+    store.history("a")
+    clock[0] += 1
+    store.append("c", "q", "r")
+    assert store.history("b") == []
+    assert store.history("a") and store.history("c")
+    assert store.stats()["evictions"] >= 1
+
+
+def test_memory_store_byte_bound():
+    store = MemorySessionStore(max_bytes=2000)
+    for i in range(10):
+        store.append(f"c{i}", "x" * 300, "y" * 300)
+    stats = store.stats()
+    assert stats["bytes"] <= 2000 and stats["conversations"] < 10
+    assert store.history("c9")
+
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    first, second = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    first.append("c", "q", "a")
+    first.set_species("u", "Naja naja")
+    assert second.history("c") == [("q", "a")]
+    assert second.species("u") == "Naja naja"
+
+
+def test_sqlite_async_calls_run_off_the_event_loop(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite"))
+    threads = []
+    history = store.history
+
+    def recording_history(conv_id):
+        threads.append(threading.current_thread().name)
+        return history(conv_id)
+
+    store.history = recording_history
+
+    async def scenario():
+        await store.append_async("c", "q", "a")
+        await store.set_species_async("u", "Naja naja")
+        return await store.history_async("c"), await store.species_async("u")
+
+    assert asyncio.run(scenario()) == ([("q", "a")], "Naja naja")
+    assert threads and threads[0].startswith("sessions")
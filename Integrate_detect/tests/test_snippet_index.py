@@ -0,0 +1,59 @@
+from src.snippet_index import SnippetIndex, terms
+
+RECORDS = [
+    {
+        "scientific_name": "Naja naja",
+        "immediate_first_aid_core": "Keep the victim still. Immobilize the bitten limb with a splint.",
+        "initial_hospital_actions": "Monitor breathing closely. Intubate if ptosis progresses.",
+        "antivenom_name_or_type": "Polyvalent ASV (Indian).",
+        "symptoms": "Drooping eyelids; difficulty breathing; local swelling.",
+    },
+    {
+        "scientific_name": "Python molurus",
+        "immediate_first_aid_core": "Clean the wound with soap and water.",
+        "initial_hospital_actions": None,
+        "antivenom_name_or_type": None,
+        "symptoms": "Local pain and bleeding.",
+    },
+]
+
+
+def words(text):
+    return len(text.split())
+
+
+def test_terms_drop_stopwords_and_plurals():
+    assert terms("What are the symptoms of this bite?") == ["symptom"]
+    assert terms("Is the glass cracked") == ["glass", "cracked"]
+
+
+def test_question_selects_matching_field():
+    index = SnippetIndex(RECORDS)
+    assert index.select(RECORDS[0], "which antivenom should be given?", 100, words) == [
+        ("Antivenom", "Polyvalent ASV (Indian).")
+    ]
+    labels = [label for label, _ in index.select(RECORDS[0], "what symptoms will I notice", 100, words)]
+    assert labels[0] == "Symptoms"
+
+
+def test_synonyms_and_fallback_to_first_aid():
+    index = SnippetIndex(RECORDS)
+    assert ("Antivenom", "Polyvalent ASV (Indian).") in index.select(RECORDS[0], "is there an antidote", 100, words)
+    assert index.select(RECORDS[1], "tell me a joke", 100, words) == [("First Aid", "Clean the wound with soap and water.")]
+
+
+def test_budget_limits_snippets_and_keeps_field_order():
+    index = SnippetIndex(RECORDS)
+    everything = index.select(RECORDS[0], "first aid hospital breathing symptoms antivenom", 1000, words)
+    labels = [label for label, _ in everything]
+    assert labels == ["First Aid", "Medical Care", "Antivenom", "Symptoms"]
+    small = index.select(RECORDS[0], "first aid hospital breathing symptoms antivenom", 12, words)
+    assert small and sum(words(text) for _, text in small) <= 12
+    assert len(small) < len(everything)
+
+
+def test_unknown_record_has_no_snippets():
+    index = SnippetIndex(RECORDS)
+    assert index.select(None, "first aid", 100, words) == []
+    assert index.select({"scientific_name": "X"}, "first aid", 100, words) == []
+    assert len(index) == 10  # sentences and ';'-separated items
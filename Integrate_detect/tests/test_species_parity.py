@@ -0,0 +1,61 @@
+"""SpeciesPipeline must reproduce Learner.predict exactly.
+
+Needs the species model (SNAKE_MODEL_PATH or models/model.pkl) and
+fastai; skipped otherwise. Uses the images in SPECIES_PARITY_IMAGES when
+set, else a few generated ones. scripts/check_species_parity.py runs the
+same comparison over a folder by hand.
+"""
+
+import os
+
+import pytest
+
+from src.image_utils import IMAGE_EXTENSIONS
+from src.model_loader import SpeciesPipeline, load_learner, species_model_path
+
+ATOL = 1e-5
+
+
+@pytest.fixture(scope="module")
+def learner():
+    pytest.importorskip("fastai")
+    try:
+        path = species_model_path()
+    except FileNotFoundError:
+        pytest.skip("species model not available")
+    return load_learner(path)
+
+
+@pytest.fixture(scope="module")
+def image_paths(tmp_path_factory):
+    folder = os.getenv("SPECIES_PARITY_IMAGES")
+    if folder:
+        return sorted(
+            os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    out = tmp_path_factory.mktemp("parity")
+    paths = []
+    for i, size in enumerate([(224, 224), (640, 480), (300, 500), (1024, 768)]):
+        path = out / f"img{i}.jpg"
+        Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_lean_pipeline_matches_learner_predict(learner, image_paths):
+    import torch
+
+    pipeline = SpeciesPipeline(learner)
+    assert image_paths
+    for path in image_paths:
+        with learner.no_bar():
+            expected_class, expected_idx, expected_probs = learner.predict(path)
+        pred_class, pred_idx, probs = pipeline.predict_batch([path])[0]
+        assert int(pred_idx) == int(expected_idx), path
+        assert pred_class == int(expected_class), path
+        diff = (torch.as_tensor(probs).cpu() - torch.as_tensor(expected_probs).cpu()).abs().max().item()
+        assert diff <= ATOL, f"{path}: max|dp|={diff:.2e}"
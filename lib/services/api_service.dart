@@ -103,6 +103,36 @@ class ApiService {
     }
   }
 
+  /// Identify species and classify the bite from one image in a single
+  /// request. Returns `species`, `bite` and `treatment_info` sections.
+  Future<Map<String, dynamic>> analyzeImage(
+    File imageFile, {
+    String? userId,
+  }) async {
+    try {
+      final formData = FormData.fromMap({
+        'file': await MultipartFile.fromFile(
+          imageFile.path,
+          filename: imageFile.path.split('/').last,
+        ),
+      });
+
+      final response = await _dio.post(
+        '/analyze',
+        data: formData,
+        options: Options(
+          headers: {
+            if (userId != null) 'user_id': userId,
+          },
+        ),
+      );
+
+      return response.data as Map<String, dynamic>;
+    } on DioException catch (e) {
+      throw _handleError(e);
+    }
+  }
+
   /// Chat with AI assistant
   Future<Map<String, dynamic>> chat({
     required String message,